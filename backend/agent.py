@@ -8,6 +8,8 @@ from pathlib import Path
 logger = logging.getLogger(__name__)
 
 from config import GENAI_KEY, GENAI_MODEL
+from utils import gemini_breaker
+from rate_limiter import gemini_limiter
 
 class Agent:
     def __init__(self):
@@ -24,6 +26,14 @@ class Agent:
             logger.error(f"Failed to load model: {e}")
             self.client = None
 
+    async def _generate(self, **kwargs):
+        """
+        Calls Gemini through the shared circuit breaker so an outage fails fast,
+        and under the process-wide concurrency cap.
+        """
+        async with gemini_limiter:
+            return await gemini_breaker.call(self.client.aio.models.generate_content, **kwargs)
+
     async def analyze_message(self, message_text: str, sender_info: str, user_name: str, memory_text: str = "") -> dict:
         """
         Analyzes a message to determine importance and generate a summary.
@@ -58,7 +68,7 @@ class Agent:
         
         for attempt in range(max_retries):
             try:
-                response = await self.client.aio.models.generate_content(
+                response = await self._generate(
                     model=self.model_name,
                     contents=prompt,
                     config=types.GenerateContentConfig(response_mime_type="application/json")
@@ -76,7 +86,7 @@ class Agent:
                 return data
             except Exception as e:
                 # Handle Quota / Rate Limit (429)
-                if "429" in str(e) and attempt < max_retries - 1:
+                if "429" in str(e) and attempt < max_retries - 1 and gemini_breaker.state != gemini_breaker.OPEN:
                     wait_time = backoff ** (attempt + 1)
                     logger.warning(f"Rate limited (429). Retrying in {wait_time}s... (Attempt {attempt + 1}/{max_retries})")
                     await asyncio.sleep(wait_time)
@@ -108,7 +118,7 @@ class Agent:
         """
         
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt
             )
@@ -116,10 +126,46 @@ class Agent:
         except Exception as e:
             logger.error(f"Error generating summary: {e}")
             return "Failed to generate summary."
+
+    async def summarize_chats(self, chats_text: str) -> dict:
+        """
+        Condenses recent discussion points of one or more chats ("### [n] Chat" sections)
+        into short per-chat partial summaries, later reduced into the daily digest.
+        Returns {"n": summary} keyed by section number, or None if the call failed.
+        """
+        if not chats_text: return {}
+
+        prompt = f"""
+        Summarize these recent group chat messages, separately for each chat.
+        - 2-5 short bullet points per chat covering key topics, decisions and open questions.
+        - Mention who said what only when it matters.
+        - Ignore trivial chatter.
+
+        Messages, grouped by chat:
+        {chats_text}
+
+        Output JSON ONLY, keyed by the section number shown in brackets:
+        {{
+            "summaries": {{"1": "- bullet\\n- bullet"}}
+        }}
+        """
+
+        try:
+            response = await self._generate(
+                model=self.model_name,
+                contents=prompt,
+                config=types.GenerateContentConfig(response_mime_type="application/json")
+            )
+            data = json.loads(response.text)
+            return data.get("summaries", {})
+        except Exception as e:
+            logger.error(f"Error summarizing chats: {e}")
+            return None
+
     async def analyze_context_batch(self, history_text: str, user_name: str) -> list:
         """
         Analyzes a batch of chat history to extract persistent user facts.
-        Returns a list of strings (facts).
+        Returns a list of strings (facts), or None if the call failed.
         """
         if not history_text: return []
         
@@ -147,7 +193,7 @@ class Agent:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json")
@@ -156,11 +202,12 @@ class Agent:
             return data.get("facts", [])
         except Exception as e:
             logger.error(f"Error analyzing context batch: {e}")
-            return []
+            return None
 
     async def analyze_feedback_batch(self, feedback_text: str) -> list:
         """
         Analyzes a batch of rejected tasks and comments to extract permanent rules.
+        Returns None if the call failed.
         """
         if not feedback_text: return []
         
@@ -186,7 +233,7 @@ class Agent:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json")
@@ -195,16 +242,18 @@ class Agent:
             return data.get("rules", [])
         except Exception as e:
             logger.error(f"Error analyzing feedback batch: {e}")
-            return []
+            return None
 
     async def deduplicate_facts(self, facts: list) -> list:
         """
         Consolidates a list of facts by removing duplicates and merging related items.
+        Called with small clusters of similar facts (see MemoryManager.consolidate_memories).
+        Returns None if the call failed, so the cluster is retried later.
         """
         if not facts: return []
         
-        # Optimization: Don't call AI for small lists
-        if len(facts) < 5:
+        # Optimization: Nothing to merge
+        if len(set(facts)) < 2:
             return sorted(list(set(facts)))
         
         facts_text = json.dumps(facts, indent=2)
@@ -232,7 +281,7 @@ class Agent:
         """
 
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json")
@@ -241,7 +290,7 @@ class Agent:
             return data.get("consolidated_facts", [])
         except Exception as e:
             logger.error(f"Error deduplicating facts: {e}")
-            return facts # Fail safe: return original list
+            return None
 
     async def handle_session_turn(self, history_text: str, user_profile: str, user_name: str) -> dict:
         """
@@ -278,7 +327,7 @@ class Agent:
         
         try:
             logger.info(f"DEBUG: Calling Gemini for Session Turn. User: {user_name}, Prompt Length: {len(prompt)}")
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json")
@@ -311,7 +360,7 @@ class Agent:
         }}
         """
         try:
-            response = await self.client.aio.models.generate_content(
+            response = await self._generate(
                 model=self.model_name,
                 contents=prompt,
                 config=types.GenerateContentConfig(response_mime_type="application/json")
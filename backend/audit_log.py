@@ -0,0 +1,409 @@
+import bisect
+import gzip
+import json
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+from utils import project_fields
+from config import CONFIG_DIR, AUDIT_DIR, AUDIT_SEGMENT_BYTES, AUDIT_SEGMENT_SECONDS, AUDIT_RETENTION_ENTRIES
+
+# Record a byte offset every N entries of the hot segment
+OFFSET_STRIDE = 100
+
+# Distinct values remembered per segment facet before giving up on pruning by it
+FACET_CAP = 256
+
+# Decompressed cold segments kept in memory (they never change)
+COLD_CACHE_SEGMENTS = 4
+
+
+def _priority_of(entry):
+    try:
+        return int((entry.get("evaluation") or {}).get("priority"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _facet_values(entry):
+    """Values an entry contributes to its segment's filter index."""
+    return {
+        "sender": entry.get("sender"),
+        "priority": _priority_of(entry),
+        "task_created": bool(entry.get("task_created")),
+        "reply_action": entry.get("reply_action")
+    }
+
+
+def _local_iso(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None) # Entries are stamped in naive local time
+    return parsed
+
+
+def time_bounds(since=None, until=None):
+    """
+    Normalizes a [since, until] range (ISO dates or datetimes) into a string pair
+    comparable with entry timestamps: `since` inclusive, `until` exclusive.
+    A date-only `until` covers that whole day. Raises ValueError on bad input.
+    """
+    lower = _local_iso(since).isoformat() if since else None
+    upper = None
+    if until:
+        parsed = _local_iso(until)
+        step = timedelta(days=1) if len(until.strip()) == 10 else timedelta(microseconds=1)
+        upper = (parsed + step).isoformat()
+    return lower, upper
+
+
+class AuditJournal:
+    """
+    Append-only JSONL audit log split into segments.
+    The active segment is plain JSONL; rotated segments are gzip-compressed.
+    index.json keeps per-segment seq/timestamp ranges plus sparse byte offsets,
+    so appends are O(1) and readers skip segments they don't need.
+    """
+
+    def __init__(self, directory=None, segment_bytes=None, segment_seconds=None, retention_entries=None, legacy_file=None):
+        self.dir = Path(directory or AUDIT_DIR)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.dir / "index.json"
+        self.segment_bytes = segment_bytes or AUDIT_SEGMENT_BYTES
+        self.segment_seconds = segment_seconds or AUDIT_SEGMENT_SECONDS
+        self.retention_entries = retention_entries or AUDIT_RETENTION_ENTRIES
+
+        self.segments = [] # Oldest first; the last uncompressed one is active
+        self.next_seq = 1
+        self._fh = None
+        self._cold_cache = OrderedDict()
+
+        self._load_index()
+        self._recover_active()
+        self._migrate_legacy(legacy_file if legacy_file is not None else CONFIG_DIR / "audit_log.json")
+
+    # --- Index ---
+
+    def _load_index(self):
+        if self.index_file.exists():
+            try:
+                with open(self.index_file, "r") as f:
+                    data = json.load(f)
+                self.segments = data.get("segments", [])
+                self.next_seq = data.get("next_seq", 1)
+                return
+            except (json.JSONDecodeError, OSError) as e:
+                logger.error(f"Audit index unreadable, rebuilding: {e}")
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Reconstructs segment metadata by scanning segment files."""
+        self.segments = []
+        for path in sorted(self.dir.glob("segment-*.jsonl*")):
+            seg = self._empty_segment(int(path.name.split("-")[1].split(".")[0]))
+            seg["file"] = path.name
+            seg["compressed"] = path.suffix == ".gz"
+            for entry in self._read_segment(seg):
+                self._track(seg, entry, 0)
+            seg["offsets"] = []
+            self.segments.append(seg)
+        self.next_seq = max([s["last_seq"] for s in self.segments if s["count"]] or [0]) + 1
+
+    def _write_index(self):
+        tmp = self.index_file.with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"next_seq": self.next_seq, "segments": self.segments}, f)
+        os.replace(tmp, self.index_file)
+
+    def _empty_segment(self, seg_id):
+        return {
+            "id": seg_id,
+            "file": f"segment-{seg_id:06d}.jsonl",
+            "first_seq": None,
+            "last_seq": None,
+            "first_ts": None,
+            "last_ts": None,
+            "count": 0,
+            "bytes": 0,
+            "compressed": False,
+            "created_at": time.time(),
+            "offsets": [],
+            "facets": {}
+        }
+
+    def _track(self, seg, entry, size):
+        """Updates segment metadata for one appended entry."""
+        if seg["count"] % OFFSET_STRIDE == 0:
+            seg["offsets"].append([entry["seq"], seg["bytes"]])
+        if seg["first_seq"] is None:
+            seg["first_seq"] = entry["seq"]
+            seg["first_ts"] = entry.get("timestamp")
+        seg["last_seq"] = entry["seq"]
+        seg["last_ts"] = entry.get("timestamp")
+        seg["count"] += 1
+        seg["bytes"] += size
+
+        facets = seg.setdefault("facets", {})
+        for name, value in _facet_values(entry).items():
+            values = facets.setdefault(name, [])
+            if values is None or value in values:
+                continue
+            if len(values) >= FACET_CAP:
+                facets[name] = None # Too many distinct values to be useful
+            else:
+                values.append(value)
+
+    def _active(self):
+        if self.segments and not self.segments[-1]["compressed"]:
+            return self.segments[-1]
+        return None
+
+    def _recover_active(self):
+        """Re-reads the hot segment: its metadata is only persisted on rotation."""
+        seg = self._active()
+        if not seg:
+            return
+        path = self.dir / seg["file"]
+        if not path.exists():
+            self.segments.pop()
+            return
+
+        with open(path, "rb") as f:
+            data = f.read()
+        # Drop a torn last line left by a crash
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+        fresh = self._empty_segment(seg["id"])
+        fresh["created_at"] = seg["created_at"]
+        for line in data[:end].splitlines(keepends=True):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                fresh["bytes"] += len(line)
+                continue
+            self._track(fresh, entry, len(line))
+        self.segments[-1] = fresh
+        if fresh["count"]:
+            self.next_seq = max(self.next_seq, fresh["last_seq"] + 1)
+
+    def _migrate_legacy(self, legacy_file):
+        """Imports the old audit_log.json (newest-first list) once."""
+        legacy_file = Path(legacy_file)
+        if not legacy_file.exists() or self.next_seq > 1:
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                logs = json.load(f)
+        except (json.JSONDecodeError, OSError):
+            logs = []
+        for entry in reversed(logs):
+            entry.pop("seq", None)
+            self.append(entry)
+        legacy_file.rename(legacy_file.with_name(legacy_file.name + ".migrated"))
+        logger.info(f"Migrated {len(logs)} audit entries to the journal.")
+
+    # --- Writes ---
+
+    def _needs_rotation(self, seg):
+        if not seg or not seg["count"]:
+            return False
+        return seg["bytes"] >= self.segment_bytes or time.time() - seg["created_at"] >= self.segment_seconds
+
+    def _open_segment(self):
+        seg_id = self.segments[-1]["id"] + 1 if self.segments else 1
+        seg = self._empty_segment(seg_id)
+        self.segments.append(seg)
+        self._write_index()
+        return seg
+
+    def rotate(self):
+        """Seals the active segment: compresses it and applies retention."""
+        seg = self._active()
+        if not seg or not seg["count"]:
+            return
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+
+        path = self.dir / seg["file"]
+        with open(path, "rb") as src, gzip.open(str(path) + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        seg["file"] += ".gz"
+        seg["compressed"] = True
+        seg["offsets"] = []
+
+        self._apply_retention()
+        self._write_index()
+
+    def _apply_retention(self):
+        total = sum(s["count"] for s in self.segments)
+        while len(self.segments) > 1 and total - self.segments[0]["count"] >= self.retention_entries:
+            oldest = self.segments.pop(0)
+            total -= oldest["count"]
+            try:
+                os.remove(self.dir / oldest["file"])
+            except FileNotFoundError:
+                pass
+            logger.info(f"Audit retention: dropped segment {oldest['file']} ({oldest['count']} entries).")
+
+    def append(self, entry):
+        """Appends one entry and returns it with its sequence number. O(1)."""
+        seg = self._active()
+        if self._needs_rotation(seg):
+            self.rotate()
+            seg = None
+        if not seg:
+            seg = self._open_segment()
+        if not self._fh:
+            self._fh = open(self.dir / seg["file"], "ab")
+
+        entry = {"seq": self.next_seq, **entry}
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        self._fh.write(data)
+        self._fh.flush()
+
+        self._track(seg, entry, len(data))
+        self.next_seq += 1
+        return entry
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        self._write_index()
+
+    # --- Reads ---
+
+    def _read_segment(self, seg, start_offset=0):
+        path = self.dir / seg["file"]
+        if seg["compressed"] and seg["file"] in self._cold_cache:
+            self._cold_cache.move_to_end(seg["file"])
+            return self._cold_cache[seg["file"]]
+        try:
+            if seg["compressed"]:
+                with gzip.open(path, "rb") as f:
+                    data = f.read()
+            else:
+                with open(path, "rb") as f:
+                    f.seek(start_offset)
+                    data = f.read()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for line in data.splitlines():
+            if not line.strip(): continue
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+        if seg["compressed"]:
+            self._cold_cache[seg["file"]] = entries
+            while len(self._cold_cache) > COLD_CACHE_SEGMENTS:
+                self._cold_cache.popitem(last=False)
+        return entries
+
+    def iter_forward(self, after_seq=0):
+        """Yields entries with seq > after_seq, oldest first."""
+        for seg in self.segments:
+            if not seg["count"] or seg["last_seq"] <= after_seq:
+                continue
+            offset = 0
+            if not seg["compressed"] and seg["offsets"]:
+                # Seek to the last recorded offset at or before the cursor
+                i = bisect.bisect_right([o[0] for o in seg["offsets"]], after_seq + 1) - 1
+                if i >= 0:
+                    offset = seg["offsets"][i][1]
+            for entry in self._read_segment(seg, offset):
+                if entry["seq"] > after_seq:
+                    yield entry
+
+    def iter_reverse(self, before_seq=None):
+        """Yields entries with seq < before_seq (all if None), newest first."""
+        for seg in reversed(self.segments):
+            if not seg["count"]:
+                continue
+            if before_seq is not None and seg["first_seq"] >= before_seq:
+                continue
+            for entry in reversed(self._read_segment(seg)):
+                if before_seq is None or entry["seq"] < before_seq:
+                    yield entry
+
+    def tail(self, limit=100):
+        """Newest `limit` entries, newest first."""
+        return list(islice(self.iter_reverse(), limit))
+
+    def _segment_may_match(self, seg, filters, until):
+        """Uses the segment index to skip segments that cannot contain a match (`until` is exclusive)."""
+        if until and seg["first_ts"] and seg["first_ts"] >= until:
+            return False
+        facets = seg.get("facets") or {}
+        for name, value in filters.items():
+            values = facets.get(name)
+            if values is not None and value not in values:
+                return False
+        return True
+
+    def query(self, cursor=None, limit=100, filters=None, since=None, until=None, fields=None):
+        """
+        Newest-first page of entries with seq < cursor matching all filters
+        (sender, priority, task_created, reply_action) and the [since, until] time range.
+        Returns {"entries": [...], "next_cursor": seq or None}.
+        """
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        since, until = time_bounds(since, until)
+        results = []
+
+        for seg in reversed(self.segments):
+            if not seg["count"]:
+                continue
+            if cursor is not None and seg["first_seq"] >= cursor:
+                continue
+            if since and seg["last_ts"] and seg["last_ts"] < since:
+                break # Every older segment is older still
+            if not self._segment_may_match(seg, filters, until):
+                continue
+
+            for entry in reversed(self._read_segment(seg)):
+                if cursor is not None and entry["seq"] >= cursor:
+                    continue
+                timestamp = entry.get("timestamp") or ""
+                if until and timestamp >= until:
+                    continue
+                if since and timestamp < since:
+                    break
+                values = _facet_values(entry)
+                if any(values[k] != v for k, v in filters.items()):
+                    continue
+
+                results.append(project_fields(entry, fields))
+                if len(results) >= limit:
+                    return {"entries": results, "next_cursor": entry["seq"]}
+
+        return {"entries": results, "next_cursor": None}
+
+    @property
+    def latest_seq(self):
+        return self.next_seq - 1
+
+    def get_stats(self):
+        return {
+            "entries": sum(s["count"] for s in self.segments),
+            "segments": len(self.segments),
+            "bytes_on_disk": sum(
+                (self.dir / s["file"]).stat().st_size for s in self.segments if (self.dir / s["file"]).exists()
+            ),
+            "latest_seq": self.latest_seq
+        }
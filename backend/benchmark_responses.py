@@ -0,0 +1,96 @@
+"""
+Compares the API response layer against the previous defaults on synthetic payloads
+shaped like /api/tasks, /api/audit and /api/discussions/history.
+
+    python benchmark_responses.py [--tasks 500] [--audit 500] [--history 365] [--repeat 20]
+"""
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from responses import FastJSONResponse, compress, brotli, orjson
+
+
+def make_tasks(n):
+    return [{
+        "id": f"task-{i:05d}",
+        "summary": f"Follow up with the vendor about invoice #{i} and confirm delivery dates",
+        "status": ("active", "done", "rejected")[i % 3],
+        "priority": i % 4 + 1,
+        "sender": f"Contact {i % 40}",
+        "link": f"https://t.me/c/123456/{i}",
+        "deadline": "next Friday" if i % 5 == 0 else "",
+        "deadline_date": "2024-06-14" if i % 5 == 0 else None,
+        "comments": [
+            {"id": f"{i:04d}{j}", "timestamp": "2024-06-01 10:00:00", "sender": "User", "text": f"Comment {j} on task {i}"}
+            for j in range(i % 4)
+        ],
+        "notion_page_id": f"task-{i:05d}",
+    } for i in range(n)]
+
+
+def make_audit(n):
+    return {"entries": [{
+        "seq": i,
+        "timestamp": f"2024-06-01T10:{i % 60:02d}:00",
+        "sender": f"Contact {i % 40}",
+        "text": f"Hey, can you check the deployment logs for service {i % 7}? Something looks off since this morning.",
+        "evaluation": {
+            "priority": i % 4 + 1,
+            "summary": f"Check deployment logs for service {i % 7}",
+            "action_required": i % 2 == 0,
+            "deadline": None,
+            "reply_text": "On it, will report back shortly.",
+            "save_memory": "",
+        },
+        "task_created": i % 2 == 0,
+        "reply_action": "none",
+    } for i in range(n)], "next_cursor": None}
+
+
+def make_history(n):
+    digest = "📢 **Daily Group Discussion Digest**\n" + "\n".join(
+        f"- **Chat {c}**: release planning, bug triage and hiring updates" for c in range(12)
+    )
+    return {"entries": [
+        {"date": f"2024-{1 + i // 28 % 12:02d}-{1 + i % 28:02d}", "timestamp": "2024-06-01T09:00:00",
+         "summary_text": digest, "point_count": 40 + i % 30}
+        for i in range(n)
+    ], "next_cursor": None}
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--audit", type=int, default=500)
+    parser.add_argument("--history", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = {
+        "tasks": make_tasks(args.tasks),
+        "audit": make_audit(args.audit),
+        "history": make_history(args.history),
+    }
+    print(f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}, brotli: {'yes' if brotli else 'not installed'}\n")
+    print(f"{'payload':<9}{'before ms':>11}{'after ms':>10}{'raw bytes':>11}{'gzip':>9}{'br':>9}{'gzip ms':>9}")
+    for name, content in payloads.items():
+        # Before: FastAPI's default path (jsonable_encoder + JSONResponse), sent uncompressed
+        before_ms, raw = timed(lambda: JSONResponse(jsonable_encoder(content)).body, args.repeat)
+        after_ms, fast = timed(lambda: FastJSONResponse(content).body, args.repeat)
+        gzip_ms, gzipped = timed(lambda: compress(fast, "gzip"), args.repeat)
+        br = len(compress(fast, "br")) if brotli else "-"
+        print(f"{name:<9}{before_ms:>11.2f}{after_ms:>10.2f}{len(raw):>11}{len(gzipped):>9}{br:>9}{gzip_ms:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -56,6 +56,7 @@ def build():
         '--hidden-import=memory_manager',
         '--hidden-import=learning_service',
         '--hidden-import=google.genai',
+        '--hidden-import=orjson',
     ])
 
     src = os.path.join("dist", binary_name)
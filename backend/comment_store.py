@@ -0,0 +1,116 @@
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+logger = logging.getLogger(__name__)
+
+from config import COMMENTS_DB_PATH
+
+class CommentStore:
+    """
+    Local source of truth for task comments, keyed by Notion page ID.
+    Notion only receives a rendered copy, so appends never need a read-back.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = str(db_path or COMMENTS_DB_PATH)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS comments (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    page_id TEXT NOT NULL,
+                    comment_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    deleted INTEGER NOT NULL DEFAULT 0,
+                    UNIQUE (page_id, comment_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_comments_page ON comments (page_id, deleted, timestamp);
+                CREATE TABLE IF NOT EXISTS seeded_pages (
+                    page_id TEXT PRIMARY KEY
+                );
+            """)
+            # Stores created before deletion sync: nothing is known to be in Notion yet
+            columns = [r["name"] for r in self.conn.execute("PRAGMA table_info(comments)")]
+            if "in_notion" not in columns:
+                self.conn.execute("ALTER TABLE comments ADD COLUMN in_notion INTEGER NOT NULL DEFAULT 0")
+
+    def is_seeded(self, page_id):
+        """True once the page's legacy Notion text has been imported."""
+        with closing(self.conn.execute("SELECT 1 FROM seeded_pages WHERE page_id = ?", (page_id,))) as cur:
+            return cur.fetchone() is not None
+
+    def merge(self, page_id, comments, reconcile=True):
+        """
+        Imports comments seen in Notion. Known and deleted IDs are left untouched.
+        With `reconcile`, comments that were in Notion before but are missing now were
+        deleted there and get tombstoned; ones never replicated are kept. Returns that count.
+        """
+        ids = [c["id"] for c in comments]
+        removed = 0
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO comments (page_id, comment_id, timestamp, sender, text, in_notion) "
+                "VALUES (?, ?, ?, ?, ?, 1)",
+                [(page_id, c["id"], c["timestamp"], c["sender"], c["text"]) for c in comments]
+            )
+            if reconcile:
+                removed = self.conn.execute(
+                    f"UPDATE comments SET deleted = 1 WHERE page_id = ? AND in_notion = 1 AND deleted = 0 "
+                    f"AND comment_id NOT IN ({', '.join('?' * len(ids))})",
+                    (page_id, *ids)
+                ).rowcount
+                self._set_in_notion(page_id, ids)
+            self.conn.execute("INSERT OR IGNORE INTO seeded_pages (page_id) VALUES (?)", (page_id,))
+        return removed
+
+    def mark_in_notion(self, page_id, comment_ids):
+        """Records exactly which comments the last write put into Notion's copy."""
+        with self.conn:
+            self._set_in_notion(page_id, comment_ids)
+
+    def _set_in_notion(self, page_id, comment_ids):
+        self.conn.execute(
+            f"UPDATE comments SET in_notion = comment_id IN ({', '.join('?' * len(comment_ids))}) WHERE page_id = ?",
+            (*comment_ids, page_id)
+        )
+
+    def add(self, page_id, comment):
+        """Appends one comment (single INSERT)."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO comments (page_id, comment_id, timestamp, sender, text) VALUES (?, ?, ?, ?, ?)",
+                (page_id, comment["id"], comment["timestamp"], comment["sender"], comment["text"])
+            )
+
+    def delete(self, page_id, comment_id):
+        """Tombstones a comment so a later merge from Notion cannot resurrect it."""
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE comments SET deleted = 1 WHERE page_id = ? AND comment_id = ? AND deleted = 0",
+                (page_id, comment_id)
+            )
+            return cur.rowcount > 0
+
+    def list(self, page_id):
+        """Returns live comments for a page, oldest first."""
+        with closing(self.conn.execute(
+            "SELECT comment_id, timestamp, sender, text FROM comments "
+            "WHERE page_id = ? AND deleted = 0 ORDER BY timestamp, seq",
+            (page_id,)
+        )) as cur:
+            return [
+                {"id": r["comment_id"], "timestamp": r["timestamp"], "sender": r["sender"], "text": r["text"]}
+                for r in cur.fetchall()
+            ]
+
+    def close(self):
+        self.conn.close()
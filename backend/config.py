@@ -37,6 +37,14 @@ GENAI_MODEL = get_conf("GENAI_MODEL", "gemini-3-flash-preview")
 # Notion Config
 NOTION_TOKEN = get_conf("NOTION_TOKEN")
 NOTION_DATABASE_ID = get_conf("NOTION_DATABASE_ID")
+# Notion allows ~3 requests/second per integration
+NOTION_RATE_LIMIT = float(get_conf("NOTION_RATE_LIMIT", "3"))
+NOTION_RATE_BURST = int(get_conf("NOTION_RATE_BURST", "3"))
+GEMINI_MAX_CONCURRENCY = int(get_conf("GEMINI_MAX_CONCURRENCY", "4")) # Gemini calls in flight, process-wide
+
+# Circuit Breakers (Notion, Gemini)
+CIRCUIT_FAILURE_THRESHOLD = int(get_conf("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_SECONDS = float(get_conf("CIRCUIT_RECOVERY_SECONDS", "30"))
 
 # Feature Toggles
 ENABLE_AUTO_REPLY = str(get_conf("ENABLE_AUTO_REPLY", "true")).lower() == "true"
@@ -46,7 +54,59 @@ USER_NAME = get_conf("USER_NAME", "the User")
 
 # Long-term Memory Config
 ENABLE_LONG_TERM_MEMORY = str(get_conf("ENABLE_LONG_TERM_MEMORY", "true")).lower() == "true"
-MEMORY_FILE_PATH = str(CONFIG_DIR / "memory.json")
+MEMORY_FILE_PATH = str(CONFIG_DIR / "memory.json") # Legacy list, migrated into MEMORY_DB_PATH
+MEMORY_DB_PATH = str(CONFIG_DIR / "memory.db")
+MEMORY_CONSOLIDATE_MAX_CLUSTERS = int(get_conf("MEMORY_CONSOLIDATE_MAX_CLUSTERS", "10")) # LLM calls per consolidation
+TASK_CONTEXT_TTL = int(get_conf("TASK_CONTEXT_TTL", "300")) # Seconds a rendered task context may be reused
+TASK_CHANGE_LOG_SIZE = int(get_conf("TASK_CHANGE_LOG_SIZE", "1000")) # Task changes kept for /api/tasks/changes
+TASK_CHANGES_REFRESH_SECONDS = int(get_conf("TASK_CHANGES_REFRESH_SECONDS", "5")) # Max age of the Notion snapshot a delta is diffed against
+TASK_BULK_CONCURRENCY = int(get_conf("TASK_BULK_CONCURRENCY", "5")) # Operations of one bulk request in flight (Notion rate limit still applies)
+TASK_BULK_MAX_OPERATIONS = int(get_conf("TASK_BULK_MAX_OPERATIONS", "200"))
+
+# Task Backend: "notion" (Notion is the store) or "sqlite" (local-first)
+TASK_BACKEND = str(get_conf("TASK_BACKEND", "notion")).lower()
+TASK_REPLICATE_TO_NOTION = str(get_conf("TASK_REPLICATE_TO_NOTION", "false")).lower() == "true"
+TASK_REPLICATION_RETRY_SECONDS = int(get_conf("TASK_REPLICATION_RETRY_SECONDS", "60")) # First retry of failed Notion writes
+TASK_REPLICATION_RETRY_MAX_SECONDS = int(get_conf("TASK_REPLICATION_RETRY_MAX_SECONDS", "900")) # Backoff cap while Notion stays down
+
+# Local Stores
+COMMENTS_DB_PATH = str(CONFIG_DIR / "comments.db")
+TASK_DB_PATH = str(CONFIG_DIR / "tasks.db")
+
+# Audit Journal (append-only JSONL segments)
+AUDIT_DIR = CONFIG_DIR / "audit"
+AUDIT_SEGMENT_BYTES = int(get_conf("AUDIT_SEGMENT_BYTES", str(1024 * 1024)))
+AUDIT_SEGMENT_SECONDS = int(get_conf("AUDIT_SEGMENT_SECONDS", str(24 * 3600)))
+AUDIT_RETENTION_ENTRIES = int(get_conf("AUDIT_RETENTION_ENTRIES", "50000"))
+
+# Background Learning (map-reduce over the audit backlog)
+LEARNING_CHUNK_TOKENS = int(get_conf("LEARNING_CHUNK_TOKENS", "6000"))
+LEARNING_MAX_CONCURRENCY = int(get_conf("LEARNING_MAX_CONCURRENCY", "3"))
+LEARNING_RUN_TOKEN_BUDGET = int(get_conf("LEARNING_RUN_TOKEN_BUDGET", "300000"))
+LEARNING_CONSOLIDATE_THRESHOLD = int(get_conf("LEARNING_CONSOLIDATE_THRESHOLD", "10"))
+LEARNING_AUDIT_TRIGGER = int(get_conf("LEARNING_AUDIT_TRIGGER", "200"))       # New audit entries
+LEARNING_FEEDBACK_TRIGGER = int(get_conf("LEARNING_FEEDBACK_TRIGGER", "5"))     # Rejections/comments
+LEARNING_MAX_STALENESS = int(get_conf("LEARNING_MAX_STALENESS", str(6 * 3600))) # Seconds
+LEARNING_CHECK_SECONDS = int(get_conf("LEARNING_CHECK_SECONDS", "60"))
+LEARNING_MAX_CHUNK_ATTEMPTS = int(get_conf("LEARNING_MAX_CHUNK_ATTEMPTS", "3")) # Then the chunk is skipped and logged
+LEARNING_COOLDOWN_SECONDS = int(get_conf("LEARNING_COOLDOWN_SECONDS", "1800")) # After a run that hit its budget or failed
+
+# Group Discussion Digest
+DISCUSSION_ARCHIVE_KEEP = int(get_conf("DISCUSSION_ARCHIVE_KEEP", "14")) # Rotated daily journals kept on disk
+DISCUSSION_MAX_POINTS_PER_CHAT = int(get_conf("DISCUSSION_MAX_POINTS_PER_CHAT", "200"))
+DISCUSSION_MAX_POINTS = int(get_conf("DISCUSSION_MAX_POINTS", "1000"))
+DISCUSSION_DEDUPE_WINDOW = int(get_conf("DISCUSSION_DEDUPE_WINDOW", "50")) # Recent points per chat compared by SimHash
+DISCUSSION_PARTIAL_SECONDS = int(get_conf("DISCUSSION_PARTIAL_SECONDS", "3600")) # Rolling per-chat partial summaries
+DISCUSSION_CLUSTER_POINTS = int(get_conf("DISCUSSION_CLUSTER_POINTS", "20")) # Small chats share one summarization call up to this many points
+
+# API Responses
+RESPONSE_COMPRESSION = str(get_conf("RESPONSE_COMPRESSION", "br,gzip")).lower() # Preference order; "off" disables
+RESPONSE_COMPRESS_MIN_BYTES = int(get_conf("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(get_conf("RESPONSE_GZIP_LEVEL", "6"))
+
+# Dashboard Events (Server-Sent Events)
+EVENT_QUEUE_SIZE = int(get_conf("EVENT_QUEUE_SIZE", "200")) # Per-stream backlog before the client is told to resync
+EVENT_KEEPALIVE_SECONDS = int(get_conf("EVENT_KEEPALIVE_SECONDS", "15"))
 
 # Startup Catch-Unique
 CATCH_UP_SECONDS = int(get_conf("CATCH_UP_SECONDS", "120"))
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+
+from config import TASK_CONTEXT_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _render_examples(tasks):
+    return "\n".join([
+        f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "")
+        for t in tasks
+    ])
+
+
+def render_task_context(recent_tasks=None, user_preferences=None):
+    """Recent finished tasks and accepted/rejected examples, as sent to the analysis prompt."""
+    text = ""
+    if recent_tasks:
+        text += "Recent Finished Tasks:\n" + "\n".join([f"- {t['summary']}" for t in recent_tasks])
+    if user_preferences:
+        text += "\n\nUser Preferences (Learning):\n"
+        text += "ACCEPTED Tasks:\n" + _render_examples(user_preferences.get('accepted', []))
+        text += "\nREJECTED Tasks:\n" + _render_examples(user_preferences.get('rejected', []))
+    return text
+
+
+class ContextBundleCache:
+    """
+    Pre-rendered prompt context for message analysis and session turns.
+    Sections are rebuilt only when the memory or task version counter moves
+    (task sections also expire after TASK_CONTEXT_TTL, for edits made in Notion).
+    """
+
+    def __init__(self, memory_manager, task_service, task_ttl=None, clock=time.monotonic):
+        self.memory_manager = memory_manager
+        self.task_service = task_service
+        self.task_ttl = TASK_CONTEXT_TTL if task_ttl is None else task_ttl
+        self.clock = clock
+
+        self._memory = (None, "")   # (memory version, text)
+        self._tasks = (None, 0, "") # (task version, rendered at, text)
+        self.hits = 0
+        self.misses = 0
+
+    def memory_text(self):
+        """Long-term memory section."""
+        if not self.memory_manager:
+            return ""
+        version = self.memory_manager.version
+        if self._memory[0] == version:
+            self.hits += 1
+            return self._memory[1]
+        self.misses += 1
+        text = self.memory_manager.get_memories_text()
+        self._memory = (version, text)
+        return text
+
+    async def task_text(self):
+        """
+        Recent tasks and preference examples section. The version is read before fetching;
+        services bump it only once a write has completed, so a fetch racing a write is
+        cached under the old version and refetched on the next call.
+        """
+        version = self.task_service.version
+        cached_version, rendered_at, text = self._tasks
+        if cached_version == version and self.clock() - rendered_at < self.task_ttl:
+            self.hits += 1
+            return text
+        self.misses += 1
+        # Run together so both share one task fetch (see TaskManager.get_tasks)
+        recent, preferences = await asyncio.gather(
+            self.task_service.get_recent_done_tasks(limit=5),
+            self.task_service.get_preference_examples(limit=5)
+        )
+        text = render_task_context(recent, preferences)
+        self._tasks = (version, self.clock(), text)
+        return text
+
+    async def bundle(self):
+        """Full context for analyze_message."""
+        text = await self.task_text()
+        memory = self.memory_text()
+        if memory:
+            text += "\n\n" + memory
+        return text
+
+    def invalidate(self):
+        self._memory = (None, "")
+        self._tasks = (None, 0, "")
+
+    def get_stats(self):
+        return {"hits": self.hits, "misses": self.misses}
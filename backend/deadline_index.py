@@ -0,0 +1,207 @@
+import bisect
+import functools
+import logging
+import re
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+WEEKDAY_ALIASES = {name[:3]: i for i, name in enumerate(WEEKDAYS)}
+WEEKDAY_ALIASES.update({name: i for i, name in enumerate(WEEKDAYS)})
+WEEKDAY_ALIASES.update({"tues": 1, "wed": 2, "thur": 3, "thurs": 3})
+
+MONTHS = {
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "may": 5, "jun": 6,
+    "jul": 7, "aug": 8, "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+MONTH_NAMES = {
+    name: i + 1 for i, name in enumerate([
+        "january", "february", "march", "april", "may", "june",
+        "july", "august", "september", "october", "november", "december",
+    ])
+}
+
+ISO_DATE_RE = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})")
+RELATIVE_RE = re.compile(r"\bin (\d+|a|an|one|two|three) (day|week|month)s?\b")
+MONTH_DAY_RE = re.compile(r"\b([a-z]{3,9})\.? (\d{1,2})(?:st|nd|rd|th)?(?:,? (\d{4}))?\b")
+DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)? (?:of )?([a-z]{3,9})\.?(?:,? (\d{4}))?\b")
+WEEKDAY_RE = re.compile(r"\b(next |this |by |on |until )?(" + "|".join(sorted(WEEKDAY_ALIASES, key=len, reverse=True)) + r")\b")
+
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3}
+
+
+def _month(name):
+    """Month number for a full or abbreviated month name, else None."""
+    return MONTHS.get(name) or MONTH_NAMES.get(name)
+
+
+def _safe_date(year, month, day):
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _end_of_month(d):
+    first_next = date(d.year + (d.month == 12), d.month % 12 + 1, 1)
+    return first_next - timedelta(days=1)
+
+
+def parse_deadline(text, reference=None):
+    """
+    Normalizes a free-text deadline ("tomorrow", "next Friday", "Jan 5", "2025-03-01"...)
+    to a date, relative to `reference` (the day the task was created; default today). Returns None if unknown.
+    """
+    if not text:
+        return None
+    # Resolve "today" before the cache so the reference day is always part of the key
+    return _parse_deadline(text, reference or date.today())
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_deadline(text, today):
+    s = text.strip().lower()
+
+    match = ISO_DATE_RE.search(s)
+    if match:
+        return _safe_date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+
+    if re.search(r"\b(today|tonight|eod|end of (the )?day|asap|now)\b", s):
+        return today
+    if re.search(r"\bday after tomorrow\b", s):
+        return today + timedelta(days=2)
+    if re.search(r"\b(tomorrow|tmr|tmrw)\b", s):
+        return today + timedelta(days=1)
+    if re.search(r"\b(eow|end of (the )?week|this week)\b", s):
+        return today + timedelta(days=(4 - today.weekday()) % 7) # Friday
+    if re.search(r"\bnext week\b", s):
+        return today + timedelta(days=7 - today.weekday()) # Next Monday
+    if re.search(r"\b(eom|end of (the )?month|this month)\b", s):
+        return _end_of_month(today)
+    if re.search(r"\bnext month\b", s):
+        return _safe_date(today.year + (today.month == 12), today.month % 12 + 1, 1)
+
+    match = RELATIVE_RE.search(s)
+    if match:
+        count = NUMBER_WORDS.get(match.group(1)) or int(match.group(1))
+        unit = match.group(2)
+        if unit == "day":
+            return today + timedelta(days=count)
+        if unit == "week":
+            return today + timedelta(weeks=count)
+        return today + timedelta(days=30 * count)
+
+    for regex, month_group, day_group in ((MONTH_DAY_RE, 1, 2), (DAY_MONTH_RE, 2, 1)):
+        match = regex.search(s)
+        if match and _month(match.group(month_group)):
+            year = int(match.group(3)) if match.group(3) else today.year
+            parsed = _safe_date(year, _month(match.group(month_group)), int(match.group(day_group)))
+            # "Jan 5" written in December means next January
+            if parsed and not match.group(3) and parsed < today - timedelta(days=30):
+                parsed = _safe_date(year + 1, parsed.month, parsed.day)
+            if parsed:
+                return parsed
+
+    match = WEEKDAY_RE.search(s)
+    if match:
+        target = WEEKDAY_ALIASES[match.group(2)]
+        days_ahead = (target - today.weekday()) % 7
+        if match.group(1) == "next " and days_ahead == 0:
+            days_ahead = 7
+        return today + timedelta(days=days_ahead)
+
+    return None
+
+
+def reference_date(value):
+    """Converts an ISO timestamp (Notion created_time, local created_at) to a date."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).date()
+    except ValueError:
+        return None
+
+
+DEADLINE_WINDOWS = ("overdue", "today", "week", "upcoming")
+
+
+def window_bounds(window, today=None):
+    """Inclusive (start, end) dates for a named window. None means unbounded."""
+    today = today or date.today()
+    if window == "overdue":
+        return None, today - timedelta(days=1)
+    if window == "today":
+        return today, today
+    if window == "week":
+        return today, today + timedelta(days=6 - today.weekday()) # Through Sunday
+    if window == "upcoming":
+        return today, today + timedelta(days=7)
+    raise ValueError(f"Unknown deadline window: {window}")
+
+
+class DeadlineIndex:
+    """
+    Active tasks sorted by normalized deadline.
+    Range queries (overdue, today, this week) are a bisect plus a slice.
+    """
+
+    def __init__(self):
+        self._keys = []      # sorted (iso_date, task_id)
+        self._entries = {}   # task_id -> (iso_date, task)
+        self._unparsed = {}  # task_id -> task with a deadline we could not read
+
+    def __len__(self):
+        return len(self._entries)
+
+    def rebuild(self, tasks):
+        """Replaces the index with the given tasks (only active ones are kept)."""
+        self._entries = {}
+        self._unparsed = {}
+        for task in tasks:
+            self._add(task)
+        self._keys = sorted((d, tid) for tid, (d, _) in self._entries.items())
+
+    def _add(self, task):
+        if task.get("status", "active") != "active" or not task.get("deadline"):
+            return False
+        if task.get("deadline_date"):
+            self._entries[task["id"]] = (task["deadline_date"], task)
+        else:
+            self._unparsed[task["id"]] = task
+        return True
+
+    def upsert(self, task):
+        self.remove(task["id"])
+        if self._add(task) and task["id"] in self._entries:
+            bisect.insort(self._keys, (task["deadline_date"], task["id"]))
+
+    def remove(self, task_id):
+        self._unparsed.pop(task_id, None)
+        entry = self._entries.pop(task_id, None)
+        if entry:
+            i = bisect.bisect_left(self._keys, (entry[0], task_id))
+            if i < len(self._keys) and self._keys[i] == (entry[0], task_id):
+                del self._keys[i]
+
+    def between(self, start, end):
+        """Tasks due in [start, end], earliest first. Bounds are dates or None (open)."""
+        lo = 0 if start is None else bisect.bisect_left(self._keys, (start.isoformat(), ""))
+        hi = len(self._keys) if end is None else bisect.bisect_right(self._keys, (end.isoformat(), "\uffff"))
+        return [self._entries[tid][1] for _, tid in self._keys[lo:hi]]
+
+    def overdue(self, today=None):
+        return self.between(*window_bounds("overdue", today))
+
+    def upcoming(self, today=None):
+        return self.between(*window_bounds("upcoming", today))
+
+    def unparsed(self):
+        return list(self._unparsed.values())
+
+    def query(self, window, today=None):
+        """Tasks in a named window (see DEADLINE_WINDOWS), or with unreadable deadlines."""
+        if window == "unparsed":
+            return self.unparsed()
+        return self.between(*window_bounds(window, today))
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+
+from config import DISCUSSION_PARTIAL_SECONDS, DISCUSSION_CLUSTER_POINTS
+from rate_limiter import live_traffic, notion_priority, PRIORITY_BACKGROUND
+
+logger = logging.getLogger(__name__)
+
+
+def cluster_chats(pending, cluster_points):
+    """
+    Groups pending chats for the map step: a chat with at least `cluster_points`
+    points is summarized alone, smaller chats are packed together up to that size.
+    """
+    groups, current, size = [], {}, 0
+    for chat, points in pending.items():
+        if len(points) >= cluster_points:
+            groups.append({chat: points})
+            continue
+        if current and size + len(points) > cluster_points:
+            groups.append(current)
+            current, size = {}, 0
+        current[chat] = points
+        size += len(points)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def render_group(group):
+    """Numbered sections; the model keys its answer by number, never by the (free-form) chat title."""
+    return "\n".join(
+        f"### [{i}] {chat}\n" + "\n".join(f"- [{p['sender']}]: {p['summary']}" for p in points)
+        for i, (chat, points) in enumerate(group.items(), start=1)
+    )
+
+
+def match_summaries(group, summaries):
+    """Maps the model's {"n": text} answer back to chat names. Returns {chat: text}."""
+    if not isinstance(summaries, dict):
+        raise ValueError(f"Expected a JSON object of summaries, got {type(summaries).__name__}")
+    texts = {str(k).strip().strip("[]"): v for k, v in summaries.items() if isinstance(v, str) and v.strip()}
+    chats = list(group)
+    if len(chats) == 1:
+        # One chat: whatever key the model used, the only answer is its summary
+        return {chats[0]: next(iter(texts.values()))} if texts else {}
+    return {chat: texts[str(i)] for i, chat in enumerate(chats, start=1) if str(i) in texts}
+
+
+class DigestSummarizer:
+    """
+    Map-reduce summaries for the group digest. Every DISCUSSION_PARTIAL_SECONDS each
+    chat's new points are condensed into a partial summary (map: one call per large
+    chat or per cluster of small chats, run concurrently under the Gemini concurrency
+    cap). The morning digest and /summary only reduce the partials.
+    """
+
+    def __init__(self, agent_instance, discussion_buffer, interval=None, cluster_points=None):
+        self.agent = agent_instance
+        self.buffer = discussion_buffer
+        self.interval = interval or DISCUSSION_PARTIAL_SECONDS
+        self.cluster_points = cluster_points or DISCUSSION_CLUSTER_POINTS
+
+    async def _summarize_group(self, group):
+        summaries = await self.agent.summarize_chats(render_group(group))
+        if summaries is None:
+            return 0 # Raw points stay pending and are retried next pass
+        written = 0
+        for chat, text in match_summaries(group, summaries).items():
+            points = group[chat]
+            self.buffer.add_partial(chat, points[-1]['id'], text, len(points))
+            written += 1
+        return written
+
+    async def summarize_pending(self):
+        """Writes a partial summary for every chat with new points. Returns how many were written."""
+        groups = cluster_chats(self.buffer.pending_by_chat(), self.cluster_points)
+        if not groups:
+            return 0
+        await live_traffic.wait_idle()
+        with notion_priority(PRIORITY_BACKGROUND): # Gemini slots go to live messages first
+            results = await asyncio.gather(*(self._summarize_group(g) for g in groups), return_exceptions=True)
+        written = 0
+        for group, result in zip(groups, results):
+            if isinstance(result, asyncio.CancelledError):
+                raise result # Shutting down, not a failed group
+            if isinstance(result, Exception):
+                # One bad response must not sink the digest; those points stay pending
+                logger.error(f"Partial summary failed for {', '.join(group)}: {result}")
+            else:
+                written += result
+        return written
+
+    async def build_digest(self):
+        """Final digest: catch up on pending chats, then reduce the partials. None if nothing was recorded."""
+        await self.summarize_pending()
+        digest_input = self.buffer.get_digest_text()
+        if not digest_input:
+            return None
+        return await self.agent.summarize_discussions(digest_input)
+
+    async def start_scheduler(self):
+        """Background loop producing partial summaries."""
+        while True:
+            try:
+                await asyncio.sleep(self.interval)
+                written = await self.summarize_pending()
+                if written:
+                    logger.info(f"Wrote {written} partial discussion summaries.")
+            except asyncio.CancelledError:
+                logger.info("Digest summarizer stopped.")
+                break
+            except Exception as e:
+                logger.error(f"Digest summarizer error: {e}")
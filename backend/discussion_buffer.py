@@ -1,105 +1,327 @@
+import hashlib
 import json
 import os
+import random
+from collections import deque
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
-from config import CONFIG_DIR
-ACTIVE_BUFFER_FILE = CONFIG_DIR / "discussions.json"
-HISTORY_FILE = CONFIG_DIR / "daily_history.json"
+from config import CONFIG_DIR, DISCUSSION_ARCHIVE_KEEP, DISCUSSION_MAX_POINTS_PER_CHAT, DISCUSSION_MAX_POINTS, DISCUSSION_DEDUPE_WINDOW
+from near_duplicates import simhash, hamming
+from events import event_bus
+ACTIVE_BUFFER_FILE = CONFIG_DIR / "discussions.json" # Legacy, migrated into the journal
+DISCUSSIONS_DIR = CONFIG_DIR / "discussions"
+
+# SimHash bit distance at or below which two points count as the same content
+SIMHASH_DISTANCE = 3
 
 class DiscussionBuffer:
-    def __init__(self):
-        self.buffer = self._load_buffer()
-        self._ensure_history_file()
+    """
+    Today's group discussion points. Points are appended to a JSONL journal
+    (one line each) and indexed per chat in memory; clear() rotates the journal.
+
+    Ingestion drops near-duplicates (exact content hash per chat for the day, plus
+    SimHash against each chat's recent points) and keeps each chat, and the whole
+    buffer, to a uniform reservoir sample once their caps are reached. Evictions
+    and drops are journaled ({"evict": id}, {"drop": chat, "reason": ...}) so the
+    reservoir counters and drop stats survive a restart.
+    """
+
+    def __init__(self, directory=None, legacy_file=None, history=None,
+                 max_per_chat=None, max_points=None, dedupe_window=None, rng=None):
+        self.dir = directory or DISCUSSIONS_DIR
+        os.makedirs(self.dir, exist_ok=True)
+        self.journal_file = os.path.join(self.dir, "active.jsonl")
+        self.max_per_chat = max_per_chat or DISCUSSION_MAX_POINTS_PER_CHAT
+        self.max_points = max_points or DISCUSSION_MAX_POINTS
+        self.dedupe_window = dedupe_window or DISCUSSION_DEDUPE_WINDOW
+        self.rng = rng or random.Random()
+
+        self._fh = None
+        self.version = 0 # Bumped on every append/clear; keys the rendered-text cache
+        self._grouped = (None, None)
+        self._reset()
+
+        self._load_buffer()
+        self._migrate_legacy(legacy_file or ACTIVE_BUFFER_FILE)
+
+        if history is None:
+            from history_store import DailyHistoryStore
+            history = DailyHistoryStore()
+        self.history = history
+
+    def _reset(self):
+        self.buffer = []  # Kept points, oldest first
+        self.by_chat = {} # chat -> kept points, in first-seen chat order
+        self.next_id = 1
+        self._content_hashes = {} # chat -> set of normalized content hashes seen today
+        self._recent = {}         # chat -> deque of recent SimHashes
+        self.eligible = {}        # chat -> non-duplicate points offered (reservoir counters)
+        self.eligible_total = 0
+        self.dropped = {"duplicate": 0, "chat_cap": 0, "global_cap": 0, "evicted": 0}
+        self.dropped_by_chat = {}
+        self.partials = {}           # chat -> [partial summary records], oldest first
+        self.summarized_through = {} # chat -> last point id covered by a partial
+
+    def _fingerprint(self, point):
+        """Registers a point's content and returns True if it duplicates something seen today."""
+        chat = point['chat']
+        normalized = " ".join(point['summary'].split()).casefold()
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        hashes = self._content_hashes.setdefault(chat, set())
+        if digest in hashes:
+            return True
+        hashes.add(digest)
+
+        fingerprint = simhash(normalized)
+        recent = self._recent.setdefault(chat, deque(maxlen=self.dedupe_window))
+        duplicate = any(hamming(fingerprint, other) <= SIMHASH_DISTANCE for other in recent)
+        recent.append(fingerprint)
+        return duplicate
+
+    def _index(self, point):
+        point.setdefault("id", self.next_id)
+        self.next_id = max(self.next_id, point["id"] + 1)
+        self.buffer.append(point)
+        self.by_chat.setdefault(point['chat'], []).append(point)
+        self._fingerprint(point)
+        self.eligible[point['chat']] = self.eligible.get(point['chat'], 0) + 1
+        self.eligible_total += 1
+
+    def _unindex(self, point_id):
+        for i, p in enumerate(self.buffer):
+            if p["id"] == point_id:
+                del self.buffer[i]
+                self.by_chat[p['chat']].remove(p)
+                return p
+        return None
+
+    def _apply_partial(self, partial):
+        self.partials.setdefault(partial['chat'], []).append(partial)
+        self.summarized_through[partial['chat']] = partial['through_id']
+
+    def _replay(self, record):
+        if "evict" in record:
+            self._unindex(record["evict"])
+            self.dropped["evicted"] += 1
+        elif "drop" in record:
+            self._count_drop(record["drop"], record["reason"])
+        elif "partial" in record:
+            self._apply_partial(record["partial"])
+        else:
+            self._index(record)
 
     def _load_buffer(self):
-        """Loads active buffer from disk."""
-        if os.path.exists(ACTIVE_BUFFER_FILE):
+        """Replays the active journal, dropping a torn last line left by a crash."""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, "rb") as f:
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            with open(self.journal_file, "r+b") as f:
+                f.truncate(end)
+        for line in data[:end].splitlines():
             try:
-                with open(ACTIVE_BUFFER_FILE, "r") as f:
-                    return json.load(f)
+                self._replay(json.loads(line))
             except json.JSONDecodeError:
-                return []
-        return []
+                continue
+
+    def _migrate_legacy(self, legacy_file):
+        """Imports the old discussions.json list once."""
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                points = json.load(f)
+        except json.JSONDecodeError:
+            points = []
+        for point in points:
+            self._write(point)
+            self._index(point)
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+        logger.info(f"Migrated {len(points)} discussion points to {self.journal_file}.")
+
+    def _write(self, record):
+        if self._fh is None:
+            self._fh = open(self.journal_file, "a", encoding="utf-8")
+        self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._fh.flush()
+
+    def _count_drop(self, chat, reason):
+        self.dropped[reason] += 1
+        per_chat = self.dropped_by_chat.setdefault(chat, {})
+        per_chat[reason] = per_chat.get(reason, 0) + 1
+        if reason != "duplicate":
+            # Offered to the reservoir but not kept: still counts toward n
+            self.eligible[chat] = self.eligible.get(chat, 0) + 1
+            self.eligible_total += 1
 
-    def _save_buffer(self):
-        """Saves active buffer to disk."""
-        with open(ACTIVE_BUFFER_FILE, "w") as f:
-            json.dump(self.buffer, f, indent=2)
+    def _drop(self, chat, reason):
+        self._write({"drop": chat, "reason": reason})
+        self._count_drop(chat, reason)
+        return False
 
-    def _ensure_history_file(self):
-        """Ensures history file exists."""
-        if not os.path.exists(HISTORY_FILE):
-            os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-            with open(HISTORY_FILE, "w") as f:
-                json.dump([], f)
+    def _choose_eviction(self, chat):
+        """
+        Reservoir step. Returns (admit, point to evict or None).
+        Each chat keeps a uniform sample of its points; past the global cap,
+        a new point replaces a random point of the largest chat.
+        """
+        kept = self.by_chat.get(chat, [])
+        if len(kept) >= self.max_per_chat:
+            j = self.rng.randrange(self.eligible.get(chat, 0) + 1)
+            return (True, kept[j]) if j < self.max_per_chat else (False, "chat_cap")
+        if len(self.buffer) >= self.max_points:
+            j = self.rng.randrange(self.eligible_total + 1)
+            if j >= self.max_points:
+                return False, "global_cap"
+            largest = max(self.by_chat.values(), key=len)
+            return True, self.rng.choice(largest)
+        return True, None
 
     def add_point(self, chat_name: str, sender: str, summary: str):
-        """Adds a discussion point to the buffer."""
+        """Adds a discussion point to the buffer (one journal line). Returns False if it was dropped."""
         point = {
+            "id": self.next_id,
             "timestamp": datetime.now().isoformat(),
             "chat": chat_name,
             "sender": sender,
             "summary": summary
         }
+        if self._fingerprint(point):
+            return self._drop(chat_name, "duplicate")
+
+        admit, evict = self._choose_eviction(chat_name)
+        if not admit:
+            return self._drop(chat_name, evict)
+
+        if evict is not None:
+            self._write({"evict": evict["id"]})
+            self._unindex(evict["id"])
+            self.dropped["evicted"] += 1
+
+        self._write(point)
         self.buffer.append(point)
-        self._save_buffer()
+        self.by_chat.setdefault(chat_name, []).append(point)
+        self.next_id += 1
+        self.eligible[chat_name] = self.eligible.get(chat_name, 0) + 1
+        self.eligible_total += 1
+        self.version += 1
         logger.info(f"Buffered discussion point from {sender} in {chat_name}")
+        return True
+
+    def pending_by_chat(self):
+        """Points not yet covered by a partial summary, per chat."""
+        pending = {}
+        for chat, points in self.by_chat.items():
+            through = self.summarized_through.get(chat, 0)
+            new = [p for p in points if p['id'] > through]
+            if new:
+                pending[chat] = new
+        return pending
+
+    def add_partial(self, chat, through_id, text, point_count):
+        """Records a partial summary covering the chat's points up to through_id."""
+        partial = {
+            "chat": chat,
+            "through_id": through_id,
+            "timestamp": datetime.now().isoformat(),
+            "point_count": point_count,
+            "text": text
+        }
+        self._write({"partial": partial})
+        self._apply_partial(partial)
+        self.version += 1
+
+    def get_digest_text(self):
+        """
+        Input for the daily digest: each chat's partial summaries, plus raw points
+        that arrived after its latest partial. None if nothing was recorded.
+        """
+        pending = self.pending_by_chat()
+        chats = list(dict.fromkeys(list(self.partials) + list(pending)))
+        if not chats:
+            return None
+
+        text = "Here are today's discussions, as hourly summaries per chat:\n\n"
+        for chat in chats:
+            text += f"### {chat}\n"
+            for partial in self.partials.get(chat, []):
+                text += partial['text'].strip() + "\n"
+            text += "".join(f"- [{p['sender']}]: {p['summary']}\n" for p in pending.get(chat, []))
+            text += "\n"
+        return text
 
     def get_all(self):
         """Returns all points in the active buffer."""
         return self.buffer
 
     def get_grouped_text(self):
-        """Returns buffer content formatted for AI summarization."""
+        """Returns buffer content formatted for AI summarization (re-rendered only after changes)."""
         if not self.buffer:
             return None
+        if self._grouped[0] == self.version:
+            return self._grouped[1]
             
         text = "Here are the un-processed discussion points from today:\n\n"
-        grouped = {}
-        for p in self.buffer:
-            chat = p['chat']
-            if chat not in grouped: grouped[chat] = []
-            grouped[chat].append(f"- [{p['sender']}]: {p['summary']}")
-            
-        for chat, points in grouped.items():
-            text += f"### {chat}\n" + "\n".join(points) + "\n\n"
+        for chat, points in self.by_chat.items():
+            text += f"### {chat}\n" + "\n".join(f"- [{p['sender']}]: {p['summary']}" for p in points) + "\n\n"
             
+        self._grouped = (self.version, text)
         return text
 
+    def snapshot(self):
+        """Point counts for readers outside the listener (dashboard)."""
+        return {
+            "points": len(self.buffer),
+            "chats": {chat: len(points) for chat, points in self.by_chat.items()},
+            "version": self.version,
+            "dropped": dict(self.dropped),
+            "dropped_by_chat": {chat: dict(counts) for chat, counts in self.dropped_by_chat.items()}
+        }
+
     def clear(self):
-        """Clears the active buffer."""
-        self.buffer = []
-        self._save_buffer()
+        """Rotates the journal into an archive file and starts an empty buffer."""
+        if self._fh:
+            self._fh.close()
+            self._fh = None
+        if os.path.exists(self.journal_file):
+            # Microseconds plus a counter: rotations in the same instant never overwrite an archive
+            stamp = datetime.now().strftime('%Y-%m-%dT%H%M%S%f')
+            archived = os.path.join(self.dir, f"{stamp}.jsonl")
+            n = 1
+            while os.path.exists(archived):
+                archived = os.path.join(self.dir, f"{stamp}-{n}.jsonl")
+                n += 1
+            os.replace(self.journal_file, archived)
+            self._prune_archives()
+        self._reset()
+        self.version += 1
+
+    def _prune_archives(self):
+        archives = sorted(f for f in os.listdir(self.dir) if f.endswith(".jsonl") and f != "active.jsonl")
+        for name in archives[:-DISCUSSION_ARCHIVE_KEEP]:
+            os.remove(os.path.join(self.dir, name))
+
+    def close(self):
+        if self._fh:
+            self._fh.close()
+            self._fh = None
 
     def archive_daily_summary(self, summary_text):
-        """Archives the generated summary to history."""
-        entry = {
+        """Archives the generated summary to history (one append)."""
+        entry = self.history.append({
             "date": datetime.now().strftime("%Y-%m-%d"),
             "timestamp": datetime.now().isoformat(),
             "summary_text": summary_text,
             "point_count": len(self.buffer)
-        }
-        
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                history = json.load(f)
-        except:
-            history = []
-            
-        history.insert(0, entry) # Newest first
-        
-        with open(HISTORY_FILE, "w") as f:
-            json.dump(history, f, indent=2)
-            
+        })
+        event_bus.publish("digest", entry)
         logger.info("Archived daily discussion summary.")
 
-    def get_history(self):
-        """Returns historical summaries."""
-        try:
-            with open(HISTORY_FILE, "r") as f:
-                return json.load(f)
-        except:
-            return []
+    def get_history(self, cursor=None, limit=30, since=None, until=None, fields=None):
+        """Historical summaries, newest first: {"entries", "next_cursor"}."""
+        return self.history.query(cursor=cursor, limit=limit, since=since, until=until, fields=fields)
@@ -0,0 +1,63 @@
+import asyncio
+import itertools
+import json
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+from config import EVENT_QUEUE_SIZE
+
+
+class EventBus:
+    """
+    In-process fan-out of change events to dashboard streams (/api/events).
+    Each subscriber has a bounded queue; one that falls behind has its backlog
+    replaced by a single "resync" event, telling the client to refetch.
+    """
+
+    def __init__(self, queue_size=None):
+        self.queue_size = queue_size or EVENT_QUEUE_SIZE
+        self._subscribers = set()
+        self._ids = itertools.count(1)
+        self.published = 0
+        self.resyncs = 0
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event_type, data=None):
+        """Queues an event for every subscriber without blocking the publisher."""
+        event = {
+            "id": next(self._ids),
+            "type": event_type,
+            "timestamp": datetime.now().isoformat(),
+            "data": data or {}
+        }
+        self.published += 1
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({**event, "type": "resync", "data": {}})
+                self.resyncs += 1
+        return event
+
+    def get_stats(self):
+        return {"subscribers": len(self._subscribers), "published": self.published, "resyncs": self.resyncs}
+
+
+def format_sse(event):
+    """Serializes an event in text/event-stream framing."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], ensure_ascii=False)}\n\n"
+
+
+# Task, audit and digest changes are published here; server.py streams them
+event_bus = EventBus()
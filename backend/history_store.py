@@ -0,0 +1,105 @@
+import bisect
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+from utils import project_fields
+from config import CONFIG_DIR
+
+HISTORY_JOURNAL = CONFIG_DIR / "daily_history.jsonl"
+LEGACY_HISTORY_FILE = CONFIG_DIR / "daily_history.json"
+
+
+class DailyHistoryStore:
+    """
+    Archived daily digests as an append-only JSONL file.
+    An in-memory index of (date, seq, byte offset) serves date ranges and
+    cursor pages; summary text is only read from disk for returned entries.
+    """
+
+    def __init__(self, path=None, legacy_file=None):
+        self.path = str(path or HISTORY_JOURNAL)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._index = [] # [(date, seq, offset)], in append (chronological) order
+        self._dates = [] # Parallel list of dates for bisect
+        self.next_seq = 1
+
+        self._load_index()
+        self._migrate_legacy(legacy_file or LEGACY_HISTORY_FILE)
+
+    def _load_index(self):
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    self._track(entry, offset)
+                except json.JSONDecodeError:
+                    pass
+                offset += len(line)
+
+    def _track(self, entry, offset):
+        # Archives can arrive out of date order (e.g. migrated data); keep the index sorted by date
+        key = (entry["date"], entry["seq"], offset)
+        i = bisect.bisect_right(self._index, key)
+        self._index.insert(i, key)
+        self._dates.insert(i, entry["date"])
+        self.next_seq = max(self.next_seq, entry["seq"] + 1)
+
+    def _migrate_legacy(self, legacy_file):
+        """Imports the old daily_history.json (newest-first list) once."""
+        if not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r") as f:
+                history = json.load(f)
+        except json.JSONDecodeError:
+            history = []
+        for entry in reversed(history):
+            self.append(entry)
+        os.replace(legacy_file, f"{legacy_file}.migrated")
+        logger.info(f"Migrated {len(history)} daily summaries to {self.path}.")
+
+    def append(self, entry):
+        """Archives one entry (needs a "date"). Returns it with its seq."""
+        entry = {**entry, "seq": self.next_seq}
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        with open(self.path, "ab") as f:
+            f.write(line)
+        self._track(entry, offset)
+        return entry
+
+    def _read(self, offset, f):
+        f.seek(offset)
+        return json.loads(f.readline())
+
+    def query(self, cursor=None, limit=30, since=None, until=None, fields=None):
+        """
+        Newest-first page of entries dated within [since, until] (YYYY-MM-DD, inclusive).
+        `cursor` is the position returned as next_cursor by the previous page.
+        `fields` projects entries, e.g. ["date", "point_count"] to skip summary text.
+        """
+        lo = bisect.bisect_left(self._dates, since) if since else 0
+        hi = bisect.bisect_right(self._dates, until) if until else len(self._dates)
+        if cursor is not None:
+            hi = min(hi, int(cursor))
+
+        start = max(lo, hi - limit)
+        entries = []
+        if hi > start:
+            with open(self.path, "rb") as f:
+                for _, _, offset in reversed(self._index[start:hi]):
+                    entries.append(project_fields(self._read(offset, f), fields, always=("seq", "date")))
+        return {"entries": entries, "next_cursor": start if start > lo else None}
+
+    def get(self, date):
+        """Entries archived for one date."""
+        return self.query(since=date, until=date)["entries"]
+
+    def __len__(self):
+        return len(self._index)
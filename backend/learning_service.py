@@ -1,22 +1,60 @@
 import json
+import hashlib
 import logging
 import asyncio
 import os
-from datetime import datetime, timezone
+import time
+from datetime import datetime
+from rate_limiter import notion_priority, live_traffic, PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
+# Audit entries fetched per journal read while building chunks
+READ_PAGE_SIZE = 500
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), used to size prompts."""
+    return len(text) // 4 + 1
+
+
+def feedback_version(task):
+    """Hash of the feedback content, so an edited or newly commented task is learned from again."""
+    content = json.dumps([task['summary'], task.get('comments', [])])
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def merge_facts(fact_lists):
+    """Flattens per-chunk results, dropping duplicates that differ only in case, spacing or a trailing period."""
+    seen = set()
+    merged = []
+    for facts in fact_lists:
+        for fact in facts:
+            key = " ".join(str(fact).split()).rstrip(".").casefold()
+            if key and key not in seen:
+                seen.add(key)
+                merged.append(str(fact).strip())
+    return merged
+
 class LearningService:
-    def __init__(self, agent_instance, memory_manager, task_manager):
+    def __init__(self, agent_instance, memory_manager, task_manager, state_file=None):
         self.agent = agent_instance
         self.memory_manager = memory_manager
         self.task_manager = task_manager
         from config import CONFIG_DIR
-        self.state_file = CONFIG_DIR / "learning_state.json"
+        self.state_file = state_file or CONFIG_DIR / "learning_state.json"
         
         # Incremental State
-        self.last_ts = None
+        self.last_seq = 0 # Audit journal cursor: every entry up to here has been learned from
+        self.last_ts = None # Pre-journal state, only used to migrate to last_seq
         self.last_feedback_ts = None # Track rejected task processing
+        self.processed_feedback = {} # task id -> feedback_version already learned from
+        self.rules_since_consolidation = 0
+        self.last_run_at = None # Epoch seconds of the last completed learning run
+        self.chunk_failures = {} # str(end seq) -> failed analyses of the chunk ending there
+        self.cooldown_until = None # Epoch seconds; set after a run that hit its budget or failed
+        self.skipped_chunks = [] # Chunks given up on after LEARNING_MAX_CHUNK_ATTEMPTS (dead letters)
+        self._feedback_seen = 0 # task_manager.feedback_changes at the start of the last run
         self._load_state()
 
     def _load_state(self):
@@ -24,77 +62,170 @@ class LearningService:
             try:
                 with open(self.state_file, 'r') as f:
                     data = json.load(f)
+                    self.last_seq = data.get("last_processed_seq", 0)
                     self.last_ts = data.get("last_processed_timestamp")
                     self.last_feedback_ts = data.get("last_feedback_timestamp")
+                    self.processed_feedback = data.get("processed_feedback", {})
+                    self.rules_since_consolidation = data.get("rules_since_consolidation", 0)
+                    self.last_run_at = data.get("last_run_at")
+                    self.chunk_failures = data.get("chunk_failures", {})
+                    self.skipped_chunks = data.get("skipped_chunks", [])
+                    self.cooldown_until = data.get("cooldown_until")
             except Exception as e:
                 logger.error(f"Failed to load learning state: {e}")
 
     def _save_state(self):
         try:
-            with open(self.state_file, 'w') as f:
+            tmp = f"{self.state_file}.tmp"
+            with open(tmp, 'w') as f:
                 json.dump({
+                    "last_processed_seq": self.last_seq,
                     "last_processed_timestamp": self.last_ts,
-                    "last_feedback_timestamp": self.last_feedback_ts
+                    "last_feedback_timestamp": self.last_feedback_ts,
+                    "processed_feedback": self.processed_feedback,
+                    "rules_since_consolidation": self.rules_since_consolidation,
+                    "last_run_at": self.last_run_at,
+                    "chunk_failures": self.chunk_failures,
+                    "skipped_chunks": self.skipped_chunks,
+                    "cooldown_until": self.cooldown_until
                 }, f)
+            os.replace(tmp, self.state_file)
         except Exception as e:
             logger.error(f"Failed to save learning state: {e}")
 
-    async def digest_context(self, batch_size=200):
+    async def _next_chunks(self, count, chunk_tokens):
         """
-        Incremental Learning: Reads new audit logs and asks AI for broad context facts.
+        Reads up to `count` chunks after the cursor, each at most `chunk_tokens` of history.
+        Returns [(last_seq, history_text)]; text is empty if every entry was already learned.
         """
-        logger.info("Running Incremental Context Learning...")
-        
-        # 1. Fetch Audit Logs
-        all_logs = await self.task_manager.get_audit_log(limit=1000) # Get deep history
-        if not all_logs: 
-            return
+        chunks = []
+        lines, size, end_seq = [], 0, self.last_seq
+        cursor = self.last_seq
+        while len(chunks) < count:
+            entries = await self.task_manager.read_audit_since(cursor, limit=READ_PAGE_SIZE)
+            if not entries:
+                break
+            for e in entries:
+                cursor = e['seq']
+                # Entries covered by a timestamp-based state were learned before the journal
+                if self.last_ts and e.get('timestamp', '') <= self.last_ts:
+                    end_seq = cursor
+                    continue
 
-        # 2. Filter New Logs
-        new_logs = []
-        if not self.last_ts:
-            new_logs = all_logs[:batch_size] # First run: take most recent batch_size
-        else:
-            for log in all_logs:
-                if log['timestamp'] > self.last_ts:
-                    new_logs.append(log)
-            # Re-sort to chronological for coherent reading if needed, but reverse is fine for check
-        
-        if not new_logs:
-            logger.info("No new logs to learn from.")
-            return
+                line = f"[{e['timestamp']}] {e['sender']}: {e['text']}"[:chunk_tokens * 4]
+                cost = estimate_tokens(line)
+                if lines and size + cost > chunk_tokens:
+                    chunks.append((end_seq, "\n".join(lines)))
+                    lines, size = [], 0
+                    if len(chunks) == count:
+                        return chunks
+                lines.append(line)
+                size += cost
+                end_seq = cursor
+        if lines or end_seq != self.last_seq:
+            chunks.append((end_seq, "\n".join(lines)))
+        return chunks
 
-        # Update TS to the most recent log in this batch (which is at index 0 because get_audit_log returns desc)
-        most_recent_ts = new_logs[0]['timestamp']
+    def _give_up_on(self, after_seq, end_seq, max_attempts):
+        """Counts a failed analysis; True once the chunk has failed `max_attempts` times and is skipped."""
+        key = str(end_seq)
+        self.chunk_failures[key] = self.chunk_failures.get(key, 0) + 1
+        if self.chunk_failures[key] < max_attempts:
+            return False
+        del self.chunk_failures[key]
+        self.skipped_chunks = (self.skipped_chunks + [{
+            "after_seq": after_seq,
+            "through_seq": end_seq,
+            "attempts": max_attempts,
+            "skipped_at": datetime.now().isoformat()
+        }])[-50:]
+        logger.error(f"Skipping audit entries {after_seq + 1}-{end_seq}: analysis failed {max_attempts} times.")
+        return True
 
-        # limit batch size
-        new_logs = new_logs[:batch_size]
+    async def digest_context(self, chunk_tokens=None, max_concurrency=None, token_budget=None):
+        """
+        Incremental Learning: Map-reduce over the audit journal from the persisted cursor.
+        The backlog is split into token-bounded chunks, analyzed concurrently (at most
+        `max_concurrency` at a time), and the facts are merged and deduped locally before
+        being saved. The cursor is checkpointed after each wave of chunks; a run stops once
+        `token_budget` prompt tokens are spent and resumes there next time.
+        Returns "done", "budget" (backlog left over) or "failed".
+        """
+        from config import USER_NAME, LEARNING_CHUNK_TOKENS, LEARNING_MAX_CONCURRENCY, LEARNING_RUN_TOKEN_BUDGET, LEARNING_MAX_CHUNK_ATTEMPTS
+        from utils import gemini_breaker
+        chunk_tokens = chunk_tokens or LEARNING_CHUNK_TOKENS
+        max_concurrency = max_concurrency or LEARNING_MAX_CONCURRENCY
+        token_budget = token_budget or LEARNING_RUN_TOKEN_BUDGET
+        logger.info("Running Incremental Context Learning...")
 
-        # 3. Format for AI
-        history_text = "\n".join([f"[{l['timestamp']}] {l['sender']}: {l['text']}" for l in new_logs])
-        
-        from config import USER_NAME
-        
-        # 4. Analyze
-        facts = await self.agent.analyze_context_batch(history_text, USER_NAME)
-        
-        # 5. Save Facts
         added_count = 0
-        if facts:
-            for fact in facts:
-                if self.memory_manager.add_memory(fact):
-                    added_count += 1
-        
-        logger.info(f"Context Learning Complete. Added {added_count} new facts.")
-        
-        # 6. Save State
-        self.last_ts = most_recent_ts
-        self._save_state()
+        analyzed = 0
+        spent = 0
+        outcome = "done"
+        while True:
+            if spent >= token_budget:
+                outcome = "budget"
+                break
+            await live_traffic.wait_idle()
+
+            # 1. Map: one wave of chunks, analyzed in parallel
+            chunks = await self._next_chunks(max_concurrency, chunk_tokens)
+            if not chunks:
+                break
+
+            async def analyze(text):
+                if not text:
+                    return []
+                return await self.agent.analyze_context_batch(text, USER_NAME)
+
+            results = await asyncio.gather(*(analyze(text) for _, text in chunks))
+            spent += sum(estimate_tokens(text) for _, text in chunks)
+
+            # 2. A chunk that keeps failing while Gemini is healthy is skipped, so it cannot pin the cursor
+            if gemini_breaker.state == gemini_breaker.CLOSED:
+                after_seq = self.last_seq
+                for i, ((end_seq, _), result) in enumerate(zip(chunks, results)):
+                    if result is None and self._give_up_on(after_seq, end_seq, LEARNING_MAX_CHUNK_ATTEMPTS):
+                        results[i] = []
+                    elif result is not None:
+                        self.chunk_failures.pop(str(end_seq), None)
+                    after_seq = end_seq
+
+            # Only the leading run of successful chunks can be checkpointed
+            done = 0
+            while done < len(results) and results[done] is not None:
+                done += 1
+
+            # 3. Reduce: merge and dedupe locally, then save in one batch
+            added_count += self.memory_manager.add_memories(merge_facts(results[:done]), source="context")
+            analyzed += sum(1 for _, text in chunks[:done] if text)
+
+            # 4. Checkpoint (once past the legacy timestamp, the cursor alone is enough)
+            if done:
+                if any(text for _, text in chunks[:done]):
+                    self.last_ts = None
+                self.last_seq = chunks[done - 1][0]
+                self._save_state()
+            if done < len(results):
+                logger.warning(f"Context analysis failed after seq {self.last_seq}; will resume from there.")
+                self._save_state() # Keep the failure counts
+                outcome = "failed"
+                break
+
+        if analyzed:
+            logger.info(f"Context Learning Complete. Analyzed {analyzed} chunks (~{spent} tokens). Added {added_count} new facts.")
+        else:
+            logger.info("No new logs to learn from.")
+        return outcome
 
-    async def learn_from_feedback(self):
+    async def learn_from_feedback(self, consolidate_threshold=None):
         """
         Targeted Correction: Learns from Rejected tasks with comments.
+        Only tasks whose feedback is new or edited since the last run are sent to the AI,
+        and memories are consolidated once enough new rules have accumulated.
         """
+        from config import LEARNING_CONSOLIDATE_THRESHOLD
+        threshold = consolidate_threshold or LEARNING_CONSOLIDATE_THRESHOLD
         logger.info("Running Feedback Learning Loop...")
         
         # 1. Fetch Rejected Tasks with Comments
@@ -104,58 +235,90 @@ class LearningService:
             logger.info("No rejected tasks with comments found.")
             return
 
-        # 2. Filter New Rejections (Naive implementation: Check if we processed this specific batch?)
-        # Since we don't have timestamps on tasks easily in the compact returned dict, we'll try to rely 
-        # on the content or just process. 
-        # Better: Filter by comments that we haven't seen? 
-        # For MVP: We will process everything but rely on MemoryManager deduplication.
-        # Ideally, we should store IDs of processed tasks. 
-        # Let's assume we can re-process safely because 'add_memory' is idempotent for exact string matches.
-        # But if the AI generates different strings, we get dupes. 
-        # Let's filter by checking if any 'new' tasks exist?
-        # Actually, let's just process. The cost is low (periodic).
+        # 2. Keep only feedback we have not learned from (new tasks, new or edited comments)
+        pending = {t['id']: feedback_version(t) for t in rejected_tasks}
+        new_tasks = [t for t in rejected_tasks if self.processed_feedback.get(t['id']) != pending[t['id']]]
+        if not new_tasks:
+            logger.info("No new feedback since the last run.")
+            return
         
         # 3. Format for AI
         feedback_text = ""
-        count = 0
-        for t in rejected_tasks:
+        for t in new_tasks:
             feedback_text += f"- Task: {t['summary']}\n  Comments: {', '.join(t['comments'])}\n"
-            count += 1
-            
-        if not feedback_text:
-            return
 
-        # 4. Analyze
+        # 4. Analyze (failed calls leave the tasks pending for the next run)
+        await live_traffic.wait_idle()
         rules = await self.agent.analyze_feedback_batch(feedback_text)
+        if rules is None:
+            return
         
         # 5. Save Rules
-        added_count = 0
-        if rules:
-            for rule in rules:
-                if self.memory_manager.add_memory(rule):
-                    added_count += 1
+        added_count = self.memory_manager.add_memories(merge_facts([rules]), source="feedback")
                     
-        logger.info(f"Feedback Learning Complete. Processed {count} tasks. Learned {added_count} new rules.")
+        logger.info(f"Feedback Learning Complete. Processed {len(new_tasks)} tasks. Learned {added_count} new rules.")
         
-        # Update timestamp if we had one (Using current time as a proxy for 'run time')
+        for t in new_tasks:
+            self.processed_feedback[t['id']] = pending[t['id']]
+        self.rules_since_consolidation += added_count
         self.last_feedback_ts = datetime.now().isoformat()
         self._save_state()
         
-        # Trigger Consolidation if needed
-        await self.memory_manager.consolidate_memories(self.agent)
+        # Consolidate only once enough new rules have piled up
+        if self.rules_since_consolidation >= threshold:
+            await self.memory_manager.consolidate_memories(self.agent)
+            self.rules_since_consolidation = 0
+            self._save_state()
+
+    def pending_work(self):
+        """New audit entries and feedback events since the last run."""
+        return {
+            "audit": max(0, self.task_manager.audit_latest_seq() - self.last_seq),
+            "feedback": max(0, self.task_manager.feedback_changes - self._feedback_seen)
+        }
+
+    def should_run(self, now=None):
+        """
+        True once enough new work piled up, or when the last run is older than the staleness cap.
+        Never during the cooldown after a run that hit its token budget or failed, which is what
+        bounds spend when the backlog stays above the trigger.
+        """
+        from config import LEARNING_AUDIT_TRIGGER, LEARNING_FEEDBACK_TRIGGER, LEARNING_MAX_STALENESS
+        now = now or time.time()
+        if self.cooldown_until and now < self.cooldown_until:
+            return False
+        pending = self.pending_work()
+        if pending["audit"] >= LEARNING_AUDIT_TRIGGER or pending["feedback"] >= LEARNING_FEEDBACK_TRIGGER:
+            return True
+        # Notion edits made outside the app are not counted, so staleness always triggers a run
+        return now - (self.last_run_at or 0) >= LEARNING_MAX_STALENESS
+
+    async def run_once(self):
+        """One learning job in the background lane."""
+        self._feedback_seen = self.task_manager.feedback_changes
+        # Learning never competes with live messages for Notion capacity
+        from config import LEARNING_COOLDOWN_SECONDS
+        with notion_priority(PRIORITY_BACKGROUND):
+            outcome = await self.digest_context()
+            await self.learn_from_feedback()
+        self.last_run_at = time.time()
+        self.cooldown_until = self.last_run_at + LEARNING_COOLDOWN_SECONDS if outcome != "done" else None
+        if self.cooldown_until:
+            logger.info(f"Context learning ended with '{outcome}'; next run in {LEARNING_COOLDOWN_SECONDS}s at the earliest.")
+        self._save_state()
 
     async def start_scheduler(self):
-        """Background loop."""
+        """Background loop: checks the volume/staleness triggers every LEARNING_CHECK_SECONDS."""
+        from config import LEARNING_CHECK_SECONDS
         # Wait 30s on startup to let system stabilize and finish catch-up
         await asyncio.sleep(30)
         logger.info("Learning Service Scheduler Started.")
         while True:
             try:
-                await self.digest_context()
-                await self.learn_from_feedback()
-                
-                # Sleep 6 hours
-                await asyncio.sleep(6 * 3600)
+                if self.should_run():
+                    logger.info(f"Learning triggered: {self.pending_work()}")
+                    await self.run_once()
+                await asyncio.sleep(LEARNING_CHECK_SECONDS)
             except asyncio.CancelledError:
                 logger.info("Learning Scheduler stopped.")
                 break
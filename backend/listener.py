@@ -3,7 +3,7 @@ import pyrogram
 import json
 from config import API_ID, API_HASH, SESSION_STRING, GROUP_TRIGGER_KEYWORDS, ENABLE_AUTO_REPLY, ENABLE_LONG_TERM_MEMORY, WORKING_HOURS_START, WORKING_HOURS_END, CATCH_UP_SECONDS, is_auto_reply_enabled, USER_NAME
 from agent import Agent
-from task_manager import TaskManager
+from task_manager import TaskManager, create_task_manager
 import logging
 from pathlib import Path
 import asyncio
@@ -11,25 +11,32 @@ import os
 import sys
 from datetime import datetime
 import session_manager
+from rate_limiter import notion_priority, live_traffic, PRIORITY_LIVE, PRIORITY_BACKGROUND
 
 logger = logging.getLogger(__name__)
 
 # Initialize Agent & Task Manager
 intelligence_agent = Agent()
-tm = TaskManager()
+tm = create_task_manager()
 from discussion_buffer import DiscussionBuffer
 discussion_buffer = DiscussionBuffer()
+from digest_summarizer import DigestSummarizer
+digest_summarizer = DigestSummarizer(intelligence_agent, discussion_buffer)
 from memory_manager import MemoryManager
 memory_manager = MemoryManager()
 from auto_session_manager import AutoSessionManager
 auto_session = AutoSessionManager()
 
+from context_cache import ContextBundleCache
+context_cache = ContextBundleCache(memory_manager, tm)
+
 from message_processor import MessageProcessor
 processor = MessageProcessor(
     agent=intelligence_agent,
     task_service=tm,
     memory_manager=memory_manager,
-    auto_session_manager=auto_session
+    auto_session_manager=auto_session,
+    context_cache=context_cache
 )
 
 # Initialize Client
@@ -81,11 +88,6 @@ async def message_handler(client, message):
 
     context_text = "\n".join(history)
 
-    logger.info("Step 2: Fetching Context & Preferences from Notion...")
-    # Get Memory & Learning Context
-    recent_done = await tm.get_recent_done_tasks(limit=5)
-    preferences = await tm.get_preference_examples(limit=5)
-    
     my_info = await client.get_me() 
     
     # Name Priority: Config > Username > First Name > "User"
@@ -113,9 +115,7 @@ async def message_handler(client, message):
     analysis = await processor.process_message(
         message_data=msg_data,
         history_text=context_text,
-        my_name=my_name,
-        user_preferences=preferences,
-        recent_tasks=recent_done
+        my_name=my_name
     )
 
     logger.info(f"Step 4: AI Analysis Complete (P{analysis.get('priority', 4)}): {analysis.get('summary')}")
@@ -137,7 +137,7 @@ async def message_handler(client, message):
 
         try:
             logger.info(f"DEBUG: Calling handle_session_turn with my_name='{my_name}'")
-            turn_result = await intelligence_agent.handle_session_turn(history, memory_manager.get_memories_text(), my_name)
+            turn_result = await intelligence_agent.handle_session_turn(history, context_cache.memory_text(), my_name)
             logger.info(f"DEBUG: Session Turn Result: {turn_result}")
         except Exception as e:
             logger.error(f"CRITICAL ERROR calling handle_session_turn: {e}")
@@ -183,7 +183,7 @@ async def message_handler(client, message):
 
     # SAVE MEMORY
     if ENABLE_LONG_TERM_MEMORY and analysis.get('save_memory'):
-        memory_manager.add_memory(analysis['save_memory'])
+        memory_manager.add_memory(analysis['save_memory'], source="message")
 
     # AUDIT LOG MOVED TO END
 
@@ -290,6 +290,11 @@ async def message_handler(client, message):
     except Exception as e:
         logger.error(f"Audit log failed: {e}")
 
+async def live_message_handler(client, message):
+    """Entry point for live updates: their Notion calls jump ahead of background work."""
+    with notion_priority(PRIORITY_LIVE), live_traffic.track():
+        await message_handler(client, message)
+
 async def group_digest_listener(client, message):
     """Buffers group messages for daily summary."""
     # Only process Group/Supergroup
@@ -317,12 +322,12 @@ async def command_handler(client, message):
         logger.info("Generating On-Demand Summary...")
         await message.reply("🔄 Generating Group Discussion Digest...")
         
-        buffer_text = discussion_buffer.get_grouped_text()
-        if not buffer_text:
+        with notion_priority(PRIORITY_LIVE):
+            summary = await digest_summarizer.build_digest()
+        if not summary:
              await message.reply("📭 No discussions recorded today.")
              return
              
-        summary = await intelligence_agent.summarize_discussions(buffer_text)
         await message.reply(summary)
         
         # Archive it? command usually implies just viewing. 
@@ -342,17 +347,23 @@ async def send_daily_briefing(app: Client, tm: TaskManager):
         for t in data['top_tasks']:
             task_text += f"- (P{t['priority']}) {t['summary']}\n"
     
+    if data.get('overdue_tasks'):
+        task_text += "\n**⚠️ Overdue:**\n"
+        for t in data['overdue_tasks']:
+             task_text += f"- {t['summary']} (due {t.get('deadline_date')})\n"
+
     if data['deadline_tasks']:
         task_text += "\n**📅 Upcoming Deadlines:**\n"
         for t in data['deadline_tasks']:
-             task_text += f"- {t['summary']} ({t.get('deadline')})\n"
+             due = f"{t.get('deadline_date')}, " if t.get('deadline_date') else ""
+             task_text += f"- {t['summary']} ({due}{t.get('deadline')})\n"
              
     # Part 2: Group Digest
     digest_text = ""
-    buffer_content = discussion_buffer.get_grouped_text()
-    if buffer_content:
-        logger.info("Summarizing Group Discussions...")
-        digest_text = await intelligence_agent.summarize_discussions(buffer_content)
+    # Reduces the hourly partial summaries (plus the last hour's raw points)
+    digest_text = await digest_summarizer.build_digest() or ""
+    if digest_text:
+        logger.info("Summarized Group Discussions.")
         # Archive
         discussion_buffer.archive_daily_summary(digest_text)
         discussion_buffer.clear() # Clear buffer after daily report
@@ -452,6 +463,10 @@ async def run_catch_up(app: Client, dynamic_keywords):
     """Scans recent dialogs for missed messages during downtime."""
     logger.info("♻️ Running Startup Catch-Up...")
     
+    with notion_priority(PRIORITY_BACKGROUND):
+        await _run_catch_up(app, dynamic_keywords)
+
+async def _run_catch_up(app: Client, dynamic_keywords):
     # 0. Pre-fetch existing tasks for Deduplication
     existing_tasks = await tm.get_tasks()
     existing_links = set()
@@ -571,7 +586,7 @@ async def start_listener():
     app.add_handler(handlers.MessageHandler(command_handler, filters.command("summary") & filters.me), group=2)
     
     # Existing Handler (Priority Logic)
-    app.add_handler(handlers.MessageHandler(message_handler, 
+    app.add_handler(handlers.MessageHandler(live_message_handler, 
         filters.private | filters.mentioned | filters.chat("me") | custom_relevance_filter
     ), group=0)
 
@@ -609,6 +624,7 @@ async def start_listener():
     
     # Start Scheduler
     asyncio.create_task(scheduler(app, tm))
+    asyncio.create_task(digest_summarizer.start_scheduler())
 
     try:
         await app.send_message("me", "⚡ **Agent Just Started** ⚡\n_Group Digest Active._")
@@ -0,0 +1,426 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import uuid
+from contextlib import closing
+from datetime import datetime, date
+
+from task_manager import TaskManager
+from comment_store import CommentStore
+from deadline_index import parse_deadline, reference_date, window_bounds
+
+logger = logging.getLogger(__name__)
+
+from config import TASK_DB_PATH, TASK_REPLICATE_TO_NOTION, NOTION_TOKEN, NOTION_DATABASE_ID
+
+TASK_COLUMNS = "id, summary, status, priority, sender, link, deadline, deadline_date, notion_page_id, created_at, updated_at"
+
+class LocalTaskManager(TaskManager):
+    """
+    SQLite-backed TaskService. Reads and writes never wait on the network;
+    Notion (if enabled) is replicated in the background.
+    """
+
+    def __init__(self, db_path=None, replicate_to_notion=None):
+        super().__init__()
+        self.db_path = str(db_path or TASK_DB_PATH)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+        # Comments share the task database, keyed by local task ID
+        self.comment_store = CommentStore(self.db_path)
+
+        self.replicate = TASK_REPLICATE_TO_NOTION if replicate_to_notion is None else replicate_to_notion
+        if self.replicate and not (NOTION_TOKEN and NOTION_DATABASE_ID):
+            logger.warning("Notion replication enabled but Notion is not configured. Replication disabled.")
+            self.replicate = False
+        self._replication_locks = {}
+        self._pending_replication = set()
+
+    def _init_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id TEXT PRIMARY KEY,
+                    summary TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    sender TEXT,
+                    link TEXT,
+                    deadline TEXT,
+                    deadline_date TEXT,
+                    notion_page_id TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status, updated_at);
+                CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks (status, priority);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_link ON tasks (link) WHERE link IS NOT NULL;
+                -- Notion writes not yet confirmed; one row per (task, kind of change)
+                CREATE TABLE IF NOT EXISTS replication_outbox (
+                    task_id TEXT NOT NULL,
+                    action TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    queued_at TEXT NOT NULL,
+                    PRIMARY KEY (task_id, action)
+                );
+            """)
+            # Databases created before deadline parsing: add and backfill the column
+            columns = [r["name"] for r in self.conn.execute("PRAGMA table_info(tasks)")]
+            if "deadline_date" not in columns:
+                self.conn.execute("ALTER TABLE tasks ADD COLUMN deadline_date TEXT")
+                rows = self.conn.execute(
+                    "SELECT id, deadline, created_at FROM tasks WHERE deadline IS NOT NULL AND deadline != ''"
+                ).fetchall()
+                for r in rows:
+                    parsed = parse_deadline(r["deadline"], reference_date(r["created_at"]))
+                    if parsed:
+                        self.conn.execute("UPDATE tasks SET deadline_date = ? WHERE id = ?", (parsed.isoformat(), r["id"]))
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_deadline ON tasks (status, deadline_date)")
+
+    def _row_to_task(self, row, comments=None):
+        return {
+            "id": row["id"],
+            "summary": row["summary"],
+            "status": row["status"],
+            "priority": row["priority"],
+            "sender": row["sender"] or "",
+            "link": row["link"] or "",
+            "deadline": row["deadline"] or "",
+            "deadline_date": row["deadline_date"],
+            "comments": comments if comments is not None else self.comment_store.list(row["id"])[::-1],
+            "notion_page_id": row["notion_page_id"]
+        }
+
+    def _query(self, sql, params=()):
+        with closing(self.conn.execute(sql, params)) as cur:
+            return cur.fetchall()
+
+    def _get_row(self, task_id):
+        rows = self._query(f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?", (task_id,))
+        return rows[0] if rows else None
+
+    def _update(self, task_id, **fields):
+        fields["updated_at"] = datetime.now().isoformat()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self.conn:
+            cur = self.conn.execute(f"UPDATE tasks SET {assignments} WHERE id = ?", (*fields.values(), task_id))
+        return cur.rowcount > 0
+
+    # --- Notion replication ---
+
+    def _replicate(self, task_id, action):
+        """Queues one change in the outbox and schedules a background push to Notion."""
+        if not self.replicate:
+            return
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO replication_outbox (task_id, action, queued_at) VALUES (?, ?, ?)",
+                (task_id, action, datetime.now().isoformat())
+            )
+        self._schedule_replication(task_id)
+
+    def _schedule_replication(self, task_id):
+        task = asyncio.create_task(self._run_replication(task_id))
+        self._pending_replication.add(task)
+        task.add_done_callback(self._pending_replication.discard)
+
+    def retry_replication(self):
+        """Schedules every task with outbox rows (startup, and after a push succeeds again)."""
+        if not self.replicate:
+            return 0
+        task_ids = [r["task_id"] for r in self._query("SELECT DISTINCT task_id FROM replication_outbox")]
+        for task_id in task_ids:
+            lock = self._replication_locks.get(task_id)
+            if lock is None or not lock.locked():
+                self._schedule_replication(task_id)
+        return len(task_ids)
+
+    async def _push(self, task_id, action):
+        """Applies one outbox row to Notion. Returns False if it has to wait for the page creation."""
+        row = self._get_row(task_id)
+        if row is None:
+            return True
+
+        if action == "create":
+            if row["notion_page_id"]:
+                return True
+            task = dict(row)
+            task["sender"] = task["sender"] or "Unknown"
+            page_id = await self.notion_sync.create_task_page(task)
+            if not page_id:
+                raise RuntimeError("Notion returned no page id")
+            with self.conn:
+                self.conn.execute("UPDATE tasks SET notion_page_id = ? WHERE id = ?", (page_id, task_id))
+            return True
+
+        page_id = row["notion_page_id"]
+        if not page_id:
+            # Page never created (e.g. the create failed before the outbox existed): queue it first
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO replication_outbox (task_id, action, queued_at) VALUES (?, 'create', ?)",
+                    (task_id, datetime.now().isoformat())
+                )
+            return False
+        if action == "status":
+            await self.notion_sync.update_task_status(page_id, row["status"])
+        elif action == "priority":
+            await self.notion_sync.update_task_priority(page_id, row["priority"])
+        elif action == "comments":
+            await self.notion_sync.replicate_comments(page_id, self.comment_store.list(task_id))
+        return True
+
+    async def _run_replication(self, task_id):
+        # Serialize per task so a status change never overtakes the page creation
+        lock = self._replication_locks.setdefault(task_id, asyncio.Lock())
+        pushed = False
+        async with lock:
+            while True:
+                rows = self._query(
+                    "SELECT action, attempts FROM replication_outbox WHERE task_id = ? "
+                    "ORDER BY action = 'create' DESC, rowid",
+                    (task_id,)
+                )
+                if not rows:
+                    break
+                action = rows[0]["action"]
+                try:
+                    done = await self._push(task_id, action)
+                except Exception as e:
+                    logger.error(f"Notion replication ({action}) failed for task {task_id}; will retry: {e}")
+                    with self.conn:
+                        self.conn.execute(
+                            "UPDATE replication_outbox SET attempts = attempts + 1, last_error = ? WHERE task_id = ? AND action = ?",
+                            (str(e)[:500], task_id, action)
+                        )
+                    return
+                if done:
+                    pushed = True
+                    with self.conn:
+                        self.conn.execute("DELETE FROM replication_outbox WHERE task_id = ? AND action = ?", (task_id, action))
+        if pushed and self._query("SELECT 1 FROM replication_outbox WHERE attempts > 0 LIMIT 1"):
+            # Notion is reachable again: push what earlier failures left behind, for every task
+            self.retry_replication()
+
+    async def start_replication_retries(self):
+        """Background loop retrying the outbox, backing off while Notion stays unreachable."""
+        from config import TASK_REPLICATION_RETRY_SECONDS, TASK_REPLICATION_RETRY_MAX_SECONDS
+        if not self.replicate:
+            return
+        delay = TASK_REPLICATION_RETRY_SECONDS
+        while True:
+            try:
+                await asyncio.sleep(delay)
+                if self.retry_replication():
+                    await self.flush_replication()
+                if self._query("SELECT 1 FROM replication_outbox WHERE attempts > 0 LIMIT 1"):
+                    delay = min(delay * 2, TASK_REPLICATION_RETRY_MAX_SECONDS)
+                    logger.warning(f"Notion replication still failing; next retry in {delay}s")
+                else:
+                    delay = TASK_REPLICATION_RETRY_SECONDS
+            except asyncio.CancelledError:
+                logger.info("Replication retries stopped.")
+                break
+            except Exception as e:
+                logger.error(f"Replication retry error: {e}")
+
+    async def flush_replication(self):
+        """Waits for queued Notion writes (used on shutdown and in tests)."""
+        while self._pending_replication:
+            await asyncio.gather(*list(self._pending_replication), return_exceptions=True)
+
+    # --- TaskService ---
+
+    async def add_task(self, priority: int, summary: str, sender: str, link: str, deadline: str = None, user_id: int = None):
+        """Adds a new task to the local store."""
+        logger.info(f"Adding task locally: {summary}")
+
+        # Check if task already exists (Deduplication via unique link index)
+        if link:
+            rows = self._query("SELECT id, status FROM tasks WHERE link = ?", (link,))
+            if rows:
+                logger.info(f"Task already exists (ID: {rows[0]['id']}). Skipping addition.")
+                return {
+                    "id": rows[0]["id"],
+                    "summary": summary,
+                    "priority": priority,
+                    "status": rows[0]["status"],
+                    "is_new": False
+                }
+
+        task_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        parsed = parse_deadline(deadline) if deadline else None
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO tasks ({TASK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, summary, "active", int(priority), sender, link or None, deadline,
+                 parsed.isoformat() if parsed else None, None, now, now)
+            )
+        self._changed("created", self._row_to_task(self._get_row(task_id), comments=[]))
+        self._replicate(task_id, "create")
+
+        return {
+            "id": task_id,
+            "summary": summary,
+            "priority": priority,
+            "status": "active",
+            "is_new": True
+        }
+
+    async def _set_status(self, task_id, status):
+        if self._update(task_id, status=status):
+            self._changed("status", {"id": task_id, "status": status})
+            self._replicate(task_id, "status")
+
+    async def mark_done(self, task_id: str):
+        logger.info(f"Marking task done: {task_id}")
+        await self._set_status(task_id, "done")
+
+    async def reject_task(self, task_id: str):
+        logger.info(f"Marking task rejected: {task_id}")
+        await self._set_status(task_id, "rejected")
+        self.feedback_changes += 1
+
+    async def reopen_task(self, task_id: str):
+        logger.info(f"Reopening task: {task_id}")
+        await self._set_status(task_id, "active")
+
+    def _can_diff(self):
+        return True # Every change goes through this service
+
+    async def _refresh_known(self):
+        pass # Nothing changes behind this service's back
+
+    async def _lookup_tasks(self, task_ids):
+        if not task_ids:
+            return {}
+        rows = self._query(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE id IN ({', '.join('?' * len(task_ids))})",
+            task_ids
+        )
+        return {r["id"]: self._row_to_task(r) for r in rows}
+
+    async def _apply_operation(self, op):
+        if self._get_row(op.get("id")) is None:
+            raise KeyError(f"Task not found: {op.get('id')}")
+        await super()._apply_operation(op)
+
+    async def get_tasks(self):
+        """Returns all tasks, most recently updated first."""
+        rows = self._query(f"SELECT {TASK_COLUMNS} FROM tasks ORDER BY updated_at DESC, rowid DESC")
+        return [self._row_to_task(r) for r in rows]
+
+    def _tasks_by_status(self, status, limit, with_comments_only=False):
+        rows = self._query(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE status = ? ORDER BY updated_at DESC, rowid DESC",
+            (status,)
+        )
+        tasks = []
+        for r in rows:
+            task = self._row_to_task(r)
+            if with_comments_only and not task["comments"]:
+                continue
+            tasks.append(task)
+            if len(tasks) >= limit:
+                break
+        return tasks
+
+    async def get_recent_done_tasks(self, limit: int = 5):
+        return self._tasks_by_status("done", limit)
+
+    async def get_preference_examples(self, limit: int = 5):
+        def compact(t):
+            return {
+                "summary": t['summary'],
+                "sender": t.get("sender", "Unknown"),
+                "priority": t.get("priority", 3),
+                "comments": [c['text'] for c in t.get("comments", [])]
+            }
+        return {
+            "accepted": [compact(t) for t in self._tasks_by_status("done", limit)],
+            "rejected": [compact(t) for t in self._tasks_by_status("rejected", limit)]
+        }
+
+    async def get_rejected_tasks_with_comments(self, limit: int = 50):
+        return [
+            {
+                "id": t['id'],
+                "summary": t['summary'],
+                "sender": t.get("sender", "Unknown"),
+                "comments": [c['text'] for c in t.get("comments", [])]
+            }
+            for t in self._tasks_by_status("rejected", limit, with_comments_only=True)
+        ]
+
+    async def get_deadline_tasks(self, window: str = "week", today=None):
+        """Range query on the (status, deadline_date) index."""
+        if window == "unparsed":
+            rows = self._query(
+                f"SELECT {TASK_COLUMNS} FROM tasks WHERE status = 'active' AND deadline_date IS NULL "
+                "AND deadline IS NOT NULL AND deadline != '' ORDER BY updated_at DESC"
+            )
+            return [self._row_to_task(r) for r in rows]
+
+        start, end = window_bounds(window, today)
+        clauses, params = ["status = 'active'", "deadline_date IS NOT NULL"], []
+        if start:
+            clauses.append("deadline_date >= ?")
+            params.append(start.isoformat())
+        if end:
+            clauses.append("deadline_date <= ?")
+            params.append(end.isoformat())
+        rows = self._query(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE {' AND '.join(clauses)} ORDER BY deadline_date, id",
+            params
+        )
+        return [self._row_to_task(r) for r in rows]
+
+    async def get_daily_briefing_tasks(self):
+        top_rows = self._query(
+            f"SELECT {TASK_COLUMNS} FROM tasks WHERE status = 'active' ORDER BY priority DESC LIMIT 3"
+        )
+        today = date.today()
+        return {
+            "top_tasks": [self._row_to_task(r) for r in top_rows],
+            "overdue_tasks": await self.get_deadline_tasks("overdue", today),
+            "deadline_tasks": await self.get_deadline_tasks("upcoming", today) + await self.get_deadline_tasks("unparsed")
+        }
+
+    async def add_comment(self, task_id, text, sender):
+        if self._get_row(task_id) is None:
+            return None
+        comment = {
+            "id": str(uuid.uuid4())[:8],
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "sender": sender,
+            "text": text
+        }
+        self.comment_store.add(task_id, comment)
+        self._update(task_id)
+        self.feedback_changes += 1
+        self._changed("comments", {"id": task_id})
+        self._replicate(task_id, "comments")
+        return comment
+
+    async def get_comments(self, task_id):
+        return self.comment_store.list(task_id)[::-1]
+
+    async def delete_comment(self, task_id, comment_id):
+        if not self.comment_store.delete(task_id, comment_id):
+            return False
+        self._changed("comments", {"id": task_id})
+        self._replicate(task_id, "comments")
+        return True
+
+    async def update_priority(self, task_id, priority):
+        if not self._update(task_id, priority=int(priority)):
+            return False
+        self._changed("priority", {"id": task_id, "priority": int(priority)})
+        self._replicate(task_id, "priority")
+        return True
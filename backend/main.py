@@ -10,7 +10,7 @@ try:
 except RuntimeError:
     asyncio.set_event_loop(asyncio.new_event_loop())
 
-from listener import start_listener, tm, app as client_app, intelligence_agent, memory_manager
+from listener import start_listener, tm, app as client_app, intelligence_agent, memory_manager, discussion_buffer
 import server
 import pyrogram
 
@@ -56,6 +56,7 @@ async def main():
     # Dependency Injection
     server.task_manager = tm
     server.notification_callback = on_task_done
+    server.discussion_buffer = discussion_buffer
 
     if is_setup_mode:
         logger.warning("Agent not configured. Starting in SETUP MODE.")
@@ -73,6 +74,12 @@ async def main():
     
     # 1. Start Telegram Client FIRST
     await start_listener()
+
+    # Retry Notion writes left in the outbox by an earlier run (local task backend)
+    replication_task = None
+    if hasattr(tm, "retry_replication"):
+        tm.retry_replication()
+        replication_task = asyncio.create_task(tm.start_replication_retries())
     
     logger.info("Telegram Client Connected.")
     logger.info("Starting Web Dashboard at http://localhost:8000...")
@@ -126,6 +133,25 @@ async def main():
             await learning_task
         except asyncio.CancelledError:
             pass
+
+        # Stop Notion replication retries (the outbox keeps what is still pending)
+        if replication_task:
+            replication_task.cancel()
+            try:
+                await replication_task
+            except asyncio.CancelledError:
+                pass
+
+        # Persist the audit journal index
+        if tm.audit:
+            tm.audit.close()
+
+        # Push any queued Notion replication (local task backend)
+        if hasattr(tm, "flush_replication"):
+            try:
+                await asyncio.wait_for(tm.flush_replication(), timeout=10.0)
+            except asyncio.TimeoutError:
+                logger.warning("Notion replication flush timed out.")
             
         logger.info("Stopping Telegram Client...")
         if client_app.is_connected:
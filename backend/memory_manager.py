@@ -1,67 +1,290 @@
+import hashlib
 import json
 import logging
 import os
+import sqlite3
+from contextlib import closing
+from datetime import datetime
 
-from config import MEMORY_FILE_PATH
+from config import MEMORY_FILE_PATH, MEMORY_DB_PATH, MEMORY_CONSOLIDATE_MAX_CLUSTERS
+from near_duplicates import MinHasher, shingles, classify
 
 logger = logging.getLogger(__name__)
 
+# Largest group of similar facts sent to the LLM in one prompt
+MAX_CLUSTER_SIZE = 12
+
+
+def fact_hash(fact):
+    """Dedupe key: the fact with case, spacing and a trailing period normalized."""
+    key = " ".join(fact.split()).rstrip(".").casefold()
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 class MemoryManager:
-    def __init__(self, storage_file=None):
+    """
+    Long-term facts in SQLite: a unique hash index makes dedupe O(1),
+    FTS5 (when compiled in) serves keyword lookup, and inserts are batched.
+    """
+
+    def __init__(self, storage_file=None, db_path=None):
         self.storage_file = storage_file or MEMORY_FILE_PATH
-        self.memories = self._load_memories()
+        self.db_path = str(db_path or MEMORY_DB_PATH)
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.has_fts = False
+        self.version = 0 # Bumped on every change, so callers can cache rendered memory
+        self.hasher = MinHasher()
+        self._init_schema()
+        self._migrate_legacy()
 
-    def _load_memories(self):
-        if not os.path.exists(self.storage_file):
-            return []
+    def _init_schema(self):
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS memories (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    fact TEXT NOT NULL,
+                    hash TEXT NOT NULL UNIQUE,
+                    source TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    last_used_at TEXT,
+                    hit_count INTEGER NOT NULL DEFAULT 0,
+                    checked INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS memory_bands (
+                    band TEXT NOT NULL,
+                    memory_id INTEGER NOT NULL,
+                    PRIMARY KEY (band, memory_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_memory_bands_memory ON memory_bands (memory_id);
+                CREATE TRIGGER IF NOT EXISTS memory_bands_ad AFTER DELETE ON memories BEGIN
+                    DELETE FROM memory_bands WHERE memory_id = old.id;
+                END;
+            """)
+            # Stores created before near-duplicate tracking: every fact starts unchecked
+            columns = [r["name"] for r in self.conn.execute("PRAGMA table_info(memories)")]
+            if "checked" not in columns:
+                self.conn.execute("ALTER TABLE memories ADD COLUMN checked INTEGER NOT NULL DEFAULT 0")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_memories_checked ON memories (checked, id)")
+        try:
+            with self.conn:
+                self.conn.executescript("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(fact, content='memories', content_rowid='id');
+                    CREATE TRIGGER IF NOT EXISTS memories_ai AFTER INSERT ON memories BEGIN
+                        INSERT INTO memories_fts (rowid, fact) VALUES (new.id, new.fact);
+                    END;
+                    CREATE TRIGGER IF NOT EXISTS memories_ad AFTER DELETE ON memories BEGIN
+                        INSERT INTO memories_fts (memories_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+                    END;
+                """)
+            self.has_fts = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite FTS5 unavailable, memory search falls back to LIKE: {e}")
+
+    def _migrate_legacy(self):
+        """Imports the old memory.json list once."""
+        if not os.path.exists(self.storage_file) or self.count():
+            return
         try:
             with open(self.storage_file, 'r') as f:
-                data = json.load(f)
-                return data.get("facts", [])
+                facts = json.load(f).get("facts", [])
         except Exception as e:
             logger.error(f"Failed to load memories: {e}")
-            return []
+            return
+        added = self.add_memories(facts, source="memory.json")
+        os.replace(self.storage_file, f"{self.storage_file}.migrated")
+        logger.info(f"Migrated {added} memories to {self.db_path}.")
 
-    def _save_memories(self):
-        try:
-            with open(self.storage_file, 'w') as f:
-                json.dump({"facts": self.memories}, f, indent=2)
-        except Exception as e:
-            logger.error(f"Failed to save memories: {e}")
+    def _query(self, sql, params=()):
+        with closing(self.conn.execute(sql, params)) as cur:
+            return cur.fetchall()
+
+    @property
+    def memories(self):
+        """All facts, oldest first."""
+        return [r["fact"] for r in self._query("SELECT fact FROM memories ORDER BY id")]
 
-    def add_memory(self, fact: str):
+    def count(self):
+        return self._query("SELECT COUNT(*) AS n FROM memories")[0]["n"]
+
+    def add_memories(self, facts, source=None):
+        """Inserts new facts in one transaction. Returns how many were not already known."""
+        now = datetime.now().isoformat()
+        rows = [
+            (fact.strip(), fact_hash(fact), source, now, now)
+            for fact in facts
+            if fact and isinstance(fact, str) and fact.strip()
+        ]
+        if not rows:
+            return 0
+        with self.conn:
+            cur = self.conn.executemany(
+                "INSERT OR IGNORE INTO memories (fact, hash, source, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            added = cur.rowcount # Ignored duplicates do not count
+        if added:
+            self.version += 1
+            logger.info(f"Saved {added} new memories ({len(rows) - added} already known).")
+        return added
+
+    def add_memory(self, fact: str, source=None):
         """Adds a new fact if it doesn't already exist."""
         if not fact or not isinstance(fact, str): return False
-        
-        # Deduplication (Simple exact match)
-        if fact in self.memories:
+        if not self.add_memories([fact], source=source):
             logger.info(f"Memory already exists: {fact}")
             return False
-            
-        self.memories.append(fact)
-        self._save_memories()
         logger.info(f"Memory saved: {fact}")
         return True
 
+    def search(self, query, limit=10):
+        """Keyword lookup, best matches first. Counts a hit on every returned memory."""
+        terms = [t for t in "".join(c if c.isalnum() else " " for c in query).split() if t]
+        if not terms:
+            return []
+        if self.has_fts:
+            rows = self._query(
+                "SELECT m.id, m.fact FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid "
+                "WHERE memories_fts MATCH ? ORDER BY bm25(memories_fts) LIMIT ?",
+                (" OR ".join(f'"{t}"' for t in terms), limit)
+            )
+        else:
+            clauses = " OR ".join("fact LIKE ?" for _ in terms)
+            rows = self._query(
+                f"SELECT id, fact FROM memories WHERE {clauses} ORDER BY id DESC LIMIT ?",
+                (*[f"%{t}%" for t in terms], limit)
+            )
+        if rows:
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE memories SET hit_count = hit_count + 1, last_used_at = ? WHERE id = ?",
+                    [(datetime.now().isoformat(), r["id"]) for r in rows]
+                )
+        return [r["fact"] for r in rows]
+
     def get_memories_text(self):
         """Returns a formatted string of memories for the prompt."""
-        if not self.memories:
+        memories = self.memories
+        if not memories:
             return "No long-term memories yet."
         
-        return "Long-term Memory (Facts):" + "".join([f"\n- {m}" for m in self.memories])
+        return "Long-term Memory (Facts):" + "".join([f"\n- {m}" for m in memories])
 
-    async def consolidate_memories(self, agent_instance):
-        """Uses the Agent to clean up and deduplicate memories."""
-        if not self.memories or len(self.memories) < 5:
-            return
-            
-        logger.info(f"Consolidating {len(self.memories)} memories...")
-        new_memories = await agent_instance.deduplicate_facts(self.memories)
-        
-        if new_memories and len(new_memories) > 0:
-            removed = len(self.memories) - len(new_memories)
-            self.memories = new_memories
-            self._save_memories()
-            logger.info(f"Memory Consolidation Complete. Removed {removed} duplicates.")
-            return True
-        return False
+    # --- Consolidation ---
+
+    def _index_fact(self, memory_id, band_keys, checked=True):
+        """
+        Makes a fact findable by later facts and marks it compared. A fact in an
+        ambiguous cluster stays unchecked (checked=False) until the LLM resolved it.
+        """
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO memory_bands (band, memory_id) VALUES (?, ?)",
+            [(key, memory_id) for key in band_keys]
+        )
+        if checked:
+            self.conn.execute("UPDATE memories SET checked = 1 WHERE id = ?", (memory_id,))
+
+    def _candidates(self, band_keys, exclude_id):
+        marks = ", ".join("?" for _ in band_keys)
+        return self._query(
+            f"SELECT DISTINCT m.id, m.fact FROM memory_bands b JOIN memories m ON m.id = b.memory_id "
+            f"WHERE b.band IN ({marks}) AND m.id != ?",
+            (*band_keys, exclude_id)
+        )
+
+    def find_near_duplicates(self, max_clusters):
+        """
+        Compares unchecked facts (oldest first) against already-checked ones via LSH buckets.
+        Near-exact duplicates are dropped; facts that are only similar are returned as
+        clusters of facts for the LLM. Stops once `max_clusters` are queued.
+        Returns (removed_count, clusters).
+        """
+        removed = 0
+        clusters = []
+        unchecked = self._query("SELECT id, fact FROM memories WHERE checked = 0 ORDER BY id")
+        for row in unchecked:
+            if len(clusters) >= max_clusters:
+                break
+            band_keys = self.hasher.band_keys(self.hasher.signature(shingles(row["fact"])))
+            candidates = {r["fact"]: r["id"] for r in self._candidates(band_keys, row["id"])}
+            kind, match = classify(row["fact"], list(candidates))
+
+            with self.conn:
+                if kind == "duplicate":
+                    logger.info(f"Dropping near-duplicate memory: {row['fact']!r} ~ {match!r}")
+                    self.conn.execute("DELETE FROM memories WHERE id = ?", (row["id"],))
+                    removed += 1
+                    continue
+                self._index_fact(row["id"], band_keys, checked=kind != "ambiguous")
+            if kind == "ambiguous":
+                clusters.append([(row["id"], row["fact"])] + [(candidates[f], f) for f in match[:MAX_CLUSTER_SIZE - 1]])
+
+        if removed:
+            self.version += 1
+        return removed, clusters
+
+    async def _resolve_cluster(self, agent_instance, cluster):
+        """Lets the LLM merge one small cluster, replacing only that cluster's facts."""
+        ids = [memory_id for memory_id, _ in cluster]
+        marks = ", ".join("?" for _ in ids)
+        present = self._query(f"SELECT id, fact FROM memories WHERE id IN ({marks})", ids)
+        if len(present) < 2:
+            self._mark_checked(ids[:1])
+            return 0 # An earlier cluster already merged these
+
+        facts = [r["fact"] for r in present]
+        merged = await agent_instance.deduplicate_facts(facts)
+        if merged is None:
+            return 0 # Call failed: the new fact stays unchecked and is clustered again next run
+        merged = [f.strip() for f in merged if isinstance(f, str) and f.strip()]
+        # An empty or larger answer means the model did not merge anything usable
+        if not merged or len(merged) > len(facts):
+            self._mark_checked(ids[:1])
+            return 0
+
+        kept = {f for f in merged if f in facts}
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM memories WHERE id = ?",
+                [(r["id"],) for r in present if r["fact"] not in kept]
+            )
+        self.add_memories([f for f in merged if f not in kept], source="consolidation")
+        # Merged facts are already compared with their cluster; index them right away
+        with self.conn:
+            for f in merged:
+                if f in kept:
+                    continue
+                rows = self._query("SELECT id FROM memories WHERE hash = ?", (fact_hash(f),))
+                if rows:
+                    self._index_fact(rows[0]["id"], self.hasher.band_keys(self.hasher.signature(shingles(f))))
+        self._mark_checked(ids[:1]) # If the model kept the new fact as is
+        self.version += 1
+        return len(facts) - len(merged)
+
+    def _mark_checked(self, ids):
+        with self.conn:
+            self.conn.executemany("UPDATE memories SET checked = 1 WHERE id = ?", [(i,) for i in ids])
+
+    async def consolidate_memories(self, agent_instance, max_clusters=None):
+        """
+        Incremental consolidation: only facts added since the last run are compared,
+        locally, against the rest. Just the ambiguous clusters (bounded in size and
+        number per run) are sent to the Agent; anything left waits for the next run.
+        """
+        max_clusters = max_clusters or MEMORY_CONSOLIDATE_MAX_CLUSTERS
+        removed, clusters = self.find_near_duplicates(max_clusters)
+
+        for cluster in clusters:
+            removed += await self._resolve_cluster(agent_instance, cluster)
+
+        if removed:
+            logger.info(f"Memory Consolidation Complete. Removed {removed} duplicates ({len(clusters)} clusters sent to the LLM).")
+        return removed > 0
+
+    def get_stats(self):
+        return {"memories": self.count(), "fts": self.has_fts, "version": self.version}
+
+    def close(self):
+        self.conn.close()
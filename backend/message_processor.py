@@ -3,15 +3,17 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 
 from interfaces import TaskService
+from context_cache import render_task_context
 
 logger = logging.getLogger(__name__)
 
 class MessageProcessor:
-    def __init__(self, agent: Any, task_service: TaskService, memory_manager: Any, auto_session_manager: Any):
+    def __init__(self, agent: Any, task_service: TaskService, memory_manager: Any, auto_session_manager: Any, context_cache: Any = None):
         self.agent = agent
         self.task_service = task_service
         self.memory_manager = memory_manager
         self.auto_session_manager = auto_session_manager
+        self.context_cache = context_cache
 
     def should_reply(
         self,
@@ -51,19 +53,15 @@ class MessageProcessor:
         sender = message_data.get('sender', 'Unknown')
         text = message_data.get('text', '')
         
-        # 1. Build Context
-        memory_text = ""
-        if recent_tasks:
-            memory_text += "Recent Finished Tasks:\n" + "\n".join([f"- {t['summary']}" for t in recent_tasks])
-        
-        if user_preferences:
-             memory_text += "\n\nUser Preferences (Learning):\n"
-             memory_text += "ACCEPTED Tasks:\n" + "\n".join([f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "") for t in user_preferences.get('accepted', [])])
-             memory_text += "\nREJECTED Tasks:\n" + "\n".join([f"- [P{t['priority']}] {t['summary']} (from {t['sender']}) " + (f"| Note: {', '.join(t['comments'])}" if t['comments'] else "") for t in user_preferences.get('rejected', [])])
+        # 1. Build Context (pre-rendered and versioned unless the caller supplies its own)
+        if self.context_cache and user_preferences is None and recent_tasks is None:
+            memory_text = await self.context_cache.bundle()
+        else:
+            memory_text = render_task_context(recent_tasks, user_preferences)
 
-        # Long-term memory
-        if self.memory_manager:
-            memory_text += "\n\n" + self.memory_manager.get_memories_text()
+            # Long-term memory
+            if self.memory_manager:
+                memory_text += "\n\n" + self.memory_manager.get_memories_text()
 
         # 2. Analyze
         logger.info(f"Sending to Agent for analysis (Model: {self.agent.model_name})...")
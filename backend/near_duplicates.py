@@ -0,0 +1,96 @@
+import hashlib
+import random
+import re
+
+# Jaccard similarity (word + bigram shingles) above which two facts are the same fact
+DUPLICATE_THRESHOLD = 0.8
+# Between this and DUPLICATE_THRESHOLD a pair is ambiguous and goes to the LLM
+AMBIGUOUS_THRESHOLD = 0.45
+
+# LSH banding: 20 bands of 3 rows. Pairs at J=0.5 become candidates ~94% of the time, at J=0.2 ~15%.
+NUM_BANDS = 20
+ROWS_PER_BAND = 3
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "is", "are",
+    "was", "be", "by", "as", "it", "that", "this", "user", "user's", "they", "their", "he", "she", "his", "her",
+}
+
+WORD_RE = re.compile(r"[\w']+")
+_MERSENNE = (1 << 61) - 1
+
+
+def shingles(text):
+    """Content words plus adjacent word pairs, case-insensitive."""
+    words = [w for w in WORD_RE.findall(text.casefold()) if w not in STOPWORDS]
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def simhash(text, bits=64):
+    """64-bit SimHash over words and word pairs; similar texts differ in few bits."""
+    words = WORD_RE.findall(text.casefold())
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    weights = [0] * bits
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+        for i in range(bits):
+            weights[i] += 1 if (h >> i) & 1 else -1
+    return sum(1 << i for i in range(bits) if weights[i] > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures and LSH band keys for finding near-duplicate candidates."""
+
+    def __init__(self, num_bands=NUM_BANDS, rows_per_band=ROWS_PER_BAND, seed=1):
+        self.num_bands = num_bands
+        self.rows = rows_per_band
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE), rng.randrange(0, _MERSENNE))
+            for _ in range(num_bands * rows_per_band)
+        ]
+
+    def signature(self, shingle_set):
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+            for s in shingle_set
+        ] or [0]
+        return [min((a * h + b) % _MERSENNE for h in hashes) for a, b in self._perms]
+
+    def band_keys(self, signature):
+        """One bucket key per band; facts sharing any key are candidates."""
+        keys = []
+        for i in range(self.num_bands):
+            band = signature[i * self.rows:(i + 1) * self.rows]
+            digest = hashlib.blake2b(repr(band).encode("utf-8"), digest_size=8).hexdigest()
+            keys.append(f"{i}:{digest}")
+        return keys
+
+
+def classify(fact, candidates):
+    """
+    Compares a fact against candidate facts.
+    Returns ("duplicate", match), ("ambiguous", [similar...]) or ("distinct", None).
+    """
+    base = shingles(fact)
+    scored = sorted(
+        ((jaccard(base, shingles(c)), c) for c in candidates),
+        key=lambda pair: pair[0],
+        reverse=True
+    )
+    if scored and scored[0][0] >= DUPLICATE_THRESHOLD:
+        return "duplicate", scored[0][1]
+    similar = [c for score, c in scored if score >= AMBIGUOUS_THRESHOLD]
+    if similar:
+        return "ambiguous", similar
+    return "distinct", None
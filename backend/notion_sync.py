@@ -1,14 +1,49 @@
 from notion_client import AsyncClient
+import asyncio
+import datetime
+import functools
+import hashlib
 import logging
 import os
-from utils import retry_with_backoff
+import re
+import time
+import uuid
+from utils import retry_with_backoff, notion_breaker
+from rate_limiter import notion_limiter, retry_after_from_error, RateLimitedError
+from singleflight import notion_reads
 
 logger = logging.getLogger(__name__)
 
 from config import NOTION_TOKEN, NOTION_DATABASE_ID
 
+# Notion caps each rich_text object at 2000 characters and a property at 100 objects
+NOTION_TEXT_LIMIT = 2000
+NOTION_RICH_TEXT_ITEMS = 100
+
+# Format: [ID] YYYY-MM-DD HH:MM:SS Sender: Text
+COMMENT_LINE_RE = re.compile(r"\[(.*?)\] (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (.*?): (.*)")
+
+@functools.lru_cache(maxsize=1024)
+def _parse_comment_lines(full_text):
+    """Parses AgentComments text into (id, timestamp, sender, text) tuples, oldest first."""
+    parsed = []
+    for line in full_text.split("\n"):
+        if not line.strip(): continue
+        match = COMMENT_LINE_RE.match(line)
+        if match:
+            parsed.append(match.groups())
+        else:
+            # Free text typed into Notion: derive a stable ID so it can still be deleted
+            legacy_id = "legacy-" + hashlib.sha1(line.encode("utf-8")).hexdigest()[:8]
+            parsed.append((legacy_id, "", "Unknown", line))
+    return tuple(parsed)
+
+def _rich_text_content(prop):
+    """Joins every chunk of a rich_text property."""
+    return "".join([t.get("text", {}).get("content", "") for t in prop.get("rich_text", [])])
+
 class NotionSync:
-    def __init__(self, client: AsyncClient = None):
+    def __init__(self, client: AsyncClient = None, comment_store=None):
         self.notion = client
         self.database_id = NOTION_DATABASE_ID
         
@@ -28,6 +63,12 @@ class NotionSync:
         # Local deduplication cache (in-memory, session scoped)
         # Stores links that we have successfully written or confirmed exist
         self._seen_links = set()
+
+        # Comments live in a local store; Notion gets a rendered copy
+        self.comment_store = comment_store
+        self._comment_text_seen = {} # page_id -> last AgentComments text merged
+        self._comments_written_at = {} # page_id -> monotonic time of our last AgentComments write
+        self._comment_locks = {}
         
     def _get_client(self):
         """Lazy initialization of AsyncClient to ensure it attaches to the current loop."""
@@ -39,7 +80,29 @@ class NotionSync:
             logger.info("Notion AsyncClient initialized (Lazy).")
         return self.notion
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    def _get_comment_store(self):
+        """Lazy initialization of the local comment store."""
+        if self.comment_store is None:
+            from comment_store import CommentStore
+            self.comment_store = CommentStore()
+        return self.comment_store
+
+    async def _request(self, method, *args, **kwargs):
+        """Runs one Notion API call through the circuit breaker and the shared rate limiter."""
+        return await notion_breaker.call(self._limited_request, method, *args, **kwargs)
+
+    async def _limited_request(self, method, *args, **kwargs):
+        await notion_limiter.acquire()
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            retry_after = retry_after_from_error(e)
+            if retry_after is None:
+                raise
+            notion_limiter.penalize(retry_after)
+            raise RateLimitedError(retry_after, "Notion API rate limited") from e
+
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
     async def create_task_page(self, task):
         """Creates a page in the database asynchronously."""
         if not self._get_client() or not self.database_id: return None
@@ -79,7 +142,8 @@ class NotionSync:
                 # User requested Text property for reliability
                 properties["Deadline"] = {"rich_text": [{"text": {"content": task.get('deadline')}}]}
 
-            new_page = await self._get_client().pages.create(
+            new_page = await self._request(
+                self._get_client().pages.create,
                 parent={"database_id": self.database_id},
                 properties=properties
             )
@@ -95,7 +159,7 @@ class NotionSync:
             logger.error(f"Failed to sync to Notion: {e}")
             raise e  # Raise to trigger retry
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
     async def update_task_status(self, page_id, status):
         """Updates the status select property asynchronously."""
         if not self.notion or not page_id: return
@@ -108,7 +172,8 @@ class NotionSync:
             }
             status_val = status_map.get(status, "Active")
             
-            await self.notion.pages.update(
+            await self._request(
+                self.notion.pages.update,
                 page_id=page_id,
                 properties={
                     "Status": {
@@ -121,8 +186,12 @@ class NotionSync:
             logger.error(f"Failed to update Notion Page: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
     async def find_task_by_link(self, link):
+        """Checks if a task with the given link already exists (concurrent checks for one link share a query)."""
+        return await notion_reads.do(("find_task_by_link", self.database_id, link), self._find_task_by_link, link)
+
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
+    async def _find_task_by_link(self, link):
         """Checks if a task with the given link already exists using exact property query."""
         if not self._get_client() or not self.database_id or not link: return None
         
@@ -137,7 +206,7 @@ class NotionSync:
             logger.info(f"DEDUPLICATION: Search query for link: {link}")
             
             # Use search (fuzzy) then filter manually (exact)
-            response = await self.notion.search(query=link) 
+            response = await self._request(self.notion.search, query=link) 
             
             results = response.get("results", [])
             logger.info(f"DEDUPLICATION: Found {len(results)} potential matches.")
@@ -161,37 +230,91 @@ class NotionSync:
 
     def _parse_comments_text(self, full_text):
         """Helper to parse raw comment text into structured list."""
-        comments = []
-        if full_text:
-            lines = full_text.split("\n")
-            import re
-            for line in lines:
-                if not line.strip(): continue
-                # Format: [ID] YYYY-MM-DD HH:MM:SS Sender: Text
-                match = re.match(r"\[(.*?)\] (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}) (.*?): (.*)", line)
-                if match:
-                    comments.append({
-                        "id": match.group(1),
-                        "timestamp": match.group(2),
-                        "sender": match.group(3),
-                        "text": match.group(4)
-                    })
-                else:
-                    comments.append({
-                        "id": "unknown",
-                        "timestamp": "",
-                        "sender": "Unknown",
-                        "text": line
-                    })
+        if not full_text:
+            return []
+        comments = [
+            {"id": cid, "timestamp": ts, "sender": sender, "text": text}
+            for cid, ts, sender, text in _parse_comment_lines(full_text)
+        ]
         return comments[::-1] # Newest first
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    def _merge_comments_text(self, page_id, full_text, read_at=None):
+        """
+        Imports comments found in Notion into the local store (only when the text changed).
+        Comments removed from the text in Notion are tombstoned, unless our own write
+        landed after the text was read (`read_at`, monotonic) and it may predate that write.
+        """
+        if self._comment_text_seen.get(page_id) == full_text:
+            return
+        reconcile = read_at is not None and read_at > self._comments_written_at.get(page_id, float("-inf"))
+        removed = self._get_comment_store().merge(page_id, self._parse_comments_text(full_text), reconcile=reconcile)
+        if removed:
+            logger.info(f"{removed} comment(s) deleted in Notion on {page_id}")
+        self._comment_text_seen[page_id] = full_text
+
+    def _render_comment(self, c):
+        if c["id"].startswith("legacy-"):
+            return c["text"] # Verbatim, so it parses back to the same line and ID
+        return f"[{c['id']}] {c['timestamp']} {c['sender']}: {c['text'].replace(chr(10), ' ')}"
+
+    def _render_comments(self, comments):
+        """Renders comments (oldest first) as chunked rich_text objects."""
+        lines = [self._render_comment(c) for c in comments]
+        text = "\n".join(lines)
+
+        max_chars = NOTION_TEXT_LIMIT * NOTION_RICH_TEXT_ITEMS
+        if len(text) > max_chars:
+            # Keep the newest comments; the full history stays in the local store
+            text = text[-max_chars:]
+            text = text[text.find("\n") + 1:]
+            logger.warning(f"AgentComments exceeds {max_chars} chars. Oldest comments kept locally only.")
+
+        return [
+            {"text": {"content": text[i:i + NOTION_TEXT_LIMIT]}}
+            for i in range(0, len(text), NOTION_TEXT_LIMIT)
+        ]
+
+    async def _ensure_comments_seeded(self, page_id):
+        """One-time import of comments written before the local store existed."""
+        if self._get_comment_store().is_seeded(page_id):
+            return
+        read_at = time.monotonic()
+        page = await self._request(self._get_client().pages.retrieve, page_id)
+        full_text = _rich_text_content(page.get("properties", {}).get("AgentComments", {}))
+        self._merge_comments_text(page_id, full_text, read_at)
+
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
+    async def _write_comments(self, page_id, comments=None):
+        """Replicates the page's comments (or the given list, oldest first) to Notion in a single write."""
+        lock = self._comment_locks.setdefault(page_id, asyncio.Lock())
+        async with lock:
+            if comments is None:
+                comments = self._get_comment_store().list(page_id)
+            rich_text = self._render_comments(comments)
+            await self._request(
+                self._get_client().pages.update,
+                page_id=page_id,
+                properties={
+                    "AgentComments": {
+                        "rich_text": rich_text
+                    }
+                }
+            )
+            written = "".join(t["text"]["content"] for t in rich_text)
+            self._comments_written_at[page_id] = time.monotonic()
+            self._comment_text_seen[page_id] = written
+            # Comments cut by the size limit are not in Notion, so their absence there is no deletion
+            self._get_comment_store().mark_in_notion(page_id, [cid for cid, *_ in _parse_comment_lines(written)])
+
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
     async def get_tasks(self):
         """Fetches all tasks from Notion database using search asynchronously."""
         if not self._get_client() or not self.database_id: return []
 
         try:
-            response = await self._get_client().search(
+            read_at = time.monotonic()
+            response = await self._request(
+                self._get_client().search,
                 filter={"value": "page", "property": "object"},
                 sort={"direction": "descending", "timestamp": "last_edited_time"}
             )
@@ -228,9 +351,10 @@ class NotionSync:
                 status = get_select(props.get("Status", {})).lower()
                 summary = get_title(props.get("Name", {}))
                 
-                # Parse comments directly here to avoid N+1 fetches
-                comments_text = get_rich_text(props.get("AgentComments", {}))
-                comments = self._parse_comments_text(comments_text)
+                # Merge comments into the local store (no extra fetches)
+                comments_text = _rich_text_content(props.get("AgentComments", {}))
+                self._merge_comments_text(page["id"], comments_text, read_at)
+                comments = self._get_comment_store().list(page["id"])[::-1]
 
                 # Internal format
                 task = {
@@ -242,7 +366,8 @@ class NotionSync:
                     "link": get_url(props.get("Link", {})),
                     "deadline": get_rich_text(props.get("Deadline", {})),
                     "comments": comments, # Include comments
-                    "notion_page_id": page["id"]
+                    "notion_page_id": page["id"],
+                    "created_time": page.get("created_time")
                 }
                 tasks.append(task)
                 
@@ -251,99 +376,61 @@ class NotionSync:
             logger.error(f"Failed to fetch tasks from Notion: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
     async def get_comments(self, page_id):
-        """Fetches comments from the AgentComments text property."""
+        """Returns comments from the local store (fetching from Notion only for unseen pages)."""
         if not self._get_client() or not page_id: return []
 
         try:
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            full_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            return self._parse_comments_text(full_text)
-            
+            await self._ensure_comments_seeded(page_id)
+            return self._get_comment_store().list(page_id)[::-1]
         except Exception as e:
             logger.error(f"Failed to fetch comments: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
     async def add_comment(self, page_id, text, sender="Unknown"):
-        """Appends a comment to the AgentComments property."""
+        """Appends a comment locally and replicates it to AgentComments in one write."""
         if not self._get_client() or not page_id: return None
         
         try:
-            import datetime
-            import uuid
-            
-            # timestamp
-            now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            comment_id = str(uuid.uuid4())[:8] # Short ID
-            
-            new_line = f"[{comment_id}] {now} {sender}: {text}"
-            
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            updated_text = current_text + ("\n" if current_text else "") + new_line
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
-            logger.info(f"Added comment to {page_id}: {text}")
-            return {
-                "id": comment_id,
-                "timestamp": now,
+            await self._ensure_comments_seeded(page_id)
+
+            comment = {
+                "id": str(uuid.uuid4())[:8], # Short ID
+                "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 "sender": sender,
                 "text": text
             }
+            self._get_comment_store().add(page_id, comment)
         except Exception as e:
             logger.error(f"Failed to add comment: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+        try:
+            await self._write_comments(page_id)
+            logger.info(f"Added comment to {page_id}: {text}")
+        except Exception as e:
+            # Saved locally; the next write for this page replicates it
+            logger.error(f"Comment saved locally but Notion replication failed: {e}")
+        return comment
+
+    async def replicate_comments(self, page_id, comments):
+        """Overwrites AgentComments with comments owned by another store (oldest first)."""
+        if not self._get_client() or not page_id: return False
+        await self._write_comments(page_id, comments)
+        return True
+
     async def delete_comment(self, page_id, comment_id):
-        """Removes a comment line by ID."""
+        """Removes a comment by ID."""
         if not self._get_client() or not page_id: return False
         
         try:
-            # 1. Get existing text
-            page = await self._get_client().pages.retrieve(page_id)
-            props = page.get("properties", {})
-            rich_text = props.get("AgentComments", {}).get("rich_text", [])
-            current_text = "".join([t.get("text", {}).get("content", "") for t in rich_text])
-            
-            if not current_text: return False
-            
-            # 2. Filter lines
-            lines = current_text.split("\n")
-            new_lines = [line for line in lines if f"[{comment_id}]" not in line]
-            
-            if len(lines) == len(new_lines):
+            await self._ensure_comments_seeded(page_id)
+            if not self._get_comment_store().delete(page_id, comment_id):
                 logger.warning(f"Comment {comment_id} not found.")
                 return False
-                
-            updated_text = "\n".join(new_lines)
-            
-            # 3. Update
-            await self._get_client().pages.update(
-                page_id=page_id,
-                properties={
-                    "AgentComments": {
-                        "rich_text": [{"text": {"content": updated_text[:2000]}}]
-                    }
-                }
-            )
+
+            await self._write_comments(page_id)
             logger.info(f"Deleted comment {comment_id} from {page_id}")
             return True
             
@@ -351,13 +438,14 @@ class NotionSync:
             logger.error(f"Failed to delete comment: {e}")
             raise e
 
-    @retry_with_backoff(retries=3, backoff_in_seconds=1)
+    @retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=notion_breaker)
     async def update_task_priority(self, page_id, priority):
         """Updates the Priority number property asynchronously."""
         if not self._get_client() or not page_id: return False
 
         try:
-            await self._get_client().pages.update(
+            await self._request(
+                self._get_client().pages.update,
                 page_id=page_id,
                 properties={
                     "Priority": {
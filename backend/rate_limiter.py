@@ -0,0 +1,305 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger(__name__)
+
+from config import NOTION_RATE_LIMIT, NOTION_RATE_BURST, GEMINI_MAX_CONCURRENCY
+
+# Priority classes (lower value is served first)
+PRIORITY_LIVE = 0        # Incoming Telegram messages
+PRIORITY_DEFAULT = 1     # Dashboard / API requests
+PRIORITY_BACKGROUND = 2  # Catch-up, learning service
+
+PRIORITY_NAMES = {
+    PRIORITY_LIVE: "live",
+    PRIORITY_DEFAULT: "default",
+    PRIORITY_BACKGROUND: "background",
+}
+
+_current_priority = contextvars.ContextVar("notion_priority", default=PRIORITY_DEFAULT)
+
+
+def current_priority():
+    """Returns the priority class of the running task."""
+    return _current_priority.get()
+
+
+@contextmanager
+def notion_priority(level):
+    """Runs the enclosed block (and the coroutines it awaits) under a priority class."""
+    token = _current_priority.set(level)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class RateLimitedError(Exception):
+    """Raised when the remote API answered 429. Carries the server's Retry-After."""
+
+    def __init__(self, retry_after, message="Rate limited"):
+        super().__init__(f"{message} (retry after {retry_after:.1f}s)")
+        self.retry_after = retry_after
+
+
+def retry_after_from_error(error, default=1.0):
+    """Extracts Retry-After seconds from a 429 error, or None if it is not a rate limit."""
+    status = getattr(error, "status", None)
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    if status != 429 and code != "rate_limited":
+        return None
+
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("Retry-After") or headers.get("retry-after")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        # HTTP-date form
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return default
+
+
+class TokenBucketLimiter:
+    """
+    Async token bucket shared by every caller of one API.
+    Waiters are served strictly by priority class, then FIFO.
+    """
+
+    def __init__(self, rate=3.0, burst=3, name="notion", clock=time.monotonic):
+        self.name = name
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self._dispatcher = None
+
+        self._stats = {
+            label: {"acquired": 0, "throttled": 0, "throttled_seconds": 0.0, "max_wait_seconds": 0.0}
+            for label in PRIORITY_NAMES.values()
+        }
+        self._rate_limited = 0
+        self._retry_after_seconds = 0.0
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def _try_take(self):
+        now = self._clock()
+        self._refill(now)
+        if now < self._blocked_until:
+            return False
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def _time_until_token(self):
+        now = self._clock()
+        self._refill(now)
+        wait = max(0.0, self._blocked_until - now)
+        if self._tokens < 1:
+            wait = max(wait, (1 - self._tokens) / self.rate)
+        return wait
+
+    def _record(self, level, waited):
+        stats = self._stats[PRIORITY_NAMES.get(level, "default")]
+        stats["acquired"] += 1
+        if waited > 0:
+            stats["throttled"] += 1
+            stats["throttled_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+
+    async def acquire(self, priority=None):
+        """Waits for a token. Uses the task's priority class unless one is given."""
+        level = current_priority() if priority is None else priority
+        start = self._clock()
+
+        # Fast path: nobody queued and a token is ready
+        if not self._waiters and self._try_take():
+            self._record(level, 0.0)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (level, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        await future
+        self._record(level, self._clock() - start)
+
+    async def _dispatch(self):
+        """Hands out tokens to queued waiters in priority order."""
+        while self._waiters:
+            # Drop waiters that were cancelled while queued
+            while self._waiters and self._waiters[0][2].done():
+                heapq.heappop(self._waiters)
+            if not self._waiters:
+                break
+
+            wait = self._time_until_token()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            if self._try_take():
+                _, _, future = heapq.heappop(self._waiters)
+                if not future.done():
+                    future.set_result(None)
+
+    def penalize(self, retry_after):
+        """Blocks the whole bucket after the server answered 429."""
+        now = self._clock()
+        self._blocked_until = max(self._blocked_until, now + retry_after)
+        self._tokens = 0.0
+        self._updated = now
+        self._rate_limited += 1
+        self._retry_after_seconds += retry_after
+        logger.warning(f"{self.name} rate limited by server. Pausing all calls for {retry_after:.1f}s.")
+
+    def get_stats(self):
+        """Returns counters for the metrics endpoint."""
+        return {
+            "rate_per_second": self.rate,
+            "burst": self.capacity,
+            "queued": sum(1 for _, _, f in self._waiters if not f.done()),
+            "rate_limited_responses": self._rate_limited,
+            "retry_after_seconds": round(self._retry_after_seconds, 3),
+            "throttled_seconds": round(sum(s["throttled_seconds"] for s in self._stats.values()), 3),
+            "priorities": {
+                label: {**s, "throttled_seconds": round(s["throttled_seconds"], 3), "max_wait_seconds": round(s["max_wait_seconds"], 3)}
+                for label, s in self._stats.items()
+            },
+        }
+
+
+# Single limiter shared by every NotionSync instance in the process
+notion_limiter = TokenBucketLimiter(rate=NOTION_RATE_LIMIT, burst=NOTION_RATE_BURST, name="notion")
+
+
+class ConcurrencyLimiter:
+    """
+    Caps how many calls to a dependency are in flight at once (async context manager).
+    A freed slot goes to the highest priority class waiting (see notion_priority), then FIFO,
+    so live calls overtake queued background work instead of waiting behind it.
+    """
+
+    def __init__(self, limit, name="limiter"):
+        self.name = name
+        self.limit = max(1, limit)
+        self._available = self.limit
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.peak = 0
+        self.acquired = 0
+        self.waited = 0
+
+    async def __aenter__(self):
+        if self._available > 0 and not self._waiters:
+            self._available -= 1
+        else:
+            self.waited += 1
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (current_priority(), next(self._seq), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._release() # Handed a slot just as we were cancelled: pass it on
+                raise
+        self.in_flight += 1
+        self.acquired += 1
+        self.peak = max(self.peak, self.in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.in_flight -= 1
+        self._release()
+
+    def _release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._available += 1
+
+    def get_stats(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queued": sum(1 for _, _, f in self._waiters if not f.done()),
+            "peak": self.peak,
+            "acquired": self.acquired,
+            "waited": self.waited,
+        }
+
+
+# Every Gemini call goes through this cap (see Agent._generate)
+gemini_limiter = ConcurrencyLimiter(GEMINI_MAX_CONCURRENCY, name="gemini")
+
+
+class LiveTraffic:
+    """
+    Counts live messages being handled. Background jobs call wait_idle() between
+    units of work so they only use Gemini/Notion capacity when nothing live is queued.
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.handled = 0
+        self.background_waits = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def busy(self):
+        return self.in_flight > 0
+
+    @contextmanager
+    def track(self):
+        """Marks the enclosed block as live work."""
+        self.in_flight += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.handled += 1
+            if self.in_flight == 0:
+                self._idle.set()
+
+    async def wait_idle(self):
+        """Returns once no live message is being handled."""
+        if self.busy:
+            self.background_waits += 1
+            while self.busy:
+                await self._idle.wait()
+
+    def get_stats(self):
+        return {"in_flight": self.in_flight, "handled": self.handled, "background_waits": self.background_waits}
+
+
+# Live message handlers register here; the learning service yields to them
+live_traffic = LiveTraffic()
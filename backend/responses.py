@@ -0,0 +1,167 @@
+import gzip
+import json
+import logging
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+from config import RESPONSE_COMPRESSION, RESPONSE_COMPRESS_MIN_BYTES, RESPONSE_GZIP_LEVEL
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def dumps(content):
+    """JSON bytes via orjson when installed, else compact stdlib json."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with dumps(). Heavy endpoints return it directly to skip jsonable_encoder."""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _encodings():
+    allowed = [e.strip() for e in RESPONSE_COMPRESSION.split(",") if e.strip()]
+    return [e for e in allowed if e == "gzip" or (e == "br" and brotli is not None)]
+
+
+def compress(body, encoding, gzip_level=None):
+    if encoding == "br":
+        return brotli.compress(body, quality=4)
+    return gzip.compress(body, compresslevel=gzip_level or RESPONSE_GZIP_LEVEL)
+
+
+def choose_encoding(accept_encoding, available):
+    """First server-preferred encoding the client accepts (q=0 excluded)."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        key, _, value = params.strip().partition("=")
+        try:
+            if key.strip() == "q" and float(value) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in available:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match check with weak comparison (RFC 9110), as compression changes the bytes."""
+    if not if_none_match:
+        return False
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    return any(t.strip() == "*" or opaque(t) == opaque(etag) for t in if_none_match.split(","))
+
+
+# Bodies that are already compressed; running them through gzip again only costs CPU
+PRECOMPRESSED_TYPES = (
+    b"image/png", b"image/jpeg", b"image/gif", b"image/webp", b"image/avif",
+    b"video/", b"audio/", b"font/woff",
+    b"application/zip", b"application/gzip", b"application/x-gzip", b"application/zstd",
+    b"application/x-7z-compressed", b"application/x-rar-compressed", b"application/x-bzip2", b"application/x-xz",
+)
+
+
+def _with_vary(headers):
+    """Response headers with Accept-Encoding added to Vary (merged into an existing one)."""
+    out, found = [], False
+    for k, v in headers:
+        if k.lower() == b"vary":
+            found = True
+            if v.strip() != b"*" and b"accept-encoding" not in v.lower():
+                v = v + b", Accept-Encoding"
+        out.append((k, v))
+    if not found:
+        out.append((b"vary", b"Accept-Encoding"))
+    return out
+
+
+# Updated by CompressionMiddleware; reported in /api/metrics
+COMPRESSION_STATS = {"encodings": [], "minimum_size": 0, "compressed": 0, "passed": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing buffered responses of at least `minimum_size` bytes
+    with brotli (if installed) or gzip, per RESPONSE_COMPRESSION. Streaming
+    responses (no Content-Length, or a body sent in several parts), already-encoded
+    bodies and already-compressed media types pass through untouched. Every response
+    that could have been compressed carries Vary: Accept-Encoding, so shared caches
+    keep the variants apart.
+    """
+
+    def __init__(self, app, minimum_size=None, encodings=None):
+        self.app = app
+        self.minimum_size = minimum_size if minimum_size is not None else RESPONSE_COMPRESS_MIN_BYTES
+        self.encodings = encodings if encodings is not None else _encodings()
+        self.stats = COMPRESSION_STATS
+        self.stats.update(encodings=self.encodings, minimum_size=self.minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") == "HEAD" or not self.encodings:
+            return await self.app(scope, receive, send)
+        headers = dict((k.lower(), v) for k, v in scope.get("headers", []))
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"), self.encodings)
+
+        start = None
+        passthrough = False
+
+        async def wrapped_send(message):
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                response_headers = dict((k.lower(), v) for k, v in message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"")
+                if b"content-encoding" in response_headers or b"content-length" not in response_headers \
+                        or content_type.startswith(PRECOMPRESSED_TYPES):
+                    passthrough = True
+                    await send(message)
+                elif encoding is None:
+                    # Not compressed for this client, but another one would get a different body
+                    passthrough = True
+                    await send({**message, "headers": _with_vary(message.get("headers", []))})
+                else:
+                    start = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            if message.get("more_body", False):
+                # Streamed in parts (e.g. a file): forward as is rather than buffer it
+                passthrough = True
+                await send(start)
+                return await send(message)
+            response_headers = _with_vary([(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"])
+            if len(body) >= self.minimum_size:
+                compressed = compress(body, encoding)
+                self.stats["compressed"] += 1
+                self.stats["bytes_in"] += len(body)
+                self.stats["bytes_out"] += len(compressed)
+                body = compressed
+                response_headers.append((b"content-encoding", encoding.encode()))
+            else:
+                self.stats["passed"] += 1
+            response_headers.append((b"content-length", str(len(body)).encode()))
+            await send({**start, "headers": response_headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, wrapped_send)
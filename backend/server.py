@@ -1,23 +1,27 @@
 from fastapi import FastAPI, Request
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from responses import FastJSONResponse, CompressionMiddleware, etag_matches
 import logging
 
 # We will inject the TaskManager instance from main.py
 task_manager = None
 notification_callback = None
+# The listener's live DiscussionBuffer, also injected from main.py
+discussion_buffer = None
 
 from setup_manager import SetupManager
 setup_mgr = SetupManager()
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(CompressionMiddleware)
 
 import sys
 import os
@@ -40,10 +44,35 @@ async def read_root(request: Request):
     return templates.TemplateResponse("dashboard.html", {"request": request})
 
 @app.get("/api/tasks")
-async def get_tasks():
+async def get_tasks(request: Request):
+    """
+    Full task list. The ETag is the change cursor, so an unchanged list answers 304.
+    It is weak because the gzip and identity bodies differ byte-wise but not in content.
+    """
     if not task_manager:
         return []
-    return await task_manager.get_tasks()
+    etag = f'W/"{task_manager.change_cursor}"' # Taken first: a write during the fetch must not be covered by it
+    tasks = await task_manager.get_tasks()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return FastJSONResponse(content=tasks, headers=headers)
+
+@app.get("/api/tasks/changes")
+async def get_task_changes(since: str = None):
+    """Tasks changed or removed after the `since` cursor (the `version` of a previous response)."""
+    if not task_manager:
+        return {"version": None, "reset": True, "changed": [], "removed": []}
+    return FastJSONResponse(await task_manager.get_task_changes(since))
+
+@app.get("/api/tasks/deadlines")
+async def get_deadline_tasks(window: str = "week"):
+    if not task_manager:
+        return []
+    try:
+        return await task_manager.get_deadline_tasks(window)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
 
 @app.post("/api/done/{task_id}")
 async def mark_done(task_id: str):
@@ -77,18 +106,67 @@ async def reopen_task(task_id: str):
     return {"status": "success", "task": task_id}
 
 @app.get("/api/discussions/history")
-async def get_discussion_history():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer() # It loads from disk, so fresh instance is fine or can inject
-    return db.get_history()
+async def get_discussion_history(
+    cursor: int = None,
+    limit: int = 30,
+    since: str = None,
+    until: str = None,
+    fields: str = None
+):
+    """Daily digests, newest first. `since`/`until` are YYYY-MM-DD; `fields=date,point_count` skips the text."""
+    if not discussion_buffer: return {"entries": [], "next_cursor": None}
+    return FastJSONResponse(discussion_buffer.get_history(
+        cursor=cursor,
+        limit=max(1, min(limit, 365)),
+        since=since,
+        until=until,
+        fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    ))
 
 @app.get("/api/discussions/today")
 async def get_today_discussion():
-    from discussion_buffer import DiscussionBuffer
-    db = DiscussionBuffer()
-    return db.get_grouped_text() or "No discussions yet."
+    """Served from the listener's in-memory buffer."""
+    if not discussion_buffer: return "No discussions yet."
+    return discussion_buffer.get_grouped_text() or "No discussions yet."
+
+@app.get("/api/discussions/today/stats")
+async def get_today_discussion_stats():
+    if not discussion_buffer: return {"points": 0, "chats": {}}
+    return discussion_buffer.snapshot()
 
 from pydantic import BaseModel
+from typing import List, Optional
+
+class BulkOperation(BaseModel):
+    op: str # done | reject | reopen | priority
+    id: str
+    priority: Optional[int] = None
+
+class BulkRequest(BaseModel):
+    operations: List[BulkOperation]
+
+@app.post("/api/tasks/bulk")
+async def bulk_update_tasks(request: BulkRequest):
+    """Applies many task operations concurrently; per-item results and one notification."""
+    from config import TASK_BULK_MAX_OPERATIONS
+    if not task_manager:
+        return JSONResponse(status_code=500, content={"error": "TaskManager not initialized"})
+    if len(request.operations) > TASK_BULK_MAX_OPERATIONS:
+        return JSONResponse(status_code=400, content={"error": f"At most {TASK_BULK_MAX_OPERATIONS} operations per request"})
+
+    results = await task_manager.apply_bulk([op.model_dump() for op in request.operations])
+    succeeded = [r for r in results if r["status"] == "success"]
+    done = sum(1 for r in succeeded if r["op"] == "done")
+    if notification_callback and done:
+        await notification_callback(f"{done} task{'s' if done != 1 else ''} marked as Done")
+
+    return {
+        "status": "success" if len(succeeded) == len(results) else "partial",
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "results": results
+    }
+
 class CommentRequest(BaseModel):
     text: str
     sender: str = "User"
@@ -135,9 +213,85 @@ async def update_priority(task_id: str, request: dict):
 
 
 @app.get("/api/audit")
-async def get_audit_log():
-    if not task_manager: return []
-    return await task_manager.get_audit_log()
+async def get_audit_log(
+    cursor: int = None,
+    limit: int = 100,
+    sender: str = None,
+    priority: int = None,
+    task_created: bool = None,
+    reply_action: str = None,
+    since: str = None,
+    until: str = None,
+    fields: str = None
+):
+    """
+    Cursor-paginated audit entries, newest first. `fields` is a comma list (dotted paths allowed).
+    `since`/`until` are ISO dates or datetimes; a date-only `until` includes that whole day.
+    """
+    if not task_manager: return {"entries": [], "next_cursor": None}
+    try:
+        page = await task_manager.query_audit_log(
+            cursor=cursor,
+            limit=limit,
+            sender=sender,
+            priority=priority,
+            task_created=task_created,
+            reply_action=reply_action,
+            since=since,
+            until=until,
+            fields=fields
+        )
+    except ValueError as e: # since/until that are not ISO dates
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return FastJSONResponse(page)
+
+@app.get("/api/events")
+async def stream_events(request: Request):
+    """
+    Server-Sent Events: "task", "audit" and "digest" changes as they happen, and
+    "resync" when this client fell too far behind and should refetch.
+    """
+    import asyncio
+    from config import EVENT_KEEPALIVE_SECONDS
+    from events import event_bus, format_sse
+
+    queue = event_bus.subscribe()
+
+    async def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            event_bus.unsubscribe(queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/metrics")
+async def get_metrics():
+    from rate_limiter import notion_limiter, gemini_limiter, live_traffic
+    from utils import CIRCUIT_BREAKERS
+    from events import event_bus
+    from singleflight import notion_reads
+    from responses import COMPRESSION_STATS
+    return {
+        "notion_rate_limiter": notion_limiter.get_stats(),
+        "gemini_concurrency": gemini_limiter.get_stats(),
+        "live_traffic": live_traffic.get_stats(),
+        "events": event_bus.get_stats(),
+        "notion_singleflight": notion_reads.get_stats(),
+        "compression": dict(COMPRESSION_STATS),
+        "circuit_breakers": {name: b.get_stats() for name, b in CIRCUIT_BREAKERS.items()}
+    }
 
 class CreateTaskRequest(BaseModel):
     summary: str
@@ -241,7 +395,9 @@ async def update_config(new_config: dict):
             "WORKING_HOURS_END", 
             "ENABLE_LONG_TERM_MEMORY",
             "GROUP_TRIGGER_KEYWORDS",
-            "CATCH_UP_SECONDS"
+            "CATCH_UP_SECONDS",
+            "TASK_BACKEND",
+            "TASK_REPLICATE_TO_NOTION"
         ]
         
         for key in allowed_keys:
@@ -0,0 +1,60 @@
+import asyncio
+import logging
+
+from rate_limiter import current_priority
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent identical reads: while a call for a key is in flight,
+    later callers with the same key await the same result (or exception) instead
+    of issuing their own request. Keys are tuples whose first item names the read.
+    A caller only joins a call started at its own priority class or a more urgent one
+    (see rate_limiter.notion_priority); otherwise it would queue at background priority.
+    """
+
+    def __init__(self, name="singleflight"):
+        self.name = name
+        self._calls = {}
+        self.executed = 0
+        self.shared = 0
+        self.by_kind = {}
+
+    def _count(self, key, field):
+        counts = self.by_kind.setdefault(key[0], {"executed": 0, "shared": 0})
+        counts[field] += 1
+
+    async def do(self, key, fn, *args, **kwargs):
+        level = current_priority()
+        call = self._calls.get(key)
+        if call is not None and call[1] <= level:
+            task = call[0]
+            self.shared += 1
+            self._count(key, "shared")
+        else:
+            # New call, or a more urgent caller than the one in flight: later callers join this one
+            self.executed += 1
+            self._count(key, "executed")
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._calls[key] = (task, level)
+            task.add_done_callback(lambda t, key=key: self._calls.get(key, (None,))[0] is t and self._calls.pop(key))
+        # Shielded so one caller giving up does not cancel the call for the others
+        return await asyncio.shield(task)
+
+    def forget(self, key):
+        """Makes the next call for `key` start a fresh request (used after writes)."""
+        self._calls.pop(key, None)
+
+    def get_stats(self):
+        return {
+            "in_flight": len(self._calls),
+            "executed": self.executed,
+            "shared": self.shared,
+            "by_kind": {kind: dict(counts) for kind, counts in self.by_kind.items()},
+        }
+
+
+# Notion reads issued by TaskManager and NotionSync
+notion_reads = SingleFlight("notion")
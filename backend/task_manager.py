@@ -1,13 +1,117 @@
-from datetime import datetime
+from datetime import datetime, date
 import logging
+import secrets
+import time
+from collections import deque
+from itertools import islice
 from notion_sync import NotionSync
+from deadline_index import DeadlineIndex, parse_deadline, reference_date
+from events import event_bus
+from singleflight import notion_reads
 
 logger = logging.getLogger(__name__)
 
+# How long the deadline index may serve queries before re-syncing from Notion
+DEADLINE_INDEX_TTL = 60
+
 class TaskManager:
     def __init__(self, storage_file="tasks.json"):
         # Storage file argument kept for compatibility but ignored
         self.notion_sync = NotionSync()
+        self.deadline_index = DeadlineIndex()
+        self._fetched_at = None # monotonic time of the last full Notion fetch that was adopted
+        self.audit = None
+        self.feedback_changes = 0 # Rejections and comments since start; triggers feedback learning
+        self.version = 0 # Bumped on every task change (see ContextBundleCache, get_task_changes)
+        self.epoch = secrets.token_hex(4) # Distinguishes versions of this process from earlier runs
+        from config import TASK_CHANGE_LOG_SIZE
+        self.changes = deque(maxlen=TASK_CHANGE_LOG_SIZE) # (version, task id), oldest first
+        self._known = None # Notion backend: id -> last seen task, for diffs and delta lookups
+        self._tracked_from = 0 # Version at which _known started; older cursors can't be diffed
+
+    def _changed(self, action, task):
+        """Records a task change: bumps the version, logs it and publishes a "task" event (task may be partial)."""
+        self.version += 1
+        self.changes.append((self.version, task["id"]))
+        notion_reads.forget(self._tasks_key) # Reads starting now must see this change
+        if self._known is not None and action != "removed":
+            self._known[task["id"]] = {**self._known.get(task["id"], {}), **task}
+        event_bus.publish("task", {"action": action, "task": task, "version": self.change_cursor})
+
+    @property
+    def _tasks_key(self):
+        return ("get_tasks", id(self))
+
+    @property
+    def change_cursor(self):
+        """Opaque version cursor for /api/tasks/changes and the task list ETag."""
+        return f"{self.epoch}.{self.version}"
+
+    def _track_fetched(self, tasks):
+        """Diffs a full Notion fetch against the last one so edits made in Notion reach the change log."""
+        fetched = {t["id"]: t for t in tasks}
+        if self._known is None:
+            self._known = fetched
+            self._tracked_from = self.version
+            return
+        for task_id, task in fetched.items():
+            if self._known.get(task_id) != task:
+                self._changed("updated", task)
+        for task_id in set(self._known) - set(fetched):
+            self._changed("removed", {"id": task_id})
+        self._known = fetched
+
+    def _can_diff(self):
+        return self._known is not None
+
+    async def _refresh_known(self):
+        """Re-fetches from Notion when the snapshot deltas are diffed against is too old."""
+        from config import TASK_CHANGES_REFRESH_SECONDS
+        if self._fetched_at is None or time.monotonic() - self._fetched_at > TASK_CHANGES_REFRESH_SECONDS:
+            await self.get_tasks()
+
+    async def _lookup_tasks(self, task_ids):
+        """Current state of the given tasks; ids missing from the result were removed."""
+        found = {}
+        for task_id in task_ids:
+            if task_id in self._known:
+                found[task_id] = {**self._known[task_id], "comments": await self.get_comments(task_id)}
+        return found
+
+    async def get_task_changes(self, since=None):
+        """
+        Tasks added, changed or removed after the `since` cursor, plus the new cursor.
+        Falls back to the full list ("reset") when the cursor is unknown, from an
+        earlier run, or older than the retained change log.
+        """
+        # The returned cursor is taken before any await: a change landing while the
+        # lookup runs is then reported again next time instead of being skipped.
+        epoch, _, version = (since or "").partition(".")
+        if epoch == self.epoch and self._can_diff():
+            await self._refresh_known()
+        oldest = max(self.changes[0][0] - 1 if self.changes else self.version, self._tracked_from)
+        if not self._can_diff() or epoch != self.epoch or not version.isdigit() \
+                or not oldest <= int(version) <= self.version:
+            cursor = self.change_cursor
+            tasks = await self.get_tasks()
+            return {"version": cursor, "reset": True, "changed": tasks, "removed": []}
+
+        since_version = int(version)
+        cursor = self.change_cursor
+        task_ids = list(dict.fromkeys(task_id for v, task_id in self.changes if v > since_version))
+        found = await self._lookup_tasks(task_ids)
+        return {
+            "version": cursor,
+            "reset": False,
+            "changed": [found[task_id] for task_id in task_ids if task_id in found],
+            "removed": [task_id for task_id in task_ids if task_id not in found]
+        }
+
+    def _annotate_deadline(self, task, created=None):
+        """Adds the normalized deadline (ISO date or None) parsed from the free-text one."""
+        parsed = parse_deadline(task.get("deadline") or None, reference_date(created))
+        task["deadline_date"] = parsed.isoformat() if parsed else None
+        return task
         
     async def add_task(self, priority: int, summary: str, sender: str, link: str, deadline: str = None, user_id: int = None):
         """Adds a new task directly to Notion."""
@@ -36,6 +140,10 @@ class TaskManager:
                 }
 
         page_id = await self.notion_sync.create_task_page(task_data)
+        if page_id:
+            task = self._annotate_deadline({**task_data, "id": page_id})
+            self.deadline_index.upsert(task)
+            self._changed("created", {**task, "comments": []})
         
         # Return a mock task object for immediate UI feedback if needed, 
         # though the dashboard should re-fetch.
@@ -51,20 +159,50 @@ class TaskManager:
         """Updates Notion status to Done."""
         logger.info(f"Marking task done: {task_id}")
         await self.notion_sync.update_task_status(task_id, 'done')
+        self.deadline_index.remove(task_id)
+        self._changed("status", {"id": task_id, "status": "done"})
 
     async def reject_task(self, task_id: str):
         """Updates Notion status to Rejected."""
         logger.info(f"Marking task rejected: {task_id}")
         await self.notion_sync.update_task_status(task_id, 'rejected')
+        self.deadline_index.remove(task_id)
+        self.feedback_changes += 1
+        self._changed("status", {"id": task_id, "status": "rejected"})
 
     async def reopen_task(self, task_id: str):
         """Updates Notion status to Active."""
         logger.info(f"Reopening task: {task_id}")
         await self.notion_sync.update_task_status(task_id, 'active')
+        self._changed("status", {"id": task_id, "status": "active"})
 
     async def get_tasks(self):
-        """Fetches tasks directly from Notion."""
-        return await self.notion_sync.get_tasks()
+        """
+        Fetches tasks directly from Notion and refreshes the deadline index.
+        Concurrent callers share one in-flight fetch (and the returned list; don't mutate it).
+        """
+        return await notion_reads.do(self._tasks_key, self._fetch_tasks)
+
+    async def _fetch_tasks(self):
+        started = self.version
+        tasks = await self.notion_sync.get_tasks()
+        for t in tasks:
+            self._annotate_deadline(t, t.get("created_time"))
+        self.deadline_index.rebuild(tasks)
+        if self.version != started:
+            # A write landed while Notion was answering, so this snapshot may predate it:
+            # diffing it would report the write as undone. The next fetch catches up.
+            logger.debug("Task fetch overlapped a write; not adopting it for change tracking")
+            return tasks
+        self._fetched_at = time.monotonic()
+        self._track_fetched(tasks)
+        return tasks
+
+    async def get_deadline_tasks(self, window: str = "week", today=None):
+        """Returns active tasks due in a window (overdue, today, week, upcoming, unparsed)."""
+        if self._fetched_at is None or time.monotonic() - self._fetched_at > DEADLINE_INDEX_TTL:
+            await self.get_tasks()
+        return self.deadline_index.query(window, today)
 
     async def get_recent_done_tasks(self, limit: int = 5):
         """Returns most recently completed tasks from Notion."""
@@ -100,6 +238,7 @@ class TaskManager:
         all_tasks = await self.get_tasks()
         rejected_with_comments = [
             {
+                "id": t['id'],
                 "summary": t['summary'], 
                 "sender": t.get("sender", "Unknown"),
                 "comments": [c['text'] for c in t.get("comments", [])]
@@ -119,17 +258,20 @@ class TaskManager:
         sorted_tasks = sorted(active_tasks, key=lambda x: x.get("priority", 0), reverse=True)
         top_tasks = sorted_tasks[:3]
         
-        # TODO: Implement proper deadline parsing later
-        deadline_tasks = [t for t in active_tasks if t.get("deadline")]
-        
+        # get_tasks() just refreshed the deadline index
+        today = date.today()
         return {
             "top_tasks": top_tasks,
-            "deadline_tasks": deadline_tasks
+            "overdue_tasks": self.deadline_index.query("overdue", today),
+            "deadline_tasks": self.deadline_index.query("upcoming", today) + self.deadline_index.unparsed()
         }
 
     async def add_comment(self, task_id, text, sender):
         """Adds a comment to a task."""
-        return await self.notion_sync.add_comment(task_id, text, sender)
+        self.feedback_changes += 1
+        comment = await self.notion_sync.add_comment(task_id, text, sender)
+        self._changed("comments", {"id": task_id})
+        return comment
 
     async def get_comments(self, task_id):
         """Fetches comments for a task."""
@@ -137,16 +279,68 @@ class TaskManager:
 
     async def delete_comment(self, task_id, comment_id):
         """Deletes a comment from a task."""
-        return await self.notion_sync.delete_comment(task_id, comment_id)
+        deleted = await self.notion_sync.delete_comment(task_id, comment_id)
+        if deleted:
+            self._changed("comments", {"id": task_id})
+        return deleted
 
     async def update_priority(self, task_id, priority):
         """Updates the priority of a task."""
-        return await self.notion_sync.update_task_priority(task_id, priority)
+        updated = await self.notion_sync.update_task_priority(task_id, priority)
+        if updated:
+            self._changed("priority", {"id": task_id, "priority": int(priority)})
+        return updated
+
+    async def _apply_operation(self, op):
+        task_id, action = op.get("id"), op.get("op")
+        if not task_id:
+            raise ValueError("Missing task id")
+        if action == "done":
+            await self.mark_done(task_id)
+        elif action == "reject":
+            await self.reject_task(task_id)
+        elif action == "reopen":
+            await self.reopen_task(task_id)
+        elif action == "priority":
+            if op.get("priority") is None:
+                raise ValueError("Priority missing")
+            if not await self.update_priority(task_id, op["priority"]):
+                raise RuntimeError("Failed to update priority")
+        else:
+            raise ValueError(f"Unknown operation: {action}")
+
+    async def apply_bulk(self, operations, max_concurrency=None):
+        """
+        Applies task operations ({"op": done|reject|reopen|priority, "id", "priority"?})
+        concurrently, at most `max_concurrency` at a time; Notion calls still go through
+        the shared rate limiter. Returns one result per operation, in request order.
+        """
+        import asyncio
+        from config import TASK_BULK_CONCURRENCY
+        semaphore = asyncio.Semaphore(max_concurrency or TASK_BULK_CONCURRENCY)
+
+        async def run(op):
+            result = {"id": op.get("id"), "op": op.get("op")}
+            async with semaphore:
+                try:
+                    await self._apply_operation(op)
+                    result["status"] = "success"
+                except Exception as e:
+                    logger.error(f"Bulk {op.get('op')} failed for {op.get('id')}: {e}")
+                    result.update(status="error", error=str(e))
+            return result
+
+        return await asyncio.gather(*(run(op) for op in operations))
+
+    def _get_audit(self):
+        """Lazy initialization of the audit journal."""
+        if self.audit is None:
+            from audit_log import AuditJournal
+            self.audit = AuditJournal()
+        return self.audit
 
     async def log_audit(self, message_data, evaluation, task_created=False, reply_action="none"):
-        """Logs an AI evaluation to a local JSON file for auditing."""
-        import json
-        
+        """Appends an AI evaluation to the audit journal (O(1), no file rewrite)."""
         entry = {
             "timestamp": datetime.now().isoformat(),
             "sender": message_data.get("sender"),
@@ -155,31 +349,44 @@ class TaskManager:
             "task_created": task_created,
             "reply_action": reply_action
         }
-        
-        # Load existing log
-        from config import CONFIG_DIR
-        log_file = CONFIG_DIR / "audit_log.json"
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            logs = []
-            
-        logs.insert(0, entry)
-        # Keep last 500 entries
-        logs = logs[:500]
-        
-        with open(log_file, 'w') as f:
-            json.dump(logs, f, indent=2)
+        entry = self._get_audit().append(entry)
+        event_bus.publish("audit", entry)
+        return entry
 
     async def get_audit_log(self, limit=100):
-        """Returns the audit log."""
-        import json
-        from config import CONFIG_DIR
-        log_file = CONFIG_DIR / "audit_log.json"
-        try:
-            with open(log_file, 'r') as f:
-                logs = json.load(f)
-                return logs[:limit]
-        except (FileNotFoundError, json.JSONDecodeError):
-            return []
+        """Returns the newest audit entries, newest first."""
+        return self._get_audit().tail(limit)
+
+    def audit_latest_seq(self):
+        """Sequence number of the newest audit entry (0 if empty)."""
+        return self._get_audit().latest_seq
+
+    async def read_audit_since(self, after_seq=0, limit=200):
+        """Returns up to `limit` audit entries with seq > after_seq, oldest first."""
+        return list(islice(self._get_audit().iter_forward(after_seq), limit))
+
+    async def query_audit_log(self, cursor=None, limit=100, sender=None, priority=None, task_created=None,
+                              reply_action=None, since=None, until=None, fields=None):
+        """Filtered, cursor-paginated audit query (newest first)."""
+        return self._get_audit().query(
+            cursor=cursor,
+            limit=max(1, min(int(limit), 500)),
+            filters={
+                "sender": sender,
+                "priority": priority,
+                "task_created": task_created,
+                "reply_action": reply_action
+            },
+            since=since,
+            until=until,
+            fields=[f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        )
+
+def create_task_manager():
+    """Builds the task service selected by TASK_BACKEND."""
+    from config import TASK_BACKEND
+    if TASK_BACKEND == "sqlite":
+        from local_task_manager import LocalTaskManager
+        logger.info("Using local SQLite task backend.")
+        return LocalTaskManager()
+    return TaskManager()
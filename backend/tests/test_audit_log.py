@@ -0,0 +1,117 @@
+import gzip
+import json
+import pytest
+from audit_log import AuditJournal
+
+def _journal(tmp_path, **kwargs):
+    return AuditJournal(directory=tmp_path / "audit", legacy_file=tmp_path / "audit_log.json", **kwargs)
+
+def _entry(i):
+    return {"timestamp": f"2026-01-01T00:00:{i:02d}", "sender": f"s{i}", "text": "hi"}
+
+def test_append_assigns_sequence_and_tail_is_newest_first(tmp_path):
+    journal = _journal(tmp_path)
+    for i in range(5):
+        journal.append(_entry(i))
+
+    tail = journal.tail(3)
+    assert [e["seq"] for e in tail] == [5, 4, 3]
+    assert journal.latest_seq == 5
+
+def test_rotation_compresses_cold_segments(tmp_path):
+    journal = _journal(tmp_path, segment_bytes=200)
+    for i in range(10):
+        journal.append(_entry(i))
+
+    assert len(journal.segments) > 1
+    cold = journal.segments[0]
+    assert cold["compressed"] is True
+    with gzip.open(tmp_path / "audit" / cold["file"], "rb") as f:
+        assert json.loads(f.readline())["seq"] == 1
+
+    # Readers see every entry across hot and cold segments
+    assert [e["seq"] for e in journal.iter_forward(after_seq=3)] == list(range(4, 11))
+    assert [e["seq"] for e in journal.iter_reverse(before_seq=4)] == [3, 2, 1]
+
+def test_retention_drops_oldest_segments(tmp_path):
+    journal = _journal(tmp_path, segment_bytes=200, retention_entries=4)
+    for i in range(20):
+        journal.append(_entry(i))
+
+    stats = journal.get_stats()
+    assert stats["entries"] < 20
+    assert journal.tail(1)[0]["seq"] == 20
+
+def test_reopen_recovers_hot_segment_and_torn_line(tmp_path):
+    journal = _journal(tmp_path)
+    for i in range(3):
+        journal.append(_entry(i))
+    journal._fh.close()
+
+    # Simulate a crash mid-write
+    hot = tmp_path / "audit" / journal.segments[-1]["file"]
+    with open(hot, "ab") as f:
+        f.write(b'{"seq": 4, "trunc')
+
+    reopened = _journal(tmp_path)
+    assert reopened.latest_seq == 3
+    assert reopened.append(_entry(9))["seq"] == 4
+    assert [e["seq"] for e in reopened.tail(10)] == [4, 3, 2, 1]
+
+def test_legacy_json_is_migrated(tmp_path):
+    legacy = [_entry(2), _entry(1)] # Old file stored newest first
+    with open(tmp_path / "audit_log.json", "w") as f:
+        json.dump(legacy, f)
+
+    journal = _journal(tmp_path)
+
+    assert [e["sender"] for e in journal.tail(10)] == ["s2", "s1"]
+    assert not (tmp_path / "audit_log.json").exists()
+
+def test_query_filters_paginates_and_projects(tmp_path):
+    journal = _journal(tmp_path, segment_bytes=400)
+    for i in range(30):
+        journal.append({
+            **_entry(i),
+            "sender": "alice" if i % 3 == 0 else "bob",
+            "task_created": i % 2 == 0,
+            "evaluation": {"priority": i % 5, "summary": f"sum {i}", "reasoning": "long"}
+        })
+    assert len(journal.segments) > 2
+
+    page = journal.query(limit=4, filters={"sender": "alice", "task_created": True})
+    assert [e["seq"] for e in page["entries"]] == [25, 19, 13, 7]
+    page = journal.query(cursor=page["next_cursor"], limit=4, filters={"sender": "alice", "task_created": True})
+    assert [e["seq"] for e in page["entries"]] == [1]
+    assert page["next_cursor"] is None
+
+    ranged = journal.query(since="2026-01-01T00:00:10", until="2026-01-01T00:00:12")
+    assert [e["seq"] for e in ranged["entries"]] == [13, 12, 11]
+
+    projected = journal.query(limit=1, filters={"priority": 3}, fields=["sender", "evaluation.summary"])
+    assert projected["entries"] == [{"seq": 29, "sender": "bob", "evaluation": {"summary": "sum 28"}}]
+
+def test_query_skips_segments_by_facet(tmp_path, monkeypatch):
+    journal = _journal(tmp_path, segment_bytes=200)
+    for i in range(10):
+        journal.append(_entry(i))
+    journal.append({**_entry(10), "sender": "needle"})
+
+    read = []
+    original = journal._read_segment
+    monkeypatch.setattr(journal, "_read_segment", lambda seg, *a: read.append(seg["id"]) or original(seg, *a))
+
+    assert [e["seq"] for e in journal.query(filters={"sender": "needle"})["entries"]] == [11]
+    assert read == [journal.segments[-1]["id"]]
+
+def test_date_only_until_covers_the_whole_day(tmp_path):
+    journal = _journal(tmp_path, segment_bytes=200)
+    for i, ts in enumerate(["2026-10-17T23:59:59", "2026-10-18T09:00:00", "2026-10-18T23:59:59.5", "2026-10-19T00:00:00"]):
+        journal.append({**_entry(i), "timestamp": ts})
+    assert len(journal.segments) > 1
+
+    day = journal.query(since="2026-10-18", until="2026-10-18")
+    assert [e["timestamp"] for e in day["entries"]] == ["2026-10-18T23:59:59.5", "2026-10-18T09:00:00"]
+    assert [e["seq"] for e in journal.query(until="2026-10-18T09:00:00")["entries"]] == [2, 1]
+    with pytest.raises(ValueError):
+        journal.query(until="yesterday")
@@ -0,0 +1,57 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from context_cache import ContextBundleCache, render_task_context
+from memory_manager import MemoryManager
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def tasks():
+    service = MagicMock()
+    service.version = 0
+    service.get_recent_done_tasks = AsyncMock(return_value=[{"summary": "Ship release"}])
+    service.get_preference_examples = AsyncMock(return_value={
+        "accepted": [{"priority": 1, "summary": "Review PR", "sender": "Ann", "comments": []}],
+        "rejected": [{"priority": 3, "summary": "Crypto", "sender": "Bot", "comments": ["spam"]}]
+    })
+    return service
+
+def test_render_task_context_matches_prompt_format():
+    text = render_task_context(
+        [{"summary": "Ship release"}],
+        {"accepted": [], "rejected": [{"priority": 3, "summary": "Crypto", "sender": "Bot", "comments": ["spam"]}]}
+    )
+    assert text == (
+        "Recent Finished Tasks:\n- Ship release\n\nUser Preferences (Learning):\n"
+        "ACCEPTED Tasks:\n\nREJECTED Tasks:\n- [P3] Crypto (from Bot) | Note: spam"
+    )
+
+@pytest.mark.asyncio
+async def test_bundle_is_reused_until_a_version_moves(tasks, tmp_path):
+    memory = MemoryManager(storage_file=str(tmp_path / "memory.json"), db_path=tmp_path / "memory.db")
+    memory.add_memory("Lives in Berlin")
+    clock = Clock()
+    cache = ContextBundleCache(memory, tasks, task_ttl=300, clock=clock)
+
+    first = await cache.bundle()
+    assert "Ship release" in first and "Lives in Berlin" in first
+    assert await cache.bundle() == first
+    assert tasks.get_recent_done_tasks.await_count == 1
+
+    memory.add_memory("Hates calls")
+    assert "Hates calls" in await cache.bundle()
+    assert tasks.get_recent_done_tasks.await_count == 1
+
+    tasks.version += 1
+    await cache.bundle()
+    assert tasks.get_recent_done_tasks.await_count == 2
+
+    # Changes made directly in Notion are picked up after the TTL
+    clock.now = 301
+    await cache.bundle()
+    assert tasks.get_recent_done_tasks.await_count == 3
@@ -0,0 +1,71 @@
+from datetime import date
+import pytest
+from deadline_index import parse_deadline, DeadlineIndex
+
+MONDAY = date(2026, 10, 19)
+
+@pytest.mark.parametrize("text,expected", [
+    ("2026-11-01", date(2026, 11, 1)),
+    ("tomorrow", date(2026, 10, 20)),
+    ("day after tomorrow", date(2026, 10, 21)),
+    ("by Friday", date(2026, 10, 23)),
+    ("next monday", date(2026, 10, 26)),
+    ("EOD", MONDAY),
+    ("in 3 days", date(2026, 10, 22)),
+    ("end of month", date(2026, 10, 31)),
+    ("5th December", date(2026, 12, 5)),
+    ("Jan 5", date(2027, 1, 5)),
+    ("whenever you can", None),
+    ("2026-13-40", None),
+])
+def test_parse_deadline(text, expected):
+    assert parse_deadline(text, MONDAY) == expected
+
+def test_parse_deadline_without_reference_follows_the_clock(monkeypatch):
+    import deadline_index
+
+    class FakeDate(date):
+        current = MONDAY
+        @classmethod
+        def today(cls):
+            return cls.current
+
+    monkeypatch.setattr(deadline_index, "date", FakeDate)
+    assert parse_deadline("tomorrow") == date(2026, 10, 20)
+    FakeDate.current = date(2026, 10, 20)
+    assert parse_deadline("tomorrow") == date(2026, 10, 21)
+
+def _task(task_id, due, status="active", deadline="x"):
+    return {"id": task_id, "status": status, "deadline": deadline, "deadline_date": due}
+
+def test_index_windows():
+    index = DeadlineIndex()
+    index.rebuild([
+        _task("late", "2026-10-10"),
+        _task("today", "2026-10-19"),
+        _task("sunday", "2026-10-25"),
+        _task("later", "2026-11-30"),
+        _task("done", "2026-10-19", status="done"),
+        _task("vague", None, deadline="soonish"),
+    ])
+
+    assert [t["id"] for t in index.query("overdue", MONDAY)] == ["late"]
+    assert [t["id"] for t in index.query("today", MONDAY)] == ["today"]
+    assert [t["id"] for t in index.query("week", MONDAY)] == ["today", "sunday"]
+    assert [t["id"] for t in index.query("unparsed")] == ["vague"]
+
+def test_index_upsert_and_remove():
+    index = DeadlineIndex()
+    index.upsert(_task("a", "2026-10-21"))
+    index.upsert(_task("b", "2026-10-20"))
+    index.upsert(_task("a", "2026-10-19")) # Deadline moved
+
+    assert [t["id"] for t in index.query("week", MONDAY)] == ["a", "b"]
+
+    index.remove("a")
+    assert [t["id"] for t in index.query("week", MONDAY)] == ["b"]
+    assert len(index) == 1
+
+def test_unknown_window():
+    with pytest.raises(ValueError):
+        DeadlineIndex().query("someday")
@@ -0,0 +1,133 @@
+import pytest
+from unittest.mock import AsyncMock
+from digest_summarizer import DigestSummarizer, cluster_chats, match_summaries
+from discussion_buffer import DiscussionBuffer
+from history_store import DailyHistoryStore
+
+def _buffer(tmp_path):
+    return DiscussionBuffer(
+        directory=str(tmp_path / "discussions"),
+        legacy_file=str(tmp_path / "discussions.json"),
+        history=DailyHistoryStore(path=tmp_path / "daily_history.jsonl", legacy_file=tmp_path / "daily_history.json")
+    )
+
+@pytest.mark.asyncio
+async def test_partials_cover_points_and_survive_restart(tmp_path):
+    buf = _buffer(tmp_path)
+    agent = AsyncMock()
+    agent.summarize_chats.return_value = {"1": "- Release moved to Friday"}
+    summarizer = DigestSummarizer(agent, buf)
+
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+    buf.add_point("Team", "Cid", "QA signed off on the build")
+    assert await summarizer.summarize_pending() == 1
+    assert buf.pending_by_chat() == {}
+    # Nothing new: no further calls
+    assert await summarizer.summarize_pending() == 0
+    assert agent.summarize_chats.await_count == 1
+
+    buf.add_point("Team", "Bob", "Deploy window is 6pm")
+    buf.close()
+
+    reloaded = _buffer(tmp_path)
+    assert reloaded.summarized_through == {"Team": 2}
+    assert reloaded.get_digest_text() == (
+        "Here are today's discussions, as hourly summaries per chat:\n\n"
+        "### Team\n- Release moved to Friday\n- [Bob]: Deploy window is 6pm\n\n"
+    )
+
+@pytest.mark.asyncio
+async def test_build_digest_reduces_partials_and_retries_failures(tmp_path):
+    buf = _buffer(tmp_path)
+    agent = AsyncMock()
+    agent.summarize_chats.side_effect = [None, {"Random": "- Lunch plans"}]
+    agent.summarize_discussions.return_value = "digest"
+    summarizer = DigestSummarizer(agent, buf)
+
+    assert await summarizer.build_digest() is None
+
+    buf.add_point("Random", "Bob", "Lunch at noon anyone?")
+    assert await summarizer.summarize_pending() == 0 # Failed call leaves the points pending
+    assert await summarizer.build_digest() == "digest"
+    assert "- Lunch plans" in agent.summarize_discussions.await_args.args[0]
+
+    buf.clear()
+    assert buf.partials == {} and buf.get_digest_text() is None
+
+def test_cluster_chats_packs_small_chats():
+    pending = {
+        "Busy": [{"id": i} for i in range(5)],
+        "A": [{"id": 10}],
+        "B": [{"id": 11}, {"id": 12}],
+        "C": [{"id": 13}, {"id": 14}],
+    }
+    groups = cluster_chats(pending, cluster_points=4)
+    assert [list(g) for g in groups] == [["Busy"], ["A", "B"], ["C"]]
+
+@pytest.mark.asyncio
+async def test_groups_are_summarized_concurrently(tmp_path):
+    import asyncio
+    buf = _buffer(tmp_path)
+    for chat in ("Team", "Random"):
+        for i in range(3):
+            buf.add_point(chat, "Ann", f"{chat} discussion item {i} about topic {i * 11}")
+
+    in_flight, peak = 0, 0
+    async def summarize(text):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        chat = text.splitlines()[0].split("] ", 1)[1]
+        return {"1": f"- {chat} partial"}
+
+    agent = AsyncMock()
+    agent.summarize_chats.side_effect = summarize
+    summarizer = DigestSummarizer(agent, buf, cluster_points=3)
+
+    assert await summarizer.summarize_pending() == 2
+    assert peak == 2
+    assert set(buf.summarized_through) == {"Team", "Random"}
+
+def test_summaries_map_back_by_section_number():
+    group = {"Team: Q3 *launch*": [{"id": 1}], "Random": [{"id": 2}]}
+    assert match_summaries(group, {"2": "- lunch", "[1]": "- launch", "9": "- ghost"}) == {
+        "Team: Q3 *launch*": "- launch", "Random": "- lunch"
+    }
+    # A single chat takes the only answer, whatever key the model echoed back
+    assert match_summaries({"Team": [{"id": 1}]}, {"Team (work)": "- launch"}) == {"Team": "- launch"}
+    with pytest.raises(ValueError):
+        match_summaries(group, ["- launch"])
+
+@pytest.mark.asyncio
+async def test_malformed_group_response_does_not_sink_the_others(tmp_path):
+    buf = _buffer(tmp_path)
+    for chat in ("Team", "Random"):
+        for i in range(3):
+            buf.add_point(chat, "Ann", f"{chat} discussion item {i} about topic {i * 11}")
+
+    async def summarize(text):
+        return ["not", "a", "dict"] if "Team" in text else {"1": "- Random partial"}
+
+    agent = AsyncMock()
+    agent.summarize_chats.side_effect = summarize
+    summarizer = DigestSummarizer(agent, buf, cluster_points=3)
+
+    assert await summarizer.summarize_pending() == 1
+    assert set(buf.summarized_through) == {"Random"}
+    assert list(buf.pending_by_chat()) == ["Team"]
+
+@pytest.mark.asyncio
+async def test_cancelled_group_is_not_swallowed(tmp_path):
+    import asyncio
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+
+    agent = AsyncMock()
+    agent.summarize_chats.side_effect = asyncio.CancelledError()
+    summarizer = DigestSummarizer(agent, buf)
+
+    with pytest.raises(asyncio.CancelledError):
+        await summarizer.summarize_pending()
+    assert list(buf.pending_by_chat()) == ["Team"]
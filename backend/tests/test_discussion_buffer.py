@@ -0,0 +1,155 @@
+import json
+import os
+import pytest
+from discussion_buffer import DiscussionBuffer
+from history_store import DailyHistoryStore
+
+def _history(tmp_path):
+    return DailyHistoryStore(path=tmp_path / "daily_history.jsonl", legacy_file=tmp_path / "daily_history.json")
+
+def _buffer(tmp_path):
+    return DiscussionBuffer(
+        directory=str(tmp_path / "discussions"),
+        legacy_file=str(tmp_path / "discussions.json"),
+        history=_history(tmp_path)
+    )
+
+def test_points_are_appended_and_grouped_per_chat(tmp_path):
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+    buf.add_point("Random", "Bob", "Lunch at noon anyone?")
+    buf.add_point("Team", "Cid", "QA signed off on the build")
+
+    journal = (tmp_path / "discussions" / "active.jsonl").read_text().splitlines()
+    assert len(journal) == 3
+    assert buf.get_grouped_text() == (
+        "Here are the un-processed discussion points from today:\n\n"
+        "### Team\n- [Ann]: Release moved to Friday\n- [Cid]: QA signed off on the build\n\n"
+        "### Random\n- [Bob]: Lunch at noon anyone?\n\n"
+    )
+
+    # A restart replays the journal, ignoring a torn last line
+    buf.close()
+    with open(tmp_path / "discussions" / "active.jsonl", "a") as f:
+        f.write('{"chat": "Te')
+    assert len(_buffer(tmp_path).get_all()) == 3
+
+def test_clear_rotates_the_journal(tmp_path):
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+    buf.clear()
+    buf.add_point("Team", "Ann", "Another day")
+
+    files = sorted(os.listdir(tmp_path / "discussions"))
+    assert len(files) == 2 and "active.jsonl" in files
+    assert [p["summary"] for p in buf.get_all()] == ["Another day"]
+
+def test_legacy_buffer_is_migrated(tmp_path):
+    legacy = tmp_path / "discussions.json"
+    legacy.write_text(json.dumps([{"timestamp": "t", "chat": "Team", "sender": "Ann", "summary": "Old point here"}]))
+
+    buf = _buffer(tmp_path)
+    assert [p["summary"] for p in buf.get_all()] == ["Old point here"]
+    assert not legacy.exists()
+
+def test_history_pages_ranges_and_projection(tmp_path):
+    history = _history(tmp_path)
+    for day in range(1, 8):
+        history.append({"date": f"2026-01-0{day}", "summary_text": f"digest {day}", "point_count": day})
+
+    page = history.query(limit=3)
+    assert [e["date"] for e in page["entries"]] == ["2026-01-07", "2026-01-06", "2026-01-05"]
+    page = history.query(cursor=page["next_cursor"], limit=3)
+    assert [e["date"] for e in page["entries"]] == ["2026-01-04", "2026-01-03", "2026-01-02"]
+    page = history.query(cursor=page["next_cursor"], limit=3)
+    assert [e["date"] for e in page["entries"]] == ["2026-01-01"] and page["next_cursor"] is None
+
+    ranged = history.query(since="2026-01-02", until="2026-01-03", fields=["point_count"])
+    assert ranged["entries"] == [
+        {"seq": 3, "date": "2026-01-03", "point_count": 3},
+        {"seq": 2, "date": "2026-01-02", "point_count": 2}
+    ]
+    assert history.get("2026-01-04")[0]["summary_text"] == "digest 4"
+
+def test_archive_appends_and_legacy_history_is_migrated(tmp_path):
+    (tmp_path / "daily_history.json").write_text(json.dumps([
+        {"date": "2026-01-02", "summary_text": "newer", "point_count": 2},
+        {"date": "2026-01-01", "summary_text": "older", "point_count": 1}
+    ]))
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+    buf.archive_daily_summary("today's digest")
+
+    entries = buf.get_history()["entries"]
+    assert [e["summary_text"] for e in entries] == ["today's digest", "newer", "older"]
+    assert entries[0]["point_count"] == 1
+    assert len(_history(tmp_path)) == 3
+
+def test_snapshot_and_cached_text_track_changes(tmp_path):
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "Release moved to Friday")
+    text = buf.get_grouped_text()
+    assert buf.get_grouped_text() is text
+
+    buf.add_point("Team", "Bob", "Hotfix is out now")
+    assert "Hotfix" in buf.get_grouped_text()
+    assert buf.snapshot()["chats"] == {"Team": 2}
+
+    buf.clear()
+    assert buf.get_grouped_text() is None
+    assert buf.snapshot()["points"] == 0
+
+def test_near_duplicates_are_dropped_per_chat(tmp_path):
+    buf = _buffer(tmp_path)
+    assert buf.add_point("Team", "Ann", "Release moved to Friday evening, please plan accordingly") is True
+    assert buf.add_point("Team", "Bot", "release moved to friday evening,  please plan accordingly!") is False
+    assert buf.add_point("Team", "Bob", "Release moved to Friday evening, please plan accordingly!!") is False
+    # The same announcement in another chat is kept
+    assert buf.add_point("Random", "Ann", "Release moved to Friday evening, please plan accordingly") is True
+
+    stats = buf.snapshot()
+    assert stats["dropped"]["duplicate"] == 2
+    assert stats["dropped_by_chat"] == {"Team": {"duplicate": 2}}
+
+def test_caps_keep_a_bounded_reservoir_and_survive_restart(tmp_path):
+    import random
+    kwargs = dict(
+        directory=str(tmp_path / "discussions"),
+        legacy_file=str(tmp_path / "discussions.json"),
+        history=_history(tmp_path),
+        max_per_chat=5,
+        max_points=8,
+        rng=random.Random(7)
+    )
+    buf = DiscussionBuffer(**kwargs)
+    for i in range(40):
+        buf.add_point("Busy", "Bot", f"unique update number {i} about topic {i * 7}")
+    for i in range(10):
+        buf.add_point("Quiet", "Ann", f"quiet chat message {i} on subject {i * 3}")
+
+    stats = buf.snapshot()
+    assert stats["chats"]["Busy"] <= 5
+    assert stats["points"] <= 8
+    assert stats["dropped"]["chat_cap"] + stats["dropped"]["global_cap"] + stats["dropped"]["evicted"] > 0
+
+    kept = [p["id"] for p in buf.get_all()]
+    before = (buf.eligible, buf.eligible_total, stats["dropped"], stats["dropped_by_chat"])
+    buf.close()
+    reloaded = DiscussionBuffer(**kwargs)
+    assert [p["id"] for p in reloaded.get_all()] == kept
+    # Reservoir counters and drop stats are restored from the journal
+    after = reloaded.snapshot()
+    assert (reloaded.eligible, reloaded.eligible_total, after["dropped"], after["dropped_by_chat"]) == before
+    assert reloaded.eligible_total == 50
+
+def test_rotations_in_the_same_second_keep_both_archives(tmp_path):
+    buf = _buffer(tmp_path)
+    buf.add_point("Team", "Ann", "First day's point")
+    buf.clear()
+    buf.add_point("Team", "Ann", "Second rotation point")
+    buf.clear()
+
+    archives = sorted(f for f in os.listdir(tmp_path / "discussions") if f != "active.jsonl")
+    assert len(archives) == 2
+    contents = [(tmp_path / "discussions" / f).read_text() for f in archives]
+    assert "First day's point" in contents[0] and "Second rotation point" in contents[1]
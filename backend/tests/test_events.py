@@ -0,0 +1,35 @@
+import pytest
+from events import EventBus, format_sse
+
+@pytest.mark.asyncio
+async def test_events_fan_out_to_every_subscriber():
+    bus = EventBus(queue_size=10)
+    first, second = bus.subscribe(), bus.subscribe()
+
+    bus.publish("task", {"action": "status", "task": {"id": "t1", "status": "done"}})
+
+    for queue in (first, second):
+        event = queue.get_nowait()
+        assert event["type"] == "task"
+        assert event["data"]["task"]["status"] == "done"
+
+    bus.unsubscribe(second)
+    bus.publish("audit", {"seq": 1})
+    assert second.empty()
+    assert bus.get_stats()["subscribers"] == 1
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_gets_a_single_resync():
+    bus = EventBus(queue_size=2)
+    queue = bus.subscribe()
+    for i in range(4):
+        bus.publish("audit", {"seq": i})
+
+    events = [queue.get_nowait() for _ in range(queue.qsize())]
+    assert [e["type"] for e in events] == ["resync", "audit"]
+    assert bus.get_stats()["resyncs"] == 1
+
+def test_format_sse():
+    assert format_sse({"id": 3, "type": "digest", "data": {"date": "2024-01-02"}}) == (
+        'id: 3\nevent: digest\ndata: {"date": "2024-01-02"}\n\n'
+    )
@@ -0,0 +1,189 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from audit_log import AuditJournal
+from task_manager import TaskManager
+from learning_service import LearningService, estimate_tokens, merge_facts
+
+@pytest.fixture
+def task_manager(tmp_path):
+    tm = TaskManager()
+    tm.audit = AuditJournal(directory=tmp_path / "audit", legacy_file=tmp_path / "audit_log.json")
+    return tm
+
+def _log(tm, count, start=0):
+    for i in range(start, start + count):
+        tm.audit.append({"timestamp": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}", "sender": "bob", "text": f"msg {i}"})
+
+def _service(tm, tmp_path, facts=None):
+    agent = MagicMock()
+    agent.analyze_context_batch = AsyncMock(return_value=facts if facts is not None else ["fact"])
+    memory = MagicMock()
+    memory.add_memories.side_effect = lambda facts, source=None: len(facts)
+    return LearningService(agent, memory, tm, state_file=tmp_path / "learning_state.json")
+
+# Each logged line is ~9 tokens, so chunk_tokens=30 fits three lines per chunk
+CHUNK = 30
+
+def test_merge_facts_dedupes_across_chunks():
+    merged = merge_facts([["Uses Python.", "Works on Cortex"], ["uses  python", "Hates calls"], []])
+    assert merged == ["Uses Python.", "Works on Cortex", "Hates calls"]
+
+@pytest.mark.asyncio
+async def test_digest_maps_backlog_in_token_bounded_chunks(task_manager, tmp_path):
+    _log(task_manager, 25)
+    service = _service(task_manager, tmp_path)
+
+    await service.digest_context(chunk_tokens=CHUNK, max_concurrency=3)
+    calls = service.agent.analyze_context_batch.await_args_list
+    assert len(calls) == 9
+    assert all(estimate_tokens(c.args[0]) <= CHUNK for c in calls)
+    # Identical facts from every chunk are merged before reaching memory
+    batches = [c.args[0] for c in service.memory_manager.add_memories.call_args_list]
+    assert batches == [["fact"]] * 3 # One batch per wave
+    assert json.loads((tmp_path / "learning_state.json").read_text())["last_processed_seq"] == 25
+
+    # A fresh service resumes from the cursor and only sees new entries
+    _log(task_manager, 2, start=25)
+    service = _service(task_manager, tmp_path)
+    await service.digest_context(chunk_tokens=CHUNK)
+    history = service.agent.analyze_context_batch.await_args.args[0]
+    assert history.count("\n") == 1 and "msg 26" in history
+
+@pytest.mark.asyncio
+async def test_digest_failure_checkpoints_only_leading_successes(task_manager, tmp_path):
+    _log(task_manager, 12)
+    service = _service(task_manager, tmp_path)
+    service.agent.analyze_context_batch = AsyncMock(side_effect=[["a"], None, ["b"]])
+
+    await service.digest_context(chunk_tokens=CHUNK, max_concurrency=3)
+    assert service.last_seq == 3
+    service.memory_manager.add_memories.assert_called_once_with(["a"], source="context")
+
+@pytest.mark.asyncio
+async def test_chunk_that_keeps_failing_is_skipped(task_manager, tmp_path, monkeypatch):
+    import config
+    monkeypatch.setattr(config, "LEARNING_MAX_CHUNK_ATTEMPTS", 2)
+    _log(task_manager, 6)
+    service = _service(task_manager, tmp_path)
+
+    async def analyze(text, user_name):
+        return None if "msg 0" in text else ["b"]
+    service.agent.analyze_context_batch = AsyncMock(side_effect=analyze)
+
+    await service.digest_context(chunk_tokens=CHUNK, max_concurrency=1)
+    assert service.last_seq == 0
+    assert service.chunk_failures == {"3": 1}
+
+    reloaded = _service(task_manager, tmp_path)
+    reloaded.agent.analyze_context_batch = AsyncMock(side_effect=analyze)
+    await reloaded.digest_context(chunk_tokens=CHUNK, max_concurrency=1)
+    assert reloaded.last_seq == 6
+    assert reloaded.chunk_failures == {}
+    assert [(c["after_seq"], c["through_seq"]) for c in reloaded.skipped_chunks] == [(0, 3)]
+    reloaded.memory_manager.add_memories.assert_called_with(["b"], source="context")
+
+@pytest.mark.asyncio
+async def test_digest_stops_at_token_budget(task_manager, tmp_path):
+    _log(task_manager, 30)
+    service = _service(task_manager, tmp_path)
+
+    await service.digest_context(chunk_tokens=CHUNK, max_concurrency=2, token_budget=CHUNK)
+    assert service.agent.analyze_context_batch.await_count == 2
+    assert service.last_seq == 6
+
+@pytest.mark.asyncio
+async def test_digest_migrates_timestamp_state(task_manager, tmp_path):
+    _log(task_manager, 6)
+    (tmp_path / "learning_state.json").write_text(json.dumps({"last_processed_timestamp": "2026-01-01T00:00:03"}))
+    service = _service(task_manager, tmp_path)
+
+    await service.digest_context()
+    history = service.agent.analyze_context_batch.await_args.args[0]
+    assert "msg 3" not in history and "msg 4" in history
+    assert service.last_seq == 6 and service.last_ts is None
+
+@pytest.mark.asyncio
+async def test_feedback_is_learned_once_per_version(task_manager, tmp_path):
+    rejected = [
+        {"id": "t1", "summary": "Crypto news", "sender": "Bot", "comments": ["Ignore crypto"]},
+        {"id": "t2", "summary": "Standup", "sender": "Ann", "comments": ["Not on Fridays"]}
+    ]
+    task_manager.get_rejected_tasks_with_comments = AsyncMock(return_value=rejected)
+    service = _service(task_manager, tmp_path)
+    service.agent.analyze_feedback_batch = AsyncMock(return_value=["rule"])
+    service.memory_manager.consolidate_memories = AsyncMock()
+
+    await service.learn_from_feedback(consolidate_threshold=2)
+    await service.learn_from_feedback(consolidate_threshold=2)
+    assert service.agent.analyze_feedback_batch.await_count == 1
+
+    # An added comment changes the version, so only that task is re-analyzed
+    rejected[1]["comments"].append("Or Mondays")
+    service = _service(task_manager, tmp_path)
+    service.agent.analyze_feedback_batch = AsyncMock(return_value=["another rule"])
+    service.memory_manager.consolidate_memories = AsyncMock()
+    await service.learn_from_feedback(consolidate_threshold=2)
+
+    text = service.agent.analyze_feedback_batch.await_args.args[0]
+    assert "Standup" in text and "Crypto" not in text
+    service.memory_manager.consolidate_memories.assert_awaited_once()
+    assert service.rules_since_consolidation == 0
+
+@pytest.mark.asyncio
+async def test_should_run_on_volume_or_staleness(task_manager, tmp_path, monkeypatch):
+    import config
+    monkeypatch.setattr(config, "LEARNING_AUDIT_TRIGGER", 5)
+    monkeypatch.setattr(config, "LEARNING_FEEDBACK_TRIGGER", 2)
+    monkeypatch.setattr(config, "LEARNING_MAX_STALENESS", 3600)
+    service = _service(task_manager, tmp_path)
+    service.last_run_at = 1000.0
+
+    _log(task_manager, 4)
+    assert service.should_run(now=1001.0) is False
+    _log(task_manager, 1, start=4)
+    assert service.should_run(now=1001.0) is True
+
+    service.last_seq = 5
+    task_manager.feedback_changes = 2
+    assert service.should_run(now=1001.0) is True
+    service._feedback_seen = 2
+    assert service.should_run(now=1001.0) is False
+    assert service.should_run(now=1000.0 + 3600) is True
+
+@pytest.mark.asyncio
+async def test_run_that_hits_the_budget_cools_down(task_manager, tmp_path, monkeypatch):
+    import config
+    monkeypatch.setattr(config, "LEARNING_AUDIT_TRIGGER", 5)
+    monkeypatch.setattr(config, "LEARNING_RUN_TOKEN_BUDGET", CHUNK)
+    monkeypatch.setattr(config, "LEARNING_CHUNK_TOKENS", CHUNK)
+    monkeypatch.setattr(config, "LEARNING_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(config, "LEARNING_COOLDOWN_SECONDS", 600)
+    _log(task_manager, 30)
+    service = _service(task_manager, tmp_path)
+    task_manager.get_rejected_tasks_with_comments = AsyncMock(return_value=[])
+
+    await service.run_once()
+    assert 0 < service.last_seq < 30
+    assert service.pending_work()["audit"] >= 5
+    assert service.should_run(now=service.last_run_at + 60) is False
+    assert service.should_run(now=service.last_run_at + 600) is True
+
+    # A run that drains the backlog clears the cooldown
+    monkeypatch.setattr(config, "LEARNING_RUN_TOKEN_BUDGET", 10_000)
+    await service.run_once()
+    assert service.cooldown_until is None
+
+@pytest.mark.asyncio
+async def test_learning_waits_for_live_traffic(task_manager, tmp_path):
+    import asyncio
+    from rate_limiter import live_traffic
+    _log(task_manager, 3)
+    service = _service(task_manager, tmp_path)
+
+    with live_traffic.track():
+        job = asyncio.create_task(service.digest_context())
+        await asyncio.sleep(0.01)
+        assert service.agent.analyze_context_batch.await_count == 0
+    await job
+    assert service.agent.analyze_context_batch.await_count == 1
@@ -0,0 +1,113 @@
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from memory_manager import MemoryManager
+
+@pytest.fixture
+def memory(tmp_path):
+    return MemoryManager(storage_file=str(tmp_path / "memory.json"), db_path=tmp_path / "memory.db")
+
+def test_add_memories_dedupes_by_hash_in_one_batch(memory):
+    assert memory.add_memories(["Uses Python", "uses  python.", "Works on Cortex"], source="context") == 2
+    assert memory.add_memory("Works on Cortex") is False
+    assert memory.add_memory("Hates calls") is True
+    assert memory.memories == ["Uses Python", "Works on Cortex", "Hates calls"]
+    assert memory.get_memories_text() == "Long-term Memory (Facts):\n- Uses Python\n- Works on Cortex\n- Hates calls"
+
+def test_search_ranks_matches_and_counts_hits(memory):
+    memory.add_memories(["Prefers Rust for CLI tools", "Lives in Berlin", "Uses Rust and Go at work"])
+
+    results = memory.search("rust tooling?")
+    assert set(results) == {"Prefers Rust for CLI tools", "Uses Rust and Go at work"}
+    hits = memory._query("SELECT fact, hit_count FROM memories WHERE hit_count > 0")
+    assert {r["fact"] for r in hits} == set(results)
+
+def test_legacy_json_is_migrated(tmp_path):
+    legacy = tmp_path / "memory.json"
+    legacy.write_text(json.dumps({"facts": ["A", "B", "A"]}))
+
+    memory = MemoryManager(storage_file=str(legacy), db_path=tmp_path / "memory.db")
+    assert memory.memories == ["A", "B"]
+    assert not legacy.exists()
+    assert (tmp_path / "memory.json.migrated").exists()
+
+@pytest.mark.asyncio
+async def test_consolidation_is_local_first_and_incremental(memory):
+    memory.add_memories([
+        "Works at TechCorp as a backend engineer",
+        "Lives in Berlin",
+        "Prefers async communication over calls"
+    ])
+    agent = MagicMock()
+    agent.deduplicate_facts = AsyncMock()
+
+    # First pass indexes everything; nothing is similar enough to need the LLM
+    assert await memory.consolidate_memories(agent) is False
+    agent.deduplicate_facts.assert_not_awaited()
+
+    # A near-identical new fact is dropped locally; a related one forms a small cluster
+    memory.add_memories([
+        "Works at TechCorp as backend engineer",
+        "Works at TechCorp as a backend engineer on payments"
+    ])
+    version = memory.version
+    agent.deduplicate_facts.return_value = ["Works at TechCorp as a backend engineer on the payments team"]
+
+    assert await memory.consolidate_memories(agent) is True
+    cluster = agent.deduplicate_facts.await_args.args[0]
+    assert set(cluster) == {"Works at TechCorp as a backend engineer", "Works at TechCorp as a backend engineer on payments"}
+    assert memory.memories == [
+        "Lives in Berlin",
+        "Prefers async communication over calls",
+        "Works at TechCorp as a backend engineer on the payments team"
+    ]
+    assert memory.version > version
+
+    # Already-compared facts are not re-sent
+    agent.deduplicate_facts.reset_mock()
+    assert await memory.consolidate_memories(agent) is False
+    agent.deduplicate_facts.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_consolidation_keeps_cluster_when_llm_answer_is_unusable(memory):
+    memory.add_memories(["Uses Python for data pipelines"])
+    agent = MagicMock()
+    agent.deduplicate_facts = AsyncMock(return_value=[])
+    await memory.consolidate_memories(agent)
+    memory.add_memories(["Uses Python and Airflow for data pipelines"])
+
+    assert await memory.consolidate_memories(agent) is False
+    assert len(memory.memories) == 2
+
+@pytest.mark.asyncio
+async def test_cluster_is_retried_after_a_failed_llm_call(memory):
+    memory.add_memories(["Uses Python for data pipelines"])
+    agent = MagicMock()
+    agent.deduplicate_facts = AsyncMock(return_value=None)
+    await memory.consolidate_memories(agent)
+    memory.add_memories(["Uses Python and Airflow for data pipelines"])
+
+    assert await memory.consolidate_memories(agent) is False
+    assert agent.deduplicate_facts.await_count == 1
+
+    agent.deduplicate_facts.return_value = ["Uses Python and Airflow for data pipelines"]
+    assert await memory.consolidate_memories(agent) is True
+    assert set(agent.deduplicate_facts.await_args.args[0]) == {
+        "Uses Python for data pipelines", "Uses Python and Airflow for data pipelines"
+    }
+    assert memory.memories == ["Uses Python and Airflow for data pipelines"]
+
+    agent.deduplicate_facts.reset_mock()
+    assert await memory.consolidate_memories(agent) is False
+    agent.deduplicate_facts.assert_not_awaited()
+
+def test_near_duplicate_classification():
+    from near_duplicates import classify, MinHasher, shingles
+    assert classify("Lives in Berlin.", ["lives in berlin", "Likes tea"])[0] == "duplicate"
+    assert classify("Uses Python and Airflow for data pipelines", ["Uses Python for data pipelines"])[0] == "ambiguous"
+    assert classify("Likes tea", ["Lives in Berlin"]) == ("distinct", None)
+
+    hasher = MinHasher()
+    a = hasher.band_keys(hasher.signature(shingles("Works at TechCorp as a backend engineer")))
+    b = hasher.band_keys(hasher.signature(shingles("Works at TechCorp as backend engineer")))
+    assert set(a) & set(b)
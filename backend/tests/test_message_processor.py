@@ -68,3 +68,14 @@ async def test_process_message_calls_agent(processor):
     # Check if memory was passed
     call_args = processor.agent.analyze_message.call_args
     assert "MemoryContext" in call_args[0][3]
+
+@pytest.mark.asyncio
+async def test_process_message_uses_context_cache(processor):
+    processor.agent.analyze_message.return_value = {"summary": "Task", "priority": 1}
+    processor.context_cache = MagicMock()
+    processor.context_cache.bundle = AsyncMock(return_value="CachedBundle")
+
+    await processor.process_message({"sender": "Bob", "text": "Do this"}, "History", "BotName")
+
+    assert processor.agent.analyze_message.call_args[0][3] == "CachedBundle"
+    processor.memory_manager.get_memories_text.assert_not_called()
@@ -1,4 +1,5 @@
 import pytest
+import time
 from unittest.mock import AsyncMock, MagicMock
 from notion_sync import NotionSync
 
@@ -70,3 +71,100 @@ async def test_find_task_by_link_remote_hit():
     assert result == "found-id"
     mock_client.search.assert_called_once()
     assert link in sync._seen_links # Should cache it
+
+@pytest.mark.asyncio
+async def test_add_comment_single_write_without_retrieve(tmp_path):
+    # Arrange
+    from comment_store import CommentStore
+    mock_client = AsyncMock()
+    store = CommentStore(tmp_path / "comments.db")
+    store.merge("page-1", []) # Page already known locally
+    sync = NotionSync(client=mock_client, comment_store=store)
+
+    # Act
+    comment = await sync.add_comment("page-1", "Looks good", "Alice")
+
+    # Assert
+    mock_client.pages.retrieve.assert_not_called()
+    mock_client.pages.update.assert_called_once()
+    rich_text = mock_client.pages.update.call_args[1]['properties']['AgentComments']['rich_text']
+    assert comment['id'] in rich_text[0]['text']['content']
+    assert store.list("page-1")[0]['text'] == "Looks good"
+
+@pytest.mark.asyncio
+async def test_long_comment_history_is_chunked(tmp_path, monkeypatch):
+    # Arrange
+    import notion_sync
+    from comment_store import CommentStore
+    from rate_limiter import TokenBucketLimiter
+    monkeypatch.setattr(notion_sync, "notion_limiter", TokenBucketLimiter(rate=1000, burst=100))
+    mock_client = AsyncMock()
+    store = CommentStore(tmp_path / "comments.db")
+    store.merge("page-1", [])
+    sync = NotionSync(client=mock_client, comment_store=store)
+
+    # Act
+    for i in range(30):
+        await sync.add_comment("page-1", f"Comment {i} " + "x" * 200, "Bob")
+
+    # Assert: nothing truncated, every chunk within Notion's limit
+    rich_text = mock_client.pages.update.call_args[1]['properties']['AgentComments']['rich_text']
+    full_text = "".join(t['text']['content'] for t in rich_text)
+    assert len(rich_text) > 1
+    assert all(len(t['text']['content']) <= 2000 for t in rich_text)
+    assert len(sync._parse_comments_text(full_text)) == 30
+
+@pytest.mark.asyncio
+async def test_legacy_comments_seeded_once_and_deleted(tmp_path):
+    # Arrange
+    from comment_store import CommentStore
+    mock_client = AsyncMock()
+    mock_client.pages.retrieve.return_value = {
+        "properties": {
+            "AgentComments": {"rich_text": [{"text": {"content": "[abc12345] 2024-01-01 10:00:00 Alice: Old note"}}]}
+        }
+    }
+    sync = NotionSync(client=mock_client, comment_store=CommentStore(tmp_path / "comments.db"))
+
+    # Act
+    deleted = await sync.delete_comment("page-1", "abc12345")
+    comments = await sync.get_comments("page-1")
+
+    # Assert
+    assert deleted is True
+    assert comments == []
+    mock_client.pages.retrieve.assert_called_once()
+
+def test_comment_text_round_trip_is_stable():
+    sync = NotionSync(client=AsyncMock())
+    text = "Call Ann first\n[abc12345] 2024-01-01 10:00:00 Alice: Old note"
+    for _ in range(3):
+        comments = sync._parse_comments_text(text)[::-1]
+        rendered = "".join(t["text"]["content"] for t in sync._render_comments(comments))
+        assert rendered == text
+        text = rendered
+    assert [c["id"] for c in comments][1] == "abc12345"
+    assert comments[0]["id"].startswith("legacy-")
+
+@pytest.mark.asyncio
+async def test_comments_deleted_in_notion_are_not_pushed_back(tmp_path):
+    from comment_store import CommentStore
+    store = CommentStore(tmp_path / "comments.db")
+    mock_client = AsyncMock()
+    sync = NotionSync(client=mock_client, comment_store=store)
+    store.merge("page-1", [])
+    first = await sync.add_comment("page-1", "keep", "Ann")
+    second = await sync.add_comment("page-1", "drop", "Ann")
+    written = mock_client.pages.update.call_args[1]['properties']['AgentComments']['rich_text'][0]['text']['content']
+
+    # Someone deletes the second line in Notion; a later read sees it gone
+    kept = written.split("\n")[0]
+    sync._merge_comments_text("page-1", kept, read_at=time.monotonic())
+    assert [c["id"] for c in store.list("page-1")] == [first["id"]]
+
+    # A read that started before our own write is not trusted for deletions
+    read_at = time.monotonic()
+    await sync.add_comment("page-1", "late", "Ann")
+    sync._merge_comments_text("page-1", kept, read_at=read_at)
+    assert [c["text"] for c in store.list("page-1")] == ["keep", "late"]
+    assert second["id"] not in mock_client.pages.update.call_args[1]['properties']['AgentComments']['rich_text'][0]['text']['content']
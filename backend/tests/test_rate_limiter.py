@@ -0,0 +1,141 @@
+import asyncio
+import pytest
+from rate_limiter import (
+    TokenBucketLimiter,
+    ConcurrencyLimiter,
+    RateLimitedError,
+    retry_after_from_error,
+    notion_priority,
+    current_priority,
+    PRIORITY_LIVE,
+    PRIORITY_BACKGROUND,
+    PRIORITY_DEFAULT,
+)
+
+class FakeRateLimit(Exception):
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.status = 429
+        self.code = "rate_limited"
+        self.headers = headers
+
+@pytest.mark.asyncio
+async def test_burst_is_served_without_waiting():
+    limiter = TokenBucketLimiter(rate=1, burst=3)
+
+    for _ in range(3):
+        await limiter.acquire()
+
+    stats = limiter.get_stats()
+    assert stats["priorities"]["default"]["acquired"] == 3
+    assert stats["throttled_seconds"] == 0
+
+@pytest.mark.asyncio
+async def test_live_waiters_jump_the_queue():
+    limiter = TokenBucketLimiter(rate=50, burst=1)
+    await limiter.acquire() # Drain the bucket
+    order = []
+
+    async def worker(name, level):
+        await limiter.acquire(priority=level)
+        order.append(name)
+
+    # Background work queues first, live work arrives later
+    background = [asyncio.create_task(worker(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(3)]
+    await asyncio.sleep(0)
+    live = asyncio.create_task(worker("live", PRIORITY_LIVE))
+    await asyncio.gather(*background, live)
+
+    assert order[0] == "live"
+    assert limiter.get_stats()["priorities"]["background"]["throttled"] == 3
+
+@pytest.mark.asyncio
+async def test_penalize_blocks_until_retry_after():
+    limiter = TokenBucketLimiter(rate=100, burst=5)
+    limiter.penalize(0.1)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await limiter.acquire()
+
+    assert loop.time() - start >= 0.09
+    assert limiter.get_stats()["rate_limited_responses"] == 1
+
+def test_retry_after_from_error():
+    assert retry_after_from_error(FakeRateLimit({"Retry-After": "7"})) == 7.0
+    assert retry_after_from_error(FakeRateLimit({})) == 1.0
+    assert retry_after_from_error(ValueError("boom")) is None
+
+def test_priority_context():
+    assert current_priority() == PRIORITY_DEFAULT
+    with notion_priority(PRIORITY_LIVE):
+        assert current_priority() == PRIORITY_LIVE
+    assert current_priority() == PRIORITY_DEFAULT
+
+@pytest.mark.asyncio
+async def test_notion_sync_converts_429(monkeypatch):
+    from unittest.mock import AsyncMock
+    import notion_sync
+    from notion_sync import NotionSync
+
+    limiter = TokenBucketLimiter(rate=100, burst=5)
+    monkeypatch.setattr(notion_sync, "notion_limiter", limiter)
+
+    sync = NotionSync(client=AsyncMock())
+    method = AsyncMock(side_effect=FakeRateLimit({"Retry-After": "2"}))
+
+    with pytest.raises(RateLimitedError) as exc:
+        await sync._request(method)
+
+    assert exc.value.retry_after == 2.0
+    assert limiter.get_stats()["rate_limited_responses"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_caps_in_flight_calls():
+    limiter = ConcurrencyLimiter(2, name="test")
+
+    async def call():
+        async with limiter:
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(call() for _ in range(5)))
+
+    stats = limiter.get_stats()
+    assert stats["peak"] == 2
+    assert stats["acquired"] == 5
+    assert stats["waited"] >= 1
+    assert stats["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_concurrency_limiter_serves_live_before_queued_background():
+    limiter = ConcurrencyLimiter(1, name="test")
+    order = []
+
+    async def worker(name, level):
+        with notion_priority(level):
+            async with limiter:
+                order.append(name)
+
+    async with limiter: # Every slot busy
+        background = [asyncio.create_task(worker(f"bg{i}", PRIORITY_BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0)
+        live = asyncio.create_task(worker("live", PRIORITY_LIVE))
+        await asyncio.sleep(0)
+        assert limiter.get_stats()["queued"] == 4
+    await asyncio.gather(live, *background)
+
+    assert order == ["live", "bg0", "bg1", "bg2"]
+    assert limiter.get_stats()["in_flight"] == 0
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = ConcurrencyLimiter(1, name="test")
+    async with limiter:
+        waiter = asyncio.ensure_future(limiter.__aenter__())
+        await asyncio.sleep(0)
+        waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    async with limiter:
+        assert limiter.get_stats()["in_flight"] == 1
+    assert limiter._available == 1
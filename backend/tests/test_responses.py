@@ -0,0 +1,90 @@
+import json
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+from responses import CompressionMiddleware, FastJSONResponse, choose_encoding, dumps, etag_matches
+
+def _client(minimum_size=100):
+    async def big(request):
+        return FastJSONResponse([{"summary": "task", "comments": ["x" * 20]}] * 50)
+
+    async def small(request):
+        return PlainTextResponse("ok")
+
+    async def events(request):
+        async def stream():
+            yield "data: {}\n\n"
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    async def download(request):
+        async def stream():
+            for _ in range(20):
+                yield b"x" * 100
+        return StreamingResponse(stream(), media_type="application/octet-stream")
+
+    async def png(request):
+        return Response(b"\x89PNG" + b"\0" * 500, media_type="image/png")
+
+    app = Starlette(routes=[
+        Route("/big", big), Route("/small", small), Route("/events", events),
+        Route("/download", download), Route("/png", png)
+    ])
+    app.add_middleware(CompressionMiddleware, minimum_size=minimum_size, encodings=["gzip"])
+    return TestClient(app)
+
+def test_large_json_is_gzipped_small_and_streams_are_not():
+    client = _client()
+
+    big = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert big.headers["content-encoding"] == "gzip"
+    assert int(big.headers["content-length"]) < len(dumps(big.json()))
+    assert len(big.json()) == 50
+
+    plain = client.get("/big", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+
+    assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+    assert "content-encoding" not in client.get("/events", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_choose_encoding_respects_preference_and_q_zero():
+    assert choose_encoding("gzip, deflate, br", ["br", "gzip"]) == "br"
+    assert choose_encoding("br;q=0, gzip", ["br", "gzip"]) == "gzip"
+    assert choose_encoding("identity", ["br", "gzip"]) is None
+
+def test_fast_json_matches_stdlib():
+    content = {"text": "Привет 👋", "n": [1, 2.5, None, True]}
+    assert json.loads(FastJSONResponse(content).body) == content
+
+def test_vary_is_sent_whenever_the_body_depends_on_accept_encoding():
+    client = _client()
+    assert client.get("/big", headers={"Accept-Encoding": "gzip"}).headers["vary"] == "Accept-Encoding"
+    assert client.get("/big", headers={"Accept-Encoding": "identity"}).headers["vary"] == "Accept-Encoding"
+    assert client.get("/small", headers={"Accept-Encoding": "gzip"}).headers["vary"] == "Accept-Encoding"
+
+def test_streams_and_compressed_media_pass_through():
+    client = _client()
+    download = client.get("/download", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in download.headers and len(download.content) == 2000
+    png = client.get("/png", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in png.headers and png.content.startswith(b"\x89PNG")
+
+def test_etag_matches_weakly():
+    assert etag_matches('W/"ab.3"', 'W/"ab.3"')
+    assert etag_matches('"ab.3"', 'W/"ab.3"')
+    assert etag_matches('"x", W/"ab.3"', 'W/"ab.3"')
+    assert etag_matches("*", 'W/"ab.3"')
+    assert not etag_matches('W/"ab.2"', 'W/"ab.3"')
+    assert not etag_matches(None, 'W/"ab.3"')
+
+def test_body_sent_in_parts_is_forwarded_unbuffered():
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"text/plain"), (b"content-length", b"2000")]})
+        for i in range(20):
+            await send({"type": "http.response.body", "body": b"x" * 100, "more_body": i < 19})
+
+    response = TestClient(CompressionMiddleware(app, minimum_size=100, encodings=["gzip"])).get(
+        "/", headers={"Accept-Encoding": "gzip"}
+    )
+    assert "content-encoding" not in response.headers and len(response.content) == 2000
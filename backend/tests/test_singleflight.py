@@ -0,0 +1,77 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_request():
+    flight = SingleFlight("test")
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return ["task"]
+
+    results = await asyncio.gather(*(flight.do(("get_tasks",), fetch) for _ in range(5)))
+
+    assert calls == 1
+    assert all(r == ["task"] for r in results)
+    stats = flight.get_stats()
+    assert stats["executed"] == 1 and stats["shared"] == 4 and stats["in_flight"] == 0
+    assert stats["by_kind"] == {"get_tasks": {"executed": 1, "shared": 4}}
+
+    # Finished calls are not cached
+    await flight.do(("get_tasks",), fetch)
+    assert calls == 2
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller_and_forget_starts_fresh():
+    flight = SingleFlight("test")
+    started = []
+
+    async def failing():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("notion down")
+
+    results = await asyncio.gather(*(flight.do(("q", 1), failing) for _ in range(3)), return_exceptions=True)
+    assert len(started) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def slow():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "fresh"
+
+    first = asyncio.ensure_future(flight.do(("q", 1), slow))
+    await asyncio.sleep(0)
+    flight.forget(("q", 1))
+    second = await flight.do(("q", 1), slow)
+    assert await first == "fresh" and second == "fresh"
+    assert len(started) == 3
+
+@pytest.mark.asyncio
+async def test_live_caller_does_not_wait_on_a_background_fetch():
+    from rate_limiter import notion_priority, current_priority, PRIORITY_LIVE, PRIORITY_BACKGROUND
+    flight = SingleFlight("test")
+    levels = []
+
+    async def fetch():
+        levels.append(current_priority())
+        await asyncio.sleep(0.01)
+        return ["task"]
+
+    async def read(level):
+        with notion_priority(level):
+            return await flight.do(("get_tasks",), fetch)
+
+    background = asyncio.ensure_future(read(PRIORITY_BACKGROUND))
+    await asyncio.sleep(0)
+    live = asyncio.ensure_future(read(PRIORITY_LIVE))
+    await asyncio.sleep(0)
+    later = asyncio.ensure_future(read(PRIORITY_BACKGROUND)) # Joins the live call
+    await asyncio.gather(background, live, later)
+
+    assert levels == [PRIORITY_BACKGROUND, PRIORITY_LIVE]
+    assert flight.get_stats()["shared"] == 1
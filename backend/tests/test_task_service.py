@@ -0,0 +1,457 @@
+import uuid
+import pytest
+from task_manager import TaskManager
+from local_task_manager import LocalTaskManager
+
+class FakeNotionSync:
+    """In-memory stand-in for NotionSync, so the Notion path runs without the network."""
+
+    def __init__(self):
+        self.pages = {}
+        self.comments = {}
+
+    async def create_task_page(self, task):
+        page_id = str(uuid.uuid4())
+        self.pages[page_id] = {**task, "id": page_id, "notion_page_id": page_id}
+        return page_id
+
+    async def find_task_by_link(self, link):
+        for page in self.pages.values():
+            if page.get("link") == link:
+                return page["id"]
+        return None
+
+    async def update_task_status(self, page_id, status):
+        self.pages[page_id]["status"] = status
+
+    async def update_task_priority(self, page_id, priority):
+        self.pages[page_id]["priority"] = int(priority)
+        return True
+
+    async def get_tasks(self):
+        return [
+            {**p, "comments": list(reversed(self.comments.get(p["id"], [])))}
+            for p in reversed(list(self.pages.values()))
+        ]
+
+    async def add_comment(self, page_id, text, sender="Unknown"):
+        comment = {"id": str(uuid.uuid4())[:8], "timestamp": "", "sender": sender, "text": text}
+        self.comments.setdefault(page_id, []).append(comment)
+        return comment
+
+    async def get_comments(self, page_id):
+        return list(reversed(self.comments.get(page_id, [])))
+
+    async def delete_comment(self, page_id, comment_id):
+        before = self.comments.get(page_id, [])
+        self.comments[page_id] = [c for c in before if c["id"] != comment_id]
+        return len(before) != len(self.comments[page_id])
+
+@pytest.fixture(params=["notion", "sqlite"])
+def service(request, tmp_path):
+    if request.param == "notion":
+        tm = TaskManager()
+        tm.notion_sync = FakeNotionSync()
+        return tm
+    return LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=False)
+
+@pytest.mark.asyncio
+async def test_add_task_deduplicates_by_link(service):
+    first = await service.add_task(2, "Review PR", "Alice", "https://t.me/c/1/1")
+    second = await service.add_task(2, "Review PR", "Alice", "https://t.me/c/1/1")
+
+    assert first["is_new"] is True
+    assert second["is_new"] is False
+    assert second["id"] == first["id"]
+    assert len(await service.get_tasks()) == 1
+
+@pytest.mark.asyncio
+async def test_status_changes_drive_queries(service):
+    done = await service.add_task(1, "Ship release", "Bob", "https://t.me/c/1/2")
+    rejected = await service.add_task(3, "Crypto news", "Bot", "https://t.me/c/1/3")
+    await service.add_task(2, "Still open", "Carol", "https://t.me/c/1/4", deadline="Friday")
+
+    await service.mark_done(done["id"])
+    await service.reject_task(rejected["id"])
+    await service.add_comment(rejected["id"], "Ignore crypto news", "User")
+
+    recent = await service.get_recent_done_tasks()
+    assert [t["summary"] for t in recent] == ["Ship release"]
+
+    prefs = await service.get_preference_examples()
+    assert [t["summary"] for t in prefs["accepted"]] == ["Ship release"]
+    assert prefs["rejected"][0]["comments"] == ["Ignore crypto news"]
+
+    feedback = await service.get_rejected_tasks_with_comments()
+    assert feedback == [{"id": rejected["id"], "summary": "Crypto news", "sender": "Bot", "comments": ["Ignore crypto news"]}]
+
+    briefing = await service.get_daily_briefing_tasks()
+    assert [t["summary"] for t in briefing["top_tasks"]] == ["Still open"]
+    assert [t["summary"] for t in briefing["deadline_tasks"]] == ["Still open"]
+
+    await service.reopen_task(done["id"])
+    assert await service.get_recent_done_tasks() == []
+
+@pytest.mark.asyncio
+async def test_comments_and_priority(service):
+    task = await service.add_task(3, "Call back", "Dan", "https://t.me/c/1/5")
+
+    first = await service.add_comment(task["id"], "first", "User")
+    await service.add_comment(task["id"], "second", "User")
+    comments = await service.get_comments(task["id"])
+    assert [c["text"] for c in comments] == ["second", "first"]
+
+    assert await service.delete_comment(task["id"], first["id"]) is True
+    assert [c["text"] for c in await service.get_comments(task["id"])] == ["second"]
+
+    assert await service.update_priority(task["id"], 1) is True
+    tasks = await service.get_tasks()
+    assert tasks[0]["priority"] == 1
+
+@pytest.mark.asyncio
+async def test_changes_are_published_as_events(service):
+    from events import event_bus
+    queue = event_bus.subscribe()
+    try:
+        task = await service.add_task(2, "Send invoice", "Eve", "https://t.me/c/1/9")
+        await service.mark_done(task["id"])
+        await service.update_priority(task["id"], 1)
+
+        changes = [queue.get_nowait()["data"] for _ in range(queue.qsize())]
+    finally:
+        event_bus.unsubscribe(queue)
+
+    assert [c["action"] for c in changes] == ["created", "status", "priority"]
+    assert changes[0]["task"]["summary"] == "Send invoice"
+    assert changes[1]["task"] == {"id": task["id"], "status": "done"}
+    assert changes[2]["task"] == {"id": task["id"], "priority": 1}
+
+@pytest.mark.asyncio
+async def test_failed_writes_publish_nothing(service):
+    from events import event_bus
+    task = await service.add_task(2, "Send invoice", "Eve", "https://t.me/c/1/11")
+    if isinstance(service.notion_sync, FakeNotionSync):
+        async def rejected(page_id, priority):
+            return False
+        service.notion_sync.update_task_priority = rejected
+    else:
+        task = {"id": "missing"}
+    version = service.version
+    queue = event_bus.subscribe()
+    try:
+        assert await service.delete_comment(task["id"], "nope") is False
+        assert await service.update_priority(task["id"], 1) is False
+        assert queue.qsize() == 0
+    finally:
+        event_bus.unsubscribe(queue)
+    assert service.version == version
+
+@pytest.mark.asyncio
+async def test_tasks_gone_from_notion_are_published_as_removed():
+    from events import event_bus
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    task = await tm.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/16")
+    await tm.get_tasks()
+
+    del tm.notion_sync.pages[task["id"]]
+    queue = event_bus.subscribe()
+    try:
+        await tm.get_tasks()
+        changes = [queue.get_nowait()["data"] for _ in range(queue.qsize())]
+    finally:
+        event_bus.unsubscribe(queue)
+    assert [(c["action"], c["task"]) for c in changes] == [("removed", {"id": task["id"]})]
+
+@pytest.mark.asyncio
+async def test_task_changes_since_cursor(service):
+    kept = await service.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/10")
+    other = await service.add_task(3, "Book flights", "Ann", "https://t.me/c/1/11")
+
+    # Unknown cursor: full list
+    first = await service.get_task_changes(None)
+    assert first["reset"] is True
+    assert {t["id"] for t in first["changed"]} == {kept["id"], other["id"]}
+
+    unchanged = await service.get_task_changes(first["version"])
+    assert unchanged == {"version": first["version"], "reset": False, "changed": [], "removed": []}
+
+    await service.mark_done(other["id"])
+    await service.add_comment(other["id"], "Booked", "User")
+    delta = await service.get_task_changes(first["version"])
+    assert delta["reset"] is False
+    assert [t["id"] for t in delta["changed"]] == [other["id"]]
+    assert delta["changed"][0]["status"] == "done"
+    assert [c["text"] for c in delta["changed"][0]["comments"]] == ["Booked"]
+
+    # Cursors from another run are not trusted
+    assert (await service.get_task_changes("0123abcd.1"))["reset"] is True
+
+@pytest.mark.asyncio
+async def test_notion_edits_and_deletes_reach_the_change_log():
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    task = await tm.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/10")
+    cursor = (await tm.get_task_changes(None))["version"]
+
+    tm.notion_sync.pages[task["id"]]["summary"] = "Pay rent today"
+    await tm.get_tasks()
+    delta = await tm.get_task_changes(cursor)
+    assert [t["summary"] for t in delta["changed"]] == ["Pay rent today"]
+
+    del tm.notion_sync.pages[task["id"]]
+    await tm.get_tasks()
+    delta = await tm.get_task_changes(delta["version"])
+    assert delta["changed"] == [] and delta["removed"] == [task["id"]]
+
+@pytest.mark.asyncio
+async def test_delta_refreshes_a_stale_notion_snapshot(monkeypatch):
+    import config
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    task = await tm.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/12")
+    cursor = (await tm.get_task_changes(None))["version"]
+
+    tm.notion_sync.pages[task["id"]]["summary"] = "Pay rent today"
+    monkeypatch.setattr(config, "TASK_CHANGES_REFRESH_SECONDS", 60)
+    assert (await tm.get_task_changes(cursor))["changed"] == []
+
+    monkeypatch.setattr(config, "TASK_CHANGES_REFRESH_SECONDS", -1)
+    delta = await tm.get_task_changes(cursor)
+    assert [t["summary"] for t in delta["changed"]] == ["Pay rent today"]
+
+@pytest.mark.asyncio
+async def test_fetch_overlapping_a_write_is_not_diffed():
+    import asyncio
+    from events import event_bus
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    task = await tm.add_task(3, "Call back", "Dan", "https://t.me/c/1/13")
+    await tm.get_tasks()
+
+    release = asyncio.Event()
+    fetch = tm.notion_sync.get_tasks
+    async def slow_fetch():
+        snapshot = await fetch() # Taken before the write below
+        await release.wait()
+        return snapshot
+    tm.notion_sync.get_tasks = slow_fetch
+
+    pending = asyncio.ensure_future(tm.get_tasks())
+    await asyncio.sleep(0)
+    await tm.update_priority(task["id"], 1)
+    version = tm.version
+    queue = event_bus.subscribe()
+    try:
+        release.set()
+        await pending
+        assert queue.qsize() == 0
+    finally:
+        event_bus.unsubscribe(queue)
+    assert tm.version == version
+    assert tm._known[task["id"]]["priority"] == 1
+
+@pytest.mark.asyncio
+async def test_change_during_delta_lookup_is_not_skipped(monkeypatch):
+    import asyncio
+    import config
+    monkeypatch.setattr(config, "TASK_CHANGES_REFRESH_SECONDS", 60)
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    first = await tm.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/14")
+    second = await tm.add_task(2, "Book flights", "Ann", "https://t.me/c/1/15")
+    cursor = (await tm.get_task_changes(None))["version"]
+    await tm.add_comment(first["id"], "today", "User")
+
+    release = asyncio.Event()
+    comments = tm.notion_sync.get_comments
+    async def slow_comments(page_id):
+        await release.wait()
+        return await comments(page_id)
+    tm.notion_sync.get_comments = slow_comments
+
+    pending = asyncio.ensure_future(tm.get_task_changes(cursor))
+    await asyncio.sleep(0)
+    await tm.mark_done(second["id"]) # Lands while the delta is looking up the first task
+    release.set()
+    delta = await pending
+    assert [t["id"] for t in delta["changed"]] == [first["id"]]
+
+    delta = await tm.get_task_changes(delta["version"])
+    assert [t["id"] for t in delta["changed"]] == [second["id"]]
+
+@pytest.mark.asyncio
+async def test_concurrent_notion_reads_share_one_fetch():
+    import asyncio
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    await tm.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/10")
+
+    fetches = 0
+    original = tm.notion_sync.get_tasks
+    async def counted():
+        nonlocal fetches
+        fetches += 1
+        await asyncio.sleep(0.01)
+        return await original()
+    tm.notion_sync.get_tasks = counted
+
+    recent, prefs, tasks = await asyncio.gather(
+        tm.get_recent_done_tasks(), tm.get_preference_examples(), tm.get_tasks()
+    )
+    assert fetches == 1
+    assert [t["summary"] for t in tasks] == ["Pay rent"]
+
+@pytest.mark.asyncio
+async def test_bulk_operations_report_per_item_results(service):
+    first = await service.add_task(2, "Pay rent", "Ann", "https://t.me/c/1/20")
+    second = await service.add_task(3, "Book flights", "Ann", "https://t.me/c/1/21")
+    third = await service.add_task(3, "Renew passport", "Ann", "https://t.me/c/1/22")
+
+    results = await service.apply_bulk([
+        {"op": "done", "id": first["id"]},
+        {"op": "reject", "id": second["id"]},
+        {"op": "priority", "id": third["id"], "priority": 1},
+        {"op": "archive", "id": third["id"]},
+        {"op": "priority", "id": third["id"]},
+    ], max_concurrency=2)
+
+    assert [r["status"] for r in results] == ["success", "success", "success", "error", "error"]
+    assert results[3]["error"] == "Unknown operation: archive"
+
+    statuses = {t["id"]: (t["status"], t["priority"]) for t in await service.get_tasks()}
+    assert statuses[first["id"]][0] == "done"
+    assert statuses[second["id"]][0] == "rejected"
+    assert statuses[third["id"]] == ("active", 1)
+
+@pytest.mark.asyncio
+async def test_version_moves_only_after_the_notion_write():
+    import asyncio
+    from context_cache import ContextBundleCache
+    tm = TaskManager()
+    tm.notion_sync = FakeNotionSync()
+    task = await tm.add_task(3, "Call back", "Dan", "https://t.me/c/1/30")
+    cache = ContextBundleCache(None, tm)
+
+    release = asyncio.Event()
+    write = tm.notion_sync.update_task_priority
+    async def slow_write(page_id, priority):
+        await release.wait()
+        return await write(page_id, priority)
+    tm.notion_sync.update_task_priority = slow_write
+
+    pending = asyncio.ensure_future(tm.update_priority(task["id"], 1))
+    await asyncio.sleep(0)
+    before = tm.version
+    await cache.task_text() # Reads pre-write data while the write is in flight
+    release.set()
+    await pending
+
+    assert tm.version > before
+    misses = cache.get_stats()["misses"]
+    await cache.task_text()
+    assert cache.get_stats()["misses"] == misses + 1
+
+@pytest.mark.asyncio
+async def test_local_backend_replicates_to_notion(tmp_path):
+    service = LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=True)
+    service.notion_sync = FakeNotionSync()
+
+    task = await service.add_task(2, "Replicate me", "Eve", "https://t.me/c/1/6")
+    await service.mark_done(task["id"])
+    await service.flush_replication()
+
+    pages = list(service.notion_sync.pages.values())
+    assert len(pages) == 1
+    assert pages[0]["summary"] == "Replicate me"
+    assert pages[0]["status"] == "done"
+    assert (await service.get_tasks())[0]["notion_page_id"] == pages[0]["id"]
+
+@pytest.mark.asyncio
+async def test_failed_replication_is_retried_from_the_outbox(tmp_path):
+    service = LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=True)
+    service.notion_sync = FakeNotionSync()
+    create = service.notion_sync.create_task_page
+
+    async def offline(task):
+        raise ConnectionError("offline")
+    service.notion_sync.create_task_page = offline
+
+    task = await service.add_task(2, "Replicate later", "Eve", "https://t.me/c/1/7")
+    await service.mark_done(task["id"])
+    await service.flush_replication()
+    assert service.notion_sync.pages == {}
+    assert {r["action"] for r in service._query("SELECT action FROM replication_outbox")} == {"create", "status"}
+
+    # Next start: Notion is back and the outbox is drained in order
+    service.conn.close()
+    restarted = LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=True)
+    restarted.notion_sync = service.notion_sync
+    restarted.notion_sync.create_task_page = create
+    assert restarted.retry_replication() == 1
+    await restarted.flush_replication()
+
+    pages = list(restarted.notion_sync.pages.values())
+    assert [(p["summary"], p["status"]) for p in pages] == [("Replicate later", "done")]
+    assert restarted._query("SELECT * FROM replication_outbox") == []
+
+@pytest.mark.asyncio
+async def test_outbox_drains_while_running_once_notion_is_back(tmp_path, monkeypatch):
+    import asyncio
+    import config
+    monkeypatch.setattr(config, "TASK_REPLICATION_RETRY_SECONDS", 0)
+    service = LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=True)
+    service.notion_sync = FakeNotionSync()
+    create = service.notion_sync.create_task_page
+
+    async def offline(task):
+        raise ConnectionError("offline")
+    service.notion_sync.create_task_page = offline
+    first = await service.add_task(2, "First", "Eve", "https://t.me/c/1/40")
+    await service.add_task(2, "Second", "Eve", "https://t.me/c/1/41")
+    await service.flush_replication()
+    assert service.notion_sync.pages == {}
+
+    # Any successful push drains every task's failed rows
+    service.notion_sync.create_task_page = create
+    await service.mark_done(first["id"])
+    await service.flush_replication()
+    assert sorted(p["summary"] for p in service.notion_sync.pages.values()) == ["First", "Second"]
+    assert service._query("SELECT * FROM replication_outbox") == []
+
+    # Without any new write, the background loop retries on its own
+    service.notion_sync.create_task_page = offline
+    await service.add_task(2, "Third", "Eve", "https://t.me/c/1/42")
+    await service.flush_replication()
+    service.notion_sync.create_task_page = create
+    retries = asyncio.ensure_future(service.start_replication_retries())
+    for _ in range(20):
+        await asyncio.sleep(0)
+        await service.flush_replication()
+    retries.cancel()
+    await retries
+    assert len(service.notion_sync.pages) == 3
+
+def test_replication_is_disabled_without_notion(tmp_path, monkeypatch):
+    import local_task_manager
+    monkeypatch.setattr(local_task_manager, "NOTION_TOKEN", None)
+    service = LocalTaskManager(db_path=tmp_path / "tasks.db", replicate_to_notion=True)
+    assert service.replicate is False
+
+@pytest.mark.asyncio
+async def test_deadline_windows(service):
+    from datetime import date, timedelta
+    today = date.today()
+    await service.add_task(2, "Due today", "Ann", "https://t.me/c/2/1", deadline="today")
+    await service.add_task(2, "Overdue", "Ann", "https://t.me/c/2/2", deadline=(today - timedelta(days=3)).isoformat())
+    await service.add_task(2, "Vague", "Ann", "https://t.me/c/2/3", deadline="at some point")
+    done = await service.add_task(2, "Done today", "Ann", "https://t.me/c/2/4", deadline="today")
+    await service.mark_done(done["id"])
+
+    assert [t["summary"] for t in await service.get_deadline_tasks("today")] == ["Due today"]
+    assert [t["summary"] for t in await service.get_deadline_tasks("overdue")] == ["Overdue"]
+    assert [t["summary"] for t in await service.get_deadline_tasks("unparsed")] == ["Vague"]
+
+    briefing = await service.get_daily_briefing_tasks()
+    assert [t["summary"] for t in briefing["overdue_tasks"]] == ["Overdue"]
+    assert [t["summary"] for t in briefing["deadline_tasks"]] == ["Due today", "Vague"]
@@ -0,0 +1,141 @@
+import pytest
+from unittest.mock import AsyncMock
+from utils import retry_with_backoff, is_retryable, CircuitBreaker, CircuitOpenError
+
+class FakeAPIError(Exception):
+    def __init__(self, status, code):
+        super().__init__(code)
+        self.status = status
+        self.code = code
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_is_retryable_classification():
+    assert is_retryable(FakeAPIError(400, "validation_error")) is False
+    assert is_retryable(FakeAPIError(404, "object_not_found")) is False
+    assert is_retryable(FakeAPIError(503, "service_unavailable")) is True
+    assert is_retryable(FakeAPIError(429, "rate_limited")) is True
+    assert is_retryable(ConnectionError("reset")) is True
+    assert is_retryable(KeyError("Deadline")) is False
+    assert is_retryable(CircuitOpenError("notion", 10)) is False
+
+def test_notion_timeouts_and_server_codes_are_retryable():
+    from notion_client.errors import RequestTimeoutError
+    assert is_retryable(RequestTimeoutError()) is True
+    for code in ("internal_server_error", "service_unavailable", "gateway_timeout", "conflict_error"):
+        assert is_retryable(FakeAPIError(None, code)) is True
+
+@pytest.mark.asyncio
+async def test_repeated_notion_timeouts_open_the_breaker():
+    from notion_client.errors import RequestTimeoutError
+    breaker = CircuitBreaker("notion", failure_threshold=2)
+    for _ in range(2):
+        with pytest.raises(RequestTimeoutError):
+            await breaker.call(AsyncMock(side_effect=RequestTimeoutError()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+@pytest.mark.asyncio
+async def test_unknown_errors_leave_the_breaker_alone():
+    breaker = CircuitBreaker("notion", failure_threshold=2)
+    with pytest.raises(ConnectionError):
+        await breaker.call(AsyncMock(side_effect=ConnectionError("down")))
+    with pytest.raises(KeyError):
+        await breaker.call(AsyncMock(side_effect=KeyError("Deadline")))
+    with pytest.raises(ConnectionError):
+        await breaker.call(AsyncMock(side_effect=ConnectionError("down")))
+    assert breaker.state == CircuitBreaker.OPEN
+
+@pytest.mark.asyncio
+async def test_permanent_error_is_not_retried():
+    func = AsyncMock(side_effect=FakeAPIError(400, "validation_error"))
+    func.__name__ = "create"
+    wrapped = retry_with_backoff(retries=3, backoff_in_seconds=0)(func)
+
+    with pytest.raises(FakeAPIError):
+        await wrapped()
+
+    assert func.await_count == 1
+
+@pytest.mark.asyncio
+async def test_transient_error_is_retried():
+    func = AsyncMock(side_effect=[ConnectionError("reset"), "ok"])
+    func.__name__ = "create"
+    wrapped = retry_with_backoff(retries=3, backoff_in_seconds=0)(func)
+
+    assert await wrapped() == "ok"
+    assert func.await_count == 2
+
+@pytest.mark.asyncio
+async def test_breaker_opens_fails_fast_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("notion", failure_threshold=2, recovery_timeout=30, clock=clock)
+    failing = AsyncMock(side_effect=ConnectionError("down"))
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            await breaker.call(failing)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # Open: no call reaches the dependency
+    with pytest.raises(CircuitOpenError):
+        await breaker.call(failing)
+    assert failing.await_count == 2
+
+    # After the recovery timeout a single probe is allowed through
+    clock.now = 31
+    healthy = AsyncMock(return_value="ok")
+    assert await breaker.call(healthy) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+    stats = breaker.get_stats()
+    assert stats["transitions"] == {"closed->open": 1, "open->half_open": 1, "half_open->closed": 1}
+    assert stats["rejected_calls"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker("gemini", failure_threshold=1, recovery_timeout=10, clock=clock)
+    failing = AsyncMock(side_effect=TimeoutError())
+
+    with pytest.raises(TimeoutError):
+        await breaker.call(failing)
+    clock.now = 11
+    with pytest.raises(TimeoutError):
+        await breaker.call(failing)
+
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.retry_in() == 10
+
+@pytest.mark.asyncio
+async def test_validation_errors_do_not_trip_breaker():
+    breaker = CircuitBreaker("notion", failure_threshold=1)
+    invalid = AsyncMock(side_effect=FakeAPIError(400, "validation_error"))
+
+    with pytest.raises(FakeAPIError):
+        await breaker.call(invalid)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_releases_half_open_slot():
+    import asyncio
+    clock = FakeClock()
+    breaker = CircuitBreaker("notion", failure_threshold=1, recovery_timeout=10, clock=clock)
+    with pytest.raises(TimeoutError):
+        await breaker.call(AsyncMock(side_effect=TimeoutError()))
+    clock.now = 11
+
+    probe = asyncio.ensure_future(breaker.call(asyncio.sleep, 10))
+    await asyncio.sleep(0)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert await breaker.call(AsyncMock(return_value="ok")) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
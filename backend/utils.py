@@ -1,12 +1,222 @@
 import asyncio
 import logging
 import functools
+import random
+import time
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
-def retry_with_backoff(retries=3, backoff_in_seconds=1):
+# HTTP statuses worth retrying: timeouts, conflicts, throttling and server faults
+RETRYABLE_STATUSES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Notion error codes that can never succeed on retry (bad schema, auth, missing page...)
+PERMANENT_ERROR_CODES = {
+    "unauthorized",
+    "restricted_resource",
+    "object_not_found",
+    "invalid_json",
+    "invalid_request_url",
+    "invalid_request",
+    "validation_error",
+}
+
+# Notion error codes for transient faults; client timeouts carry no HTTP status at all
+RETRYABLE_ERROR_CODES = {
+    "notionhq_client_request_timeout",
+    "rate_limited",
+    "conflict_error",
+    "internal_server_error",
+    "service_unavailable",
+    "gateway_timeout",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit breaker is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit '{name}' is open. Failing fast (next probe in {retry_in:.0f}s).")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_retryable(error):
+    """Classifies an exception as transient (retry) or permanent (give up now)."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if getattr(error, "retry_after", None) is not None:
+        return True
+
+    # Notion errors carry a string code, Gemini errors an int code
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    if isinstance(code, str) and code in PERMANENT_ERROR_CODES:
+        return False
+    if isinstance(code, str) and code in RETRYABLE_ERROR_CODES:
+        return True
+
+    status = getattr(error, "status", None)
+    if not isinstance(status, int):
+        status = code if isinstance(code, int) else None
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError, OSError)):
+        return True
+    # Transport failures from the HTTP stacks used by notion-client and google-genai
+    module = type(error).__module__ or ""
+    if module.startswith(("httpx", "httpcore", "aiohttp")):
+        return True
+
+    # Anything else (KeyError, ValueError, TypeError...) is a bug or bad input
+    return False
+
+
+def _is_rejection(error):
+    """True when the dependency itself answered with a permanent error (it is up, the request was bad)."""
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    if isinstance(code, str) and code in PERMANENT_ERROR_CODES:
+        return True
+    status = getattr(error, "status", None)
+    if not isinstance(status, int):
+        status = code if isinstance(code, int) else None
+    return status is not None and status not in RETRYABLE_STATUSES
+
+
+class CircuitBreaker:
     """
-    Decorator to retry an async function with exponential backoff.
+    Per-dependency circuit breaker.
+    closed -> open after `failure_threshold` consecutive transient failures,
+    open -> half_open after `recovery_timeout`, half_open -> closed on a successful probe.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=5, recovery_timeout=30.0, half_open_max_calls=1, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._clock = clock
+
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+
+        # Metrics
+        self.transitions = {}
+        self.history = [] # Recent transitions, newest last
+        self.rejected_calls = 0
+        self.total_failures = 0
+
+    def _transition(self, new_state):
+        if new_state == self.state:
+            return
+        key = f"{self.state}->{new_state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.history.append({
+            "timestamp": datetime.now().isoformat(),
+            "from": self.state,
+            "to": new_state
+        })
+        self.history = self.history[-20:]
+        logger.warning(f"Circuit '{self.name}': {self.state} -> {new_state}")
+        self.state = new_state
+
+    def retry_in(self):
+        """Seconds until an open circuit lets a probe through."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.recovery_timeout - self._clock())
+
+    def allow(self):
+        """Returns True if a call may proceed right now."""
+        if self.state == self.OPEN:
+            if self.retry_in() > 0:
+                self.rejected_calls += 1
+                return False
+            self._transition(self.HALF_OPEN)
+            self._probes = 0
+
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_max_calls:
+                self.rejected_calls += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._probes = 0
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.total_failures += 1
+        self._failures += 1
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self._opened_at = self._clock()
+            self._probes = 0
+            self._transition(self.OPEN)
+
+    async def call(self, func, *args, **kwargs):
+        """Runs `func` under the breaker. Only transient errors count as failures."""
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_in())
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self.record_failure()
+            elif _is_rejection(e):
+                # The dependency answered; the request itself was bad
+                self.record_success()
+            else:
+                # Our own bug, not a verdict on the dependency
+                self.release_probe()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the dependency, but give the probe slot back
+            self.release_probe()
+            raise
+        self.record_success()
+        return result
+
+    def release_probe(self):
+        if self.state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def get_stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "total_failures": self.total_failures,
+            "rejected_calls": self.rejected_calls,
+            "retry_in_seconds": round(self.retry_in(), 1),
+            "transitions": dict(self.transitions),
+            "history": list(self.history),
+        }
+
+
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_SECONDS
+
+notion_breaker = CircuitBreaker("notion", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_SECONDS)
+gemini_breaker = CircuitBreaker("gemini", CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_SECONDS)
+
+CIRCUIT_BREAKERS = {
+    "notion": notion_breaker,
+    "gemini": gemini_breaker,
+}
+
+
+def retry_with_backoff(retries=3, backoff_in_seconds=1, breaker=None):
+    """
+    Decorator to retry an async function with jittered exponential backoff.
+    Permanent errors are raised immediately, and retries stop once `breaker` opens.
     """
     def decorator(func):
         @functools.wraps(func)
@@ -16,13 +226,46 @@ def retry_with_backoff(retries=3, backoff_in_seconds=1):
                 try:
                     return await func(*args, **kwargs)
                 except Exception as e:
+                    if not is_retryable(e):
+                        logger.error(f"Function {func.__name__} failed with a permanent error: {e}")
+                        raise e
+
                     if x == retries:
                         logger.error(f"Function {func.__name__} failed after {retries} retries. Error: {e}")
                         raise e
-                    
-                    wait = (backoff_in_seconds * 2 ** x)
-                    logger.warning(f"Function {func.__name__} failed with {e}. Retrying in {wait}s...")
+
+                    if breaker and breaker.state == CircuitBreaker.OPEN:
+                        logger.error(f"Function {func.__name__} failed and circuit '{breaker.name}' is open. Not retrying.")
+                        raise e
+
+                    # Honour the server's Retry-After when it told us how long to wait
+                    wait = getattr(e, "retry_after", None)
+                    if wait is None:
+                        base = (backoff_in_seconds * 2 ** x)
+                        wait = base / 2 + random.uniform(0, base / 2)
+                    else:
+                        wait += random.uniform(0, backoff_in_seconds / 2)
+                    logger.warning(f"Function {func.__name__} failed with {e}. Retrying in {wait:.1f}s...")
                     await asyncio.sleep(wait)
                     x += 1
         return wrapper
     return decorator
+
+
+def project_fields(entry, fields, always=("seq",)):
+    """Keeps only the requested (dotted) fields, e.g. ["sender", "evaluation.summary"]."""
+    if not fields:
+        return entry
+    out = {key: entry[key] for key in always if key in entry}
+    for path in fields:
+        parts = path.split(".")
+        value = entry
+        for part in parts:
+            value = value.get(part) if isinstance(value, dict) else None
+        if value is None:
+            continue
+        target = out
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return out